@@ -0,0 +1,236 @@
+"""
+Orden de revisión por incertidumbre (aprendizaje activo).
+
+Un clasificador lineal de scikit-learn (SGDClassifier con pérdida logística,
+sobre características estandarizadas) predice la calidad a partir de las
+características precalculadas de `image_predictions` (columnas f_*). Se
+entrena por partes con `partial_fit` en un hilo de fondo: primero con todas
+las imágenes validadas y luego con cada lote que se guarda, sin empezar de
+nuevo.
+
+Las imágenes que faltan revisar se ordenan por el margen entre las dos
+calidades más probables: primero las que el modelo menos distingue, que son
+las que más le enseñan. Las características de los candidatos se leen una
+sola vez y quedan en un arreglo, así reordenar decenas de miles de imágenes
+es un producto de matrices y un argsort (milisegundos). Las que el modelo da
+por seguras se pueden aceptar en bloque con la sugerencia precalculada.
+
+Sólo se ordenan las imágenes con características precalculadas
+(`python -m sigma precompute` o el modo de vigilancia); el resto queda
+después, en su orden original.
+"""
+import queue
+import threading
+import numpy as np
+from sqlalchemy import select
+from database import IMAGE_RECORD_CODES, ImagePrediction, VALIDATION_STATUSES, normalize_path
+from predictor import FEATURE_NAMES
+import labels
+
+TARGET_FIELD = 'quality'
+CLASSES = np.arange(1, len(labels.QUALITY) + 1)  # códigos de la BD (posición + 1)
+FEATURE_COLUMNS = [f'f_{name}' for name in FEATURE_NAMES]
+# Validadas necesarias (y al menos dos calidades distintas) antes de reordenar
+MIN_SAMPLES = 20
+INITIAL_EPOCHS = 5
+FIT_CHUNK_SIZE = 2000
+LOOKUP_CHUNK_SIZE = 500
+# Probabilidad mínima de la calidad predicha para aceptar en bloque
+ACCEPT_CONFIDENCE = 0.95
+
+VALIDATED_CODE = VALIDATION_STATUSES.index("Validated") + 1
+
+def _matrix(rows, width):
+    # None (característica sin calcular) pasa a NaN y esas filas se descartan
+    data = np.array(rows, dtype=np.float64).reshape(-1, width)
+    return data, np.isfinite(data).all(axis=1)
+
+def load_training_rows(session, paths=None):
+    """
+    (X, y) de las imágenes validadas con calidad y características
+    precalculadas; con `paths`, sólo esas imágenes.
+    """
+    records, predictions = IMAGE_RECORD_CODES, ImagePrediction.__table__
+    stmt = select(*[predictions.c[name] for name in FEATURE_COLUMNS], records.c[TARGET_FIELD]).join(
+        predictions, predictions.c.path_key == records.c.path_key).where(
+        records.c.validation_status == VALIDATED_CODE, records.c[TARGET_FIELD].isnot(None))
+    if paths is None:
+        rows = session.execute(stmt).all()
+    else:
+        keys = [normalize_path(path) for path in paths]
+        rows = []
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            rows.extend(session.execute(stmt.where(
+                records.c.path_key.in_(keys[start:start + LOOKUP_CHUNK_SIZE]))).all())
+    data, ok = _matrix(rows, len(FEATURE_COLUMNS) + 1)
+    data = data[ok]
+    return data[:, :-1], data[:, -1].astype(np.int64)
+
+def load_candidate_features(session, paths):
+    """
+    (rutas, X) de las imágenes de `paths` con características precalculadas;
+    las rutas se devuelven como vinieron en `paths`.
+    """
+    table = ImagePrediction.__table__
+    columns = [table.c[name] for name in FEATURE_COLUMNS]
+    by_key = {normalize_path(path): path for path in paths}
+    keys = list(by_key)
+    found = []
+    rows = []
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        stmt = select(table.c.path_key, *columns).where(
+            table.c.path_key.in_(keys[start:start + LOOKUP_CHUNK_SIZE]))
+        for row in session.execute(stmt):
+            found.append(by_key[row[0]])
+            rows.append(row[1:])
+    data, ok = _matrix(rows, len(FEATURE_COLUMNS))
+    return [path for path, keep in zip(found, ok) if keep], data[ok]
+
+class QualityModel:
+    """StandardScaler + SGDClassifier (regresión logística) entrenados por partes."""
+    def __init__(self, seed=0):
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.preprocessing import StandardScaler
+
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=seed)
+        self.samples = 0
+        self._classes_seen = set()
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def ready(self):
+        return self.samples >= MIN_SAMPLES and len(self._classes_seen) >= 2
+
+    def _expand(self, X):
+        # Con los cuadrados, el modelo lineal puede aislar una franja intermedia
+        # (p. ej. 'Grado B' entre una nitidez baja y una alta)
+        scaled = self.scaler.transform(X)
+        return np.hstack([scaled, scaled * scaled])
+
+    def partial_fit(self, X, y, epochs=1):
+        if not len(X):
+            return
+        self.scaler.partial_fit(X)
+        scaled = self._expand(X)
+        for _ in range(epochs):
+            order = self._rng.permutation(len(scaled))
+            for start in range(0, len(order), FIT_CHUNK_SIZE):
+                part = order[start:start + FIT_CHUNK_SIZE]
+                self.classifier.partial_fit(scaled[part], y[part], classes=CLASSES)
+        self.samples += len(X)
+        self._classes_seen.update(np.unique(y).tolist())
+
+    def predict_proba(self, X):
+        return self.classifier.predict_proba(self._expand(X))
+
+def rank_by_uncertainty(proba):
+    """
+    Devuelve (orden, confianza, códigos): los índices de menor a mayor margen
+    entre las dos clases más probables, la probabilidad de la clase predicha y
+    su código.
+    """
+    top2 = np.partition(proba, -2, axis=1)[:, -2:]
+    margin = top2[:, 1] - top2[:, 0]
+    return np.argsort(margin, kind='stable'), proba.max(axis=1), CLASSES[proba.argmax(axis=1)]
+
+class Ranking:
+    """Candidatos de la más incierta a la más segura, con la calidad predicha de cada una."""
+    def __init__(self, paths, proba, samples):
+        order, confidence, codes = rank_by_uncertainty(proba)
+        self.paths = [paths[i] for i in order.tolist()]
+        self.position = {path: i for i, path in enumerate(self.paths)}
+        self.samples = samples  # imágenes con las que se entrenó el modelo
+        self._confidence = confidence[order]
+        self._codes = codes[order]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def confident(self, threshold=ACCEPT_CONFIDENCE):
+        """Tríos (ruta, calidad, probabilidad) con probabilidad >= `threshold`."""
+        picks = np.flatnonzero(self._confidence >= threshold).tolist()
+        return [(self.paths[i], labels.QUALITY[self._codes[i] - 1], float(self._confidence[i]))
+                for i in picks]
+
+class ActiveLearner:
+    """
+    Entrena el modelo y reordena los candidatos en un hilo de fondo. La GUI
+    le pasa los candidatos y las imágenes recién guardadas y recoge de
+    `results` cada nuevo `Ranking` (o None mientras no haya datos suficientes).
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.results = queue.Queue()
+        self.model = None
+        self._requests = queue.Queue()
+        self._paths = []
+        self._features = np.empty((0, len(FEATURE_COLUMNS)))
+        self._thread = threading.Thread(target=self._run, name="active-learning", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._requests.put(None)
+
+    def set_candidates(self, paths):
+        """Reemplaza las imágenes a ordenar (p. ej. al abrir otra carpeta)."""
+        self._requests.put(('candidates', list(paths)))
+
+    def add_candidates(self, paths):
+        self._requests.put(('add', list(paths)))
+
+    def learn(self, saved_paths):
+        """Ajusta el modelo con imágenes recién validadas y vuelve a ordenar."""
+        self._requests.put(('learn', list(saved_paths)))
+
+    def rank(self):
+        """Ranking de los candidatos actuales, o None si el modelo aún no está listo."""
+        if self.model is None or not self.model.ready or not self._paths:
+            return None
+        return Ranking(self._paths, self.model.predict_proba(self._features), self.model.samples)
+
+    def _run(self):
+        try:
+            self.model = QualityModel()
+            session = self.session_factory()
+            try:
+                X, y = load_training_rows(session)
+            finally:
+                session.close()
+            self.model.partial_fit(X, y, INITIAL_EPOCHS)
+        except Exception as e:
+            print(f"Error entrenando el modelo de prioridad: {e}")
+            return
+
+        while True:
+            requests = [self._requests.get()]
+            # Atender juntas las solicitudes acumuladas y ordenar una sola vez
+            while not self._requests.empty():
+                requests.append(self._requests.get_nowait())
+            try:
+                for request in requests:
+                    if request is None:
+                        return
+                    self._handle(*request)
+                self.results.put(self.rank())
+            except Exception as e:
+                print(f"Error ordenando imágenes por incertidumbre: {e}")
+
+    def _handle(self, kind, paths):
+        session = self.session_factory()
+        try:
+            if kind == 'learn':
+                X, y = load_training_rows(session, paths)
+                self.model.partial_fit(X, y)
+                return
+            found, features = load_candidate_features(session, paths)
+        finally:
+            session.close()
+        if kind == 'candidates':
+            self._paths, self._features = found, features
+        else:
+            self._paths = self._paths + found
+            self._features = np.vstack([self._features, features])
@@ -0,0 +1,255 @@
+"""
+Almacén compacto de las clasificaciones pendientes (aún no guardadas en la BD).
+
+En lugar de un diccionario de 11 cadenas por imagen, cada campo categórico es
+una columna `array('B')` con el código de la etiqueta (posición + 1 en su
+vocabulario, 0 = vacío; los mismos códigos que guarda LabelCode en la BD), los
+artefactos una máscara de bits y las notas un diccionario disperso (la mayoría
+de las imágenes no tiene). Las rutas se guardan una sola vez en una tabla y se
+identifican por su índice, con lectura y escritura O(1) por índice.
+
+Las filas para la BD se arman por columnas con los códigos ya calculados y se
+insertan sobre `database.IMAGE_RECORD_CODES`, sin volver a traducir texto;
+`to_arrays()` entrega las columnas como arreglos NumPy para exportar.
+NumPy sólo se importa ahí, para no retrasar el arranque de la GUI.
+"""
+import os
+from array import array
+import labels
+
+FIELDS = list(labels.FIELD_VOCABULARIES)
+
+_VOCABULARIES = [labels.FIELD_VOCABULARIES[name] for name in FIELDS]
+_CODES = [{value: i + 1 for i, value in enumerate(vocabulary)} for vocabulary in _VOCABULARIES]
+
+def _encode(field, value):
+    if not value:
+        return 0
+    try:
+        return _CODES[field][value]
+    except KeyError:
+        raise ValueError(f"Valor fuera del vocabulario: {value!r}") from None
+
+def move_unknown_to_notes(data):
+    """
+    Copia de los datos del formulario con los valores fuera de vocabulario (p. ej.
+    de un diario escrito por una versión anterior) movidos a las notas, como hace
+    `database.migrate_schema` con las filas antiguas. Devuelve (datos, movidos).
+    """
+    clean = {}
+    lost = []
+    for name in FIELDS:
+        value = data.get(name) or ""
+        if value and value not in labels.FIELD_VOCABULARIES[name]:
+            lost.append(f"{name}={value}")
+            value = ""
+        clean[name] = value
+    names = [a for a in (data.get('artifacts') or "").split(',') if a]
+    clean['artifacts'] = ",".join(a for a in names if a in labels.ARTIFACTS)
+    lost.extend(f"artifacts={a}" for a in names if a not in labels.ARTIFACTS)
+    notes = data.get('doctor_notes') or ""
+    if lost:
+        note = "[Valores anteriores: " + "; ".join(lost) + "]"
+        notes = f"{notes} {note}".strip() if notes else note
+    clean['doctor_notes'] = notes
+    return clean, lost
+
+class AnnotationStore:
+    """
+    Clasificaciones pendientes por imagen. `get(i)`/`set(i, data)` usan el
+    índice de la ruta (ver `intern`); `get_path`/`set_path` la ruta directamente.
+    Los datos entran y salen como el diccionario del formulario de la GUI.
+    """
+    def __init__(self):
+        self._paths = []   # índice -> ruta
+        self._index = {}   # ruta -> índice
+        self._codes = [array('B') for _ in FIELDS]
+        self._artifacts = array('B')
+        # Versión de la última edición de cada imagen; 0 = sin cambios pendientes
+        self._versions = array('Q')
+        self._notes = {}
+        self._clock = 0
+        self._pending = 0
+
+    @classmethod
+    def from_items(cls, items):
+        """Crea un almacén a partir de pares (ruta, datos del formulario)."""
+        store = cls()
+        for file_path, data in items:
+            store.set_path(file_path, data)
+        return store
+
+    def __len__(self):
+        """Cantidad de imágenes con cambios pendientes."""
+        return self._pending
+
+    def __contains__(self, file_path):
+        index = self._index.get(file_path)
+        return index is not None and self._versions[index] != 0
+
+    def intern(self, file_path):
+        """Índice de `file_path`, agregándola a la tabla de rutas si es nueva."""
+        index = self._index.get(file_path)
+        if index is None:
+            index = self._index[file_path] = len(self._paths)
+            self._paths.append(file_path)
+            for column in self._codes:
+                column.append(0)
+            self._artifacts.append(0)
+            self._versions.append(0)
+        return index
+
+    def path(self, index):
+        return self._paths[index]
+
+    def get(self, index):
+        """Datos del formulario de la imagen `index`, o None si no tiene cambios pendientes."""
+        if not self._versions[index]:
+            return None
+        data = {}
+        for field, (name, column) in enumerate(zip(FIELDS, self._codes)):
+            code = column[index]
+            data[name] = _VOCABULARIES[field][code - 1] if code else ""
+        data['artifacts'] = labels.mask_to_artifacts(self._artifacts[index])
+        data['doctor_notes'] = self._notes.get(index, "")
+        return data
+
+    def set(self, index, data):
+        """
+        Guarda los datos del formulario para la imagen `index`.
+        Devuelve False si eran iguales a los ya pendientes.
+        """
+        codes = [_encode(field, data[name]) for field, name in enumerate(FIELDS)]
+        mask = labels.artifacts_to_mask(data['artifacts'])
+        notes = data['doctor_notes']
+        if (self._versions[index]
+                and all(column[index] == code for column, code in zip(self._codes, codes))
+                and self._artifacts[index] == mask and self._notes.get(index, "") == notes):
+            return False
+        for column, code in zip(self._codes, codes):
+            column[index] = code
+        self._artifacts[index] = mask
+        if notes:
+            self._notes[index] = notes
+        else:
+            self._notes.pop(index, None)
+        if not self._versions[index]:
+            self._pending += 1
+        self._clock += 1
+        self._versions[index] = self._clock
+        return True
+
+    def discard(self, index):
+        """Quita los cambios pendientes de la imagen `index` (la ruta sigue en la tabla)."""
+        if self._versions[index]:
+            self._versions[index] = 0
+            self._notes.pop(index, None)
+            self._pending -= 1
+
+    def get_path(self, file_path):
+        index = self._index.get(file_path)
+        return None if index is None else self.get(index)
+
+    def set_path(self, file_path, data):
+        return self.set(self.intern(file_path), data)
+
+    def update(self, changes):
+        """Agrega un diccionario {ruta: datos}."""
+        for file_path, data in changes.items():
+            self.set_path(file_path, data)
+
+    def restore(self, changes):
+        """
+        Agrega la sesión recuperada del diario. Los valores que ya no están en
+        el vocabulario pasan a las notas y una entrada ilegible se descarta con
+        un aviso. Devuelve (imágenes recuperadas, imágenes con valores movidos).
+        """
+        restored = moved = 0
+        for file_path, data in changes.items():
+            try:
+                clean, lost = move_unknown_to_notes(data)
+                self.set_path(file_path, clean)
+            except Exception as e:
+                print(f"Error recuperando {file_path} del diario: {e}")
+                continue
+            restored += 1
+            moved += bool(lost)
+        return restored, moved
+
+    def pending_indices(self):
+        """Índices con cambios pendientes, en orden de la tabla de rutas."""
+        return [i for i, version in enumerate(self._versions) if version]
+
+    def items(self):
+        """Pares (ruta, datos) pendientes; lo usa el diario al compactarse."""
+        for index in self.pending_indices():
+            yield self._paths[index], self.get(index)
+
+    def value(self, index, field):
+        """Etiqueta de un campo categórico de la imagen `index` (texto)."""
+        position = FIELDS.index(field)
+        code = self._codes[position][index]
+        return _VOCABULARIES[position][code - 1] if code else ""
+
+    def snapshot(self):
+        """
+        Copia compacta (sólo imágenes pendientes) para guardar en segundo plano
+        mientras se sigue etiquetando; conserva las versiones para `discard_saved`.
+        """
+        copy = AnnotationStore()
+        indices = self.pending_indices()
+        copy._paths = [self._paths[i] for i in indices]
+        copy._index = {path: i for i, path in enumerate(copy._paths)}
+        copy._codes = [array('B', [column[i] for i in indices]) for column in self._codes]
+        copy._artifacts = array('B', [self._artifacts[i] for i in indices])
+        copy._versions = array('Q', [self._versions[i] for i in indices])
+        copy._notes = {new: self._notes[old] for new, old in enumerate(indices) if old in self._notes}
+        copy._clock = self._clock
+        copy._pending = len(indices)
+        return copy
+
+    def discard_saved(self, snapshot, saved_paths):
+        """Quita las imágenes guardadas desde `snapshot` que no se volvieron a editar desde entonces."""
+        for file_path in saved_paths:
+            index = self._index.get(file_path)
+            old = snapshot._index.get(file_path)
+            if index is not None and old is not None and self._versions[index] == snapshot._versions[old]:
+                self.discard(index)
+
+    def record_rows(self, indices):
+        """
+        Filas para `database.IMAGE_RECORD_CODES` (etiquetas como códigos enteros,
+        NULL si están vacías), armadas por columnas.
+        """
+        from database import COPY_STATUSES, VALIDATION_STATUSES, normalize_path
+        paths = [self._paths[i] for i in indices]
+        columns = {
+            'filename': [os.path.basename(p) for p in paths],
+            'original_path': paths,
+            'path_key': [normalize_path(p) for p in paths],
+        }
+        for name, column in zip(FIELDS, self._codes):
+            columns[name] = [column[i] or None for i in indices]
+        columns['artifacts'] = [self._artifacts[i] for i in indices]
+        columns['doctor_notes'] = [self._notes.get(i, "") for i in indices]
+        columns['validation_status'] = [VALIDATION_STATUSES.index("Validated") + 1] * len(indices)
+        columns['copy_status'] = [COPY_STATUSES.index("Pending") + 1] * len(indices)
+        keys = list(columns)
+        return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+    def to_arrays(self):
+        """
+        Columnas de las imágenes pendientes como arreglos NumPy: códigos uint8
+        por campo (0 = vacío, categorías en `<campo>__categories`),
+        `artifacts_mask`, rutas y notas.
+        """
+        import numpy as np
+        indices = np.asarray(self.pending_indices(), dtype=np.intp)
+        arrays = {'original_path': np.array([self._paths[i] for i in indices], dtype=str)}
+        for name, vocabulary, column in zip(FIELDS, _VOCABULARIES, self._codes):
+            arrays[name] = np.frombuffer(column, dtype=np.uint8)[indices]
+            arrays[f"{name}__categories"] = np.array([""] + list(vocabulary), dtype=str)
+        arrays['artifacts_mask'] = np.frombuffer(self._artifacts, dtype=np.uint8)[indices]
+        arrays['artifacts__categories'] = np.array(labels.ARTIFACTS, dtype=str)
+        arrays['doctor_notes'] = np.array([self._notes.get(i, "") for i in indices.tolist()], dtype=object)
+        return arrays
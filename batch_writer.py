@@ -0,0 +1,179 @@
+"""
+Guardado por lotes de las clasificaciones en la base de datos.
+
+Las filas salen del `AnnotationStore` con las etiquetas ya codificadas y se
+insertan con SQLAlchemy Core (`executemany`) en bloques de tamaño
+configurable, cada uno con su propio commit, desde un hilo de fondo.
+Volver a guardar una imagen ya registrada actualiza su fila (upsert por ruta).
+Un bloque que choca con otra estación (interbloqueo) se reintenta; otro
+error sólo descarta el bloque afectado y el proceso se puede cancelar.
+Las copias a Clasificadas/ se delegan al `CopyEngine`, en paralelo; si la
+imagen ya estaba clasificada, sólo se mueve su enlace (ver blobstore.py).
+Cancelar durante las copias descarta las que no empezaron: quedan
+pendientes en la base para `python copy_engine.py retry`.
+"""
+import queue
+import threading
+import time
+from annotations import AnnotationStore
+from database import IMAGE_RECORD_CODES, is_retryable_error, upsert_rows
+from copy_engine import CopyEngine, CopyStatusRecorder, previous_copies
+import perf
+import stats
+
+DEFAULT_CHUNK_SIZE = 500
+CONFLICT_RETRIES = 3
+CONFLICT_BACKOFF = 0.2  # segundos, se duplica en cada intento
+CANCEL_POLL_SECONDS = 0.2
+
+class BatchResult:
+    """Resumen de un guardado por lotes."""
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.copied = 0
+        self.copy_failed = 0
+        self.copy_cancelled = 0
+        self.cancelled = False
+        self.saved_paths = []
+        self.errors = []
+
+class BatchWriter:
+    """
+    Inserta las clasificaciones pendientes en bloques desde un hilo de fondo.
+    El progreso se publica en `self.progress` como tuplas (etapa, procesadas, total)
+    para que la GUI lo lea desde el hilo de Tk.
+    """
+    def __init__(self, session_factory, annotations, base_dir, chunk_size=DEFAULT_CHUNK_SIZE, copy_files=True):
+        self.session_factory = session_factory
+        if not isinstance(annotations, AnnotationStore):
+            annotations = AnnotationStore.from_items(annotations)  # pares (ruta, datos)
+        self.annotations = annotations
+        self.indices = annotations.pending_indices()
+        self.base_dir = base_dir
+        self.chunk_size = chunk_size
+        self.copy_files = copy_files
+        self.result = BatchResult()
+        self.progress = queue.Queue()
+        self.finished = threading.Event()
+        self._cancel = threading.Event()
+        self._copy_phase = False
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+
+    @property
+    def total(self):
+        return len(self.indices)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Pide detener el guardado; el bloque y las copias en curso se completan."""
+        self._cancel.set()
+
+    def run(self):
+        """Ejecuta el guardado en el hilo actual (uso sin interfaz gráfica)."""
+        self._run()
+        return self.result
+
+    def _run(self):
+        annotations = self.annotations
+        recorder = CopyStatusRecorder(self.session_factory)
+        copier = CopyEngine(self.base_dir, on_result=self._on_copy(recorder)) if self.copy_files else None
+        batch = copier.new_batch() if copier is not None else None
+        done = 0
+        db_started = time.perf_counter()
+        try:
+            for start in range(0, len(self.indices), self.chunk_size):
+                if self._cancel.is_set():
+                    self.result.cancelled = True
+                    break
+                chunk = self.indices[start:start + self.chunk_size]
+                rows = annotations.record_rows(chunk)
+
+                try:
+                    with perf.timer('batch.db_chunk'):
+                        previous = self._write_chunk(rows, copier is not None)
+                    perf.count('batch.rows', len(rows))
+                except Exception as e:
+                    self.result.failed += len(chunk)
+                    self.result.errors.append(str(e))
+                    print(f"Error guardando bloque {start}-{start + len(chunk)}: {e}")
+                else:
+                    self.result.inserted += len(chunk)
+                    self.result.saved_paths.extend(row['original_path'] for row in rows)
+                    if copier is not None:
+                        for index, row in zip(chunk, rows):
+                            copier.submit(annotations.path(index), annotations.value(index, 'quality'),
+                                          previous.get(row['path_key']), batch)
+
+                done += len(chunk)
+                self.progress.put(("Guardando", done, len(self.indices)))
+
+            perf.record('batch.db_phase', time.perf_counter() - db_started)
+            if copier is not None:
+                self._copy_phase = True
+                self.progress.put(("Copiando", self.result.copied + self.result.copy_failed, self.result.inserted))
+                self._wait_copies(batch)
+        finally:
+            if copier is not None:
+                copier.shutdown()
+            recorder.flush()
+            self.finished.set()
+
+    def _wait_copies(self, batch):
+        """Espera las copias del lote; si se cancela, descarta las que no empezaron."""
+        while not batch.wait(CANCEL_POLL_SECONDS):
+            if self._cancel.is_set():
+                batch.cancel()
+                batch.wait()
+                break
+        self.result.copy_cancelled = batch.cancelled
+        if batch.cancelled:
+            self.result.cancelled = True
+
+    def _write_chunk(self, rows, with_copies):
+        """
+        Guarda un bloque en una transacción y devuelve las copias anteriores de
+        sus imágenes. Si choca con otra estación, lo reintenta con espera creciente.
+        """
+        # Bloquear las filas siempre en el mismo orden (ver stats.apply_deltas)
+        ordered = sorted(rows, key=lambda row: row['path_key'])
+        attempts = 0
+        while True:
+            attempts += 1
+            session = self.session_factory()
+            try:
+                # El resumen de estadísticas se actualiza en la misma transacción
+                stats.record_batch(session, ordered)
+                previous = previous_copies(session, [row['path_key'] for row in ordered]) if with_copies else {}
+                upsert_rows(session, IMAGE_RECORD_CODES, ordered, ['path_key'])
+                session.commit()
+                return previous
+            except Exception as e:
+                session.rollback()
+                if attempts > CONFLICT_RETRIES or not is_retryable_error(e):
+                    raise
+                perf.count('batch.conflict_retries')
+                print(f"Conflicto con otra estación guardando un bloque; reintento {attempts}/{CONFLICT_RETRIES}")
+                time.sleep(CONFLICT_BACKOFF * (2 ** (attempts - 1)))
+            finally:
+                session.close()
+
+    def _on_copy(self, recorder):
+        """Cuenta y registra cada copia terminada (se llama desde los hilos de copia)."""
+        lock = threading.Lock()
+
+        def on_result(result):
+            recorder(result)
+            with lock:
+                if result.ok:
+                    self.result.copied += 1
+                else:
+                    self.result.copy_failed += 1
+                copies = self.result.copied + self.result.copy_failed
+            # Durante la inserción la barra muestra los bloques; luego, las copias
+            if self._copy_phase:
+                self.progress.put(("Copiando", copies, self.result.inserted))
+        return on_result
@@ -0,0 +1,99 @@
+"""
+Benchmark de la decodificación DICOM para visualización.
+
+Compara la normalización original (matrices float64 a resolución completa)
+con el pipeline actual de `utils` (reducción previa + LUT de ventana/nivel).
+Cada variante se ejecuta en un subproceso aparte para medir su pico de RSS.
+
+Uso:
+    python benchmarks/bench_dicom_decode.py [--rows 3000] [--cols 4000] [--repeat 5]
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import write_synthetic_dicom
+
+def legacy_decode(file_path, max_size=(500, 500)):
+    """Copia de la implementación original de `load_image_for_display` para DICOM."""
+    import numpy as np
+    import pydicom
+    from PIL import Image
+
+    ds = pydicom.dcmread(file_path)
+    pixel_array = ds.pixel_array
+    pixel_array = pixel_array - np.min(pixel_array)
+    pixel_array = pixel_array / np.max(pixel_array)
+    pixel_array = (pixel_array * 255).astype(np.uint8)
+    image = Image.fromarray(pixel_array)
+    image.thumbnail(max_size)
+    return image
+
+def current_decode(file_path, max_size=(500, 500)):
+    from utils import decode_image_for_display
+    return decode_image_for_display(file_path, max_size)
+
+def run_variant(variant, file_path, repeat):
+    """Ejecuta una variante dentro de este proceso e imprime sus métricas en JSON."""
+    import resource
+    # Cargar los módulos antes de medir la línea base: sólo cuenta la decodificación
+    for module in ("numpy", "pydicom", "utils"):
+        importlib.import_module(module)
+
+    func = legacy_decode if variant == "legacy" else current_decode
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(file_path)
+        timings.append(time.perf_counter() - start)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings.sort()
+    print(json.dumps({
+        "variant": variant,
+        "median_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "min_ms": round(timings[0] * 1000, 2),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_rss_delta_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--cols", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--variant", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.file, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "synthetic.dcm")
+        write_synthetic_dicom(file_path, args.rows, args.cols)
+        results = []
+        for variant in ("legacy", "current"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--variant", variant,
+                 "--file", file_path, "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"DICOM {args.rows}x{args.cols} 16-bit, {args.repeat} repeticiones")
+    for r in results:
+        print(f"  {r['variant']:8s} mediana {r['median_ms']:8.1f} ms   "
+              f"pico RSS {r['peak_rss_mb']:7.1f} MB (+{r['peak_rss_delta_mb']} MB)")
+
+if __name__ == "__main__":
+    main()
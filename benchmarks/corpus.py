@@ -0,0 +1,153 @@
+"""
+Generador de un corpus sintético de imágenes oftalmológicas para los benchmarks.
+
+Escribe, con pydicom y Pillow:
+  - retinografías JPEG del tamaño de una cámara de fondo de ojo
+    (campo circular sobre negro, papila brillante, vasos)
+  - DICOM monocromos de 12 y 16 bits sin comprimir
+  - volúmenes OCT DICOM multi-frame (B-scans de 16 bits)
+
+Los archivos son deterministas (semilla fija), de modo que los resultados
+de distintos commits son comparables.
+
+Uso:
+    python benchmarks/corpus.py <carpeta> [--jpegs 20] [--dicoms 10] [--octs 2]
+"""
+import argparse
+import os
+
+FUNDUS_SIZE = (2048, 1536)
+DICOM_SIZE = (2000, 2000)
+OCT_SHAPE = (64, 496, 512)  # frames, filas, columnas
+
+def _dicom_dataset(rows, cols, bits, frames=None, modality="OP"):
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid, SecondaryCaptureImageStorage
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = modality
+    ds.Rows = rows
+    ds.Columns = cols
+    if frames is not None:
+        ds.NumberOfFrames = frames
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    ds.WindowCenter = (1 << bits) // 2
+    ds.WindowWidth = (1 << bits) // 2
+    return ds
+
+def write_synthetic_dicom(path, rows, cols, bits=16, seed=0):
+    """Escribe un DICOM monocromo sin comprimir con un degradado y ruido."""
+    import numpy as np
+
+    ds = _dicom_dataset(rows, cols, bits)
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, (1 << bits) - 1, cols, dtype=np.float32)
+    pixels = (gradient[None, :] + rng.normal(0, (1 << bits) / 300, (rows, cols))).clip(0, (1 << bits) - 1)
+    ds.PixelData = pixels.astype(np.uint16).tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+def write_oct_volume(path, frames, rows, cols, bits=16, seed=0):
+    """Escribe un volumen OCT multi-frame: capas retinianas horizontales con ruido speckle."""
+    import numpy as np
+
+    ds = _dicom_dataset(rows, cols, bits, frames=frames, modality="OPT")
+    rng = np.random.default_rng(seed)
+    depth = np.arange(rows, dtype=np.float32)[:, None]
+    top = (1 << bits) - 1
+    volume = np.empty((frames, rows, cols), dtype=np.uint16)
+    for i in range(frames):
+        # Retina curvada: la superficie baja hacia los bordes y se desplaza entre B-scans
+        surface = rows * 0.35 + 30 * np.cos(np.linspace(-1.5, 1.5, cols, dtype=np.float32)) + i * 0.3
+        layers = np.exp(-((depth - surface[None, :]) / 25.0) ** 2) * 0.8 \
+            + np.exp(-((depth - surface[None, :] - 60) / 8.0) ** 2) * 0.6
+        speckle = rng.rayleigh(0.15, (rows, cols)).astype(np.float32)
+        volume[i] = (np.clip(layers + speckle, 0, 1) * top).astype(np.uint16)
+    ds.PixelData = volume.tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+def write_fundus_jpeg(path, size=FUNDUS_SIZE, seed=0, quality=92):
+    """Escribe una retinografía sintética en JPEG."""
+    import numpy as np
+    from PIL import Image
+
+    width, height = size
+    rng = np.random.default_rng(seed)
+    ys, xs = np.ogrid[:height, :width]
+    cx = width / 2 + rng.uniform(-0.05, 0.05) * width
+    cy = height / 2 + rng.uniform(-0.05, 0.05) * height
+    radius = min(width, height) * 0.46
+    dist = np.sqrt((xs - cx) ** 2 + (ys - cy) ** 2) / radius
+
+    # Fondo anaranjado con viñeteado
+    base = np.clip(1.0 - 0.45 * dist ** 2, 0, 1).astype(np.float32)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[..., 0] = 200 * base
+    image[..., 1] = 90 * base
+    image[..., 2] = 40 * base
+
+    # Papila a un lado (lateralidad aleatoria) y vasos que salen de ella
+    side = 1 if rng.random() < 0.5 else -1
+    dx, dy = cx + side * radius * 0.45, cy
+    disc = np.exp(-(((xs - dx) ** 2 + (ys - dy) ** 2) / (radius * 0.09) ** 2)).astype(np.float32)
+    image += disc[..., None] * np.array([55, 120, 90], dtype=np.float32)
+    angle = np.arctan2(ys - dy, xs - dx)
+    vessels = (np.abs(np.sin(angle * 7 + rng.uniform(0, np.pi))) < 0.03) & (dist < 0.95)
+    image[vessels] *= 0.55
+
+    image += rng.normal(0, 4, image.shape[:2])[..., None]
+    image[dist > 1.0] = 0
+    Image.fromarray(image.clip(0, 255).astype(np.uint8)).save(path, quality=quality)
+
+def generate_corpus(directory, jpegs=20, dicoms=10, octs=2, fundus_size=FUNDUS_SIZE,
+                    dicom_size=DICOM_SIZE, oct_shape=OCT_SHAPE):
+    """
+    Genera el corpus en `directory` (los archivos existentes se reutilizan).
+    Los DICOM alternan 12 y 16 bits. Devuelve {'jpeg': [...], 'dicom12': [...],
+    'dicom16': [...], 'oct': [...]} con las rutas.
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = {'jpeg': [], 'dicom12': [], 'dicom16': [], 'oct': []}
+    for i in range(jpegs):
+        path = os.path.join(directory, f"fundus_{i:05d}.jpg")
+        if not os.path.exists(path):
+            write_fundus_jpeg(path, fundus_size, seed=i)
+        corpus['jpeg'].append(path)
+    for i in range(dicoms):
+        bits = 12 if i % 2 == 0 else 16
+        path = os.path.join(directory, f"dicom{bits}_{i:05d}.dcm")
+        if not os.path.exists(path):
+            write_synthetic_dicom(path, dicom_size[0], dicom_size[1], bits, seed=i)
+        corpus[f'dicom{bits}'].append(path)
+    for i in range(octs):
+        path = os.path.join(directory, f"oct_{i:05d}.dcm")
+        if not os.path.exists(path):
+            write_oct_volume(path, *oct_shape, seed=i)
+        corpus['oct'].append(path)
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--jpegs", type=int, default=20)
+    parser.add_argument("--dicoms", type=int, default=10)
+    parser.add_argument("--octs", type=int, default=2)
+    args = parser.parse_args()
+    corpus = generate_corpus(args.directory, args.jpegs, args.dicoms, args.octs)
+    print(f"✅ Corpus generado en {args.directory}: "
+          + ", ".join(f"{len(paths)} {kind}" for kind, paths in corpus.items()))
+
+if __name__ == "__main__":
+    main()
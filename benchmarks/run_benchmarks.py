@@ -0,0 +1,371 @@
+"""
+Suite de benchmarks de rendimiento (sin interfaz gráfica).
+
+Mide tiempo (mediana, p95, mínimo) y memoria pico de:
+  - decode[jpeg|dicom12|dicom16|oct]: `utils.load_image_for_display` sobre el
+    corpus sintético, sin caché de miniaturas. Sin pantalla (no se puede crear
+    una ventana de Tk) se mide `decode_image_for_display`, que es todo el
+    trabajo salvo la conversión a PhotoImage.
+  - scan: escaneo de carpeta como en `load_folder` (FolderScanner, recursivo,
+    con detección de DICOM sin extensión)
+  - persist[N]: guardado por lotes de `process_batch` (BatchWriter.run) de N
+    imágenes en una BD SQLite nueva, sin copias
+  - persist_copy[100]: lo mismo incluyendo las copias a Clasificadas/
+  - export_csv: `export_data.export_csv` de una BD con 10k registros
+  - rerank[50000]: reordenar 50k imágenes por incertidumbre con el modelo de
+    `active_learning` ya entrenado (objetivo: muy por debajo de 1 s)
+  - startup: desde que se lanza el intérprete hasta que la ventana de
+    `main.build_app()` está dibujada (objetivo: 300 ms). Sin pantalla se mide
+    hasta el intento de crear la ventana (importaciones incluidas).
+
+Cada benchmark se ejecuta en un subproceso propio para aislar la memoria
+(pico de RSS y pico de asignaciones de tracemalloc). El resultado se guarda
+en JSON (por defecto benchmarks/results/<commit>.json) y se puede comparar
+con el de otro commit:
+
+    python benchmarks/run_benchmarks.py [--quick] [--only scan] [--compare results/abc1234.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "sigma_bench_corpus")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+PERSIST_SIZES = (100, 1000, 10000)
+SCAN_FILES = 10000
+EXPORT_ROWS = 10000
+RERANK_CANDIDATES = 50000
+RERANK_TARGET_MS = 1000
+STARTUP_TARGET_MS = 300
+
+# Proceso hijo del benchmark de arranque: avisa en cuanto la ventana está dibujada
+STARTUP_SCRIPT = """
+import os, sys
+sys.path.insert(0, {root!r})
+import tkinter as tk
+import main
+try:
+    root, app = main.build_app()
+    root.update()
+    print("ventana", flush=True)
+except tk.TclError:
+    print("sin-pantalla", flush=True)
+os._exit(0)
+"""
+
+def sample_labels():
+    """Una clasificación válida (primer valor de cada vocabulario)."""
+    import labels
+    data = {field: vocabulary[0] for field, vocabulary in labels.FIELD_VOCABULARIES.items()}
+    data.update(artifacts=labels.ARTIFACTS[0], doctor_notes="")
+    return data
+
+def measure(func, repeat=5, setup=None):
+    """
+    Ejecuta `func(setup())` `repeat` veces midiendo el tiempo (la preparación
+    queda fuera de la medición) y una vez más bajo tracemalloc para el pico
+    de memoria asignada. Devuelve un dict de métricas.
+    """
+    import resource
+
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    func(arg)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'median_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        'min_ms': round(timings[0] * 1000, 3),
+        'peak_alloc_mb': round(peak / 2 ** 20, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def _display_loader():
+    """Devuelve (nombre, función): load_image_for_display si hay pantalla, si no el decodificador."""
+    import utils
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return 'load_image_for_display', utils.load_image_for_display
+    except Exception:
+        return 'decode_image_for_display', utils.decode_image_for_display
+
+def bench_decode(kind, corpus_dir, repeat):
+    from corpus import generate_corpus
+    import utils
+
+    paths = generate_corpus(corpus_dir)[kind]
+    utils.set_thumbnail_store(None)
+    name, loader = _display_loader()
+
+    def run(_arg):
+        for path in paths:
+            loader(path)
+    result = measure(run, repeat)
+    result['function'] = name
+    result['images'] = len(paths)
+    result['per_image_ms'] = round(result['median_ms'] / len(paths), 3)
+    return result
+
+def _make_scan_tree(directory, files):
+    """Árbol de `files` archivos pequeños en subcarpetas; 1 de cada 10 es un DICOM sin extensión."""
+    marker = os.path.join(directory, ".complete")
+    if os.path.exists(marker):
+        return
+    dicom_header = b"\0" * 128 + b"DICM"
+    for i in range(files):
+        folder = os.path.join(directory, f"paciente_{i // 200:03d}")
+        os.makedirs(folder, exist_ok=True)
+        if i % 10 == 0:
+            with open(os.path.join(folder, f"{i}"), 'wb') as f:
+                f.write(dicom_header)
+        else:
+            with open(os.path.join(folder, f"img_{i}.jpg"), 'wb') as f:
+                f.write(b"\xff\xd8\xff")
+    open(marker, 'w').close()
+
+def bench_scan(corpus_dir, repeat, files=SCAN_FILES):
+    from scanner import FolderScanner
+
+    tree = os.path.join(corpus_dir, f"scan_{files}")
+    _make_scan_tree(tree, files)
+    first_batch = []
+
+    def run(_arg):
+        scanner = FolderScanner(tree, recursive=True).start()
+        started = time.perf_counter()
+        found = 0
+        while True:
+            done = scanner.is_done()
+            paths, _validated = scanner.drain()
+            if paths and not found:
+                first_batch.append(time.perf_counter() - started)
+            found += len(paths)
+            if done:
+                break
+            time.sleep(0.001)
+        assert found == files, f"se esperaban {files} archivos, se encontraron {found}"
+    result = measure(run, repeat)
+    first_batch.sort()
+    result['files'] = files
+    result['first_batch_ms'] = round(first_batch[len(first_batch) // 2] * 1000, 3)
+    return result
+
+def _fresh_db(tmp):
+    from database import init_db
+    path = os.path.join(tmp, f"bench_{time.perf_counter_ns()}.db")
+    return init_db(f"sqlite:///{path}")
+
+def bench_persist(size, corpus_dir, repeat, copy_files=False):
+    from batch_writer import BatchWriter
+    from corpus import generate_corpus
+
+    tmp = tempfile.mkdtemp(prefix="sigma_bench_")
+    if copy_files:
+        sources = generate_corpus(corpus_dir)['jpeg']
+        # Copias a nombres distintos para que cada imagen tenga su destino
+        src_dir = os.path.join(tmp, "fuente")
+        os.makedirs(src_dir)
+        paths = []
+        for i in range(size):
+            path = os.path.join(src_dir, f"img_{i:05d}.jpg")
+            try:
+                os.link(sources[i % len(sources)], path)
+            except OSError:
+                shutil.copy(sources[i % len(sources)], path)
+            paths.append(path)
+    else:
+        paths = [os.path.join(corpus_dir, "lote", f"img_{i:05d}.jpg") for i in range(size)]
+    items = [(path, sample_labels()) for path in paths]
+
+    def setup():
+        shutil.rmtree(os.path.join(tmp, "Clasificadas"), ignore_errors=True)
+        return _fresh_db(tmp)
+
+    def run(session_factory):
+        result = BatchWriter(session_factory, items, tmp, copy_files=copy_files).run()
+        assert result.inserted == size and not result.copy_failed, result.errors
+
+    try:
+        result = measure(run, repeat, setup)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    result['images'] = size
+    result['images_per_s'] = round(size / (result['median_ms'] / 1000), 1)
+    return result
+
+def bench_export(repeat, rows=EXPORT_ROWS):
+    import export_data
+    from batch_writer import BatchWriter
+    from database import init_db
+
+    tmp = tempfile.mkdtemp(prefix="sigma_bench_")
+    try:
+        db_path = os.path.join(tmp, "export.db")
+        session_factory = init_db(f"sqlite:///{db_path}")
+        items = [(f"/datos/lote/img_{i:05d}.jpg", sample_labels()) for i in range(rows)]
+        BatchWriter(session_factory, items, tmp, copy_files=False).run()
+        output = os.path.join(tmp, "labels.csv")
+
+        def run(_arg):
+            assert export_data.export_csv(db_path, output) == rows
+        result = measure(run, repeat)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    result['rows'] = rows
+    return result
+
+def bench_rerank(repeat, candidates=RERANK_CANDIDATES):
+    import numpy as np
+    from active_learning import FEATURE_COLUMNS, QualityModel, Ranking
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, len(FEATURE_COLUMNS)))
+    model = QualityModel()
+    model.partial_fit(X, np.digitize(X[:, 0], [-0.5, 0.5]) + 1, epochs=5)
+    features = rng.normal(size=(candidates, len(FEATURE_COLUMNS)))
+    paths = [f"/datos/lote/img_{i:05d}.jpg" for i in range(candidates)]
+
+    def run(_arg):
+        Ranking(paths, model.predict_proba(features), model.samples)
+    result = measure(run, repeat)
+    result['candidates'] = candidates
+    result['target_ms'] = RERANK_TARGET_MS
+    result['within_target'] = result['median_ms'] <= RERANK_TARGET_MS
+    return result
+
+def bench_startup(repeat):
+    outcome = []
+
+    def run(_arg):
+        proc = subprocess.Popen([sys.executable, "-c", STARTUP_SCRIPT.format(root=ROOT)],
+                                stdout=subprocess.PIPE, text=True, cwd=ROOT)
+        outcome.append(proc.stdout.readline().strip())
+        proc.wait()
+    result = measure(run, repeat)
+    result['window'] = outcome[-1] == "ventana"
+    result['target_ms'] = STARTUP_TARGET_MS
+    result['within_target'] = result['median_ms'] <= STARTUP_TARGET_MS
+    return result
+
+def benchmark_names(quick):
+    sizes = PERSIST_SIZES[:2] if quick else PERSIST_SIZES
+    return (['decode[jpeg]', 'decode[dicom12]', 'decode[dicom16]', 'decode[oct]', 'scan']
+            + [f'persist[{n}]' for n in sizes]
+            + ['persist_copy[100]', 'export_csv', f'rerank[{RERANK_CANDIDATES}]', 'startup'])
+
+def run_one(name, corpus_dir, repeat):
+    """Ejecuta un benchmark en este proceso."""
+    if name.startswith('decode['):
+        return bench_decode(name[7:-1], corpus_dir, repeat)
+    if name == 'scan':
+        return bench_scan(corpus_dir, repeat)
+    if name.startswith('persist_copy['):
+        return bench_persist(int(name[13:-1]), corpus_dir, repeat, copy_files=True)
+    if name.startswith('persist['):
+        return bench_persist(int(name[8:-1]), corpus_dir, max(1, repeat // 2))
+    if name == 'export_csv':
+        return bench_export(repeat)
+    if name.startswith('rerank['):
+        return bench_rerank(repeat, int(name[7:-1]))
+    if name == 'startup':
+        return bench_startup(repeat)
+    raise ValueError(f"Benchmark desconocido: {name}")
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+def compare(current, baseline):
+    """Imprime la variación de la mediana y la memoria respecto a otro resultado."""
+    print(f"\nComparación con {baseline['meta']['commit']}:")
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old or 'error' in result or 'error' in old:
+            continue
+        delta = (result['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+        print(f"  {name:20s} {old['median_ms']:10.1f} -> {result['median_ms']:10.1f} ms ({delta:+6.1f}%)   "
+              f"memoria {old['peak_alloc_mb']:7.1f} -> {result['peak_alloc_mb']:7.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="Carpeta del corpus sintético (se reutiliza)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="Omitir el lote de 10k imágenes")
+    parser.add_argument("--only", action="append", help="Ejecutar sólo estos benchmarks (p. ej. scan, persist[1000])")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    parser.add_argument("--compare", help="JSON de otro commit con el que comparar")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.child, args.corpus, args.repeat)))
+        return
+
+    names = args.only or benchmark_names(args.quick)
+    report = {
+        'meta': {
+            'commit': git_revision(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    for name in names:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name,
+                               "--corpus", args.corpus, "--repeat", str(args.repeat)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["error"])[-1]
+            report['results'][name] = {'error': error}
+            print(f"  {name:20s} ❌ {error}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        report['results'][name] = result
+        print(f"  {name:20s} mediana {result['median_ms']:10.1f} ms   p95 {result['p95_ms']:10.1f} ms   "
+              f"memoria {result['peak_alloc_mb']:7.1f} MB   RSS {result['peak_rss_mb']:7.1f} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
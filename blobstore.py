@@ -0,0 +1,302 @@
+"""
+Almacén por contenido de la carpeta Clasificadas/.
+
+Cada archivo se guarda una sola vez en Clasificadas/.blobs/, con el hash
+BLAKE2b de su contenido como nombre (más la extensión original). Si el
+origen está en el mismo sistema de archivos se usa un reflink (copia con
+copy-on-write, Btrfs/XFS) o un enlace duro, sin copiar datos; si no, una
+copia verificada. Las carpetas Clasificadas/<calidad>/ son vistas: enlaces
+duros al blob (o simbólicos, o copias si el sistema de archivos no admite
+enlaces), así que reclasificar una imagen es mover un enlace y volver a
+empezar es borrar enlaces, sin tocar los datos.
+
+Dos imágenes con el mismo nombre en carpetas de origen distintas ya no se
+pisan: la segunda vista lleva el comienzo del hash en el nombre.
+
+Con enlaces duros el blob es el mismo archivo que el original: los
+originales no deben modificarse en el lugar (`python -m sigma classified
+--verify` lo comprueba).
+
+Uso:
+    python -m sigma [--db URL] classified [--gc] [--verify]
+"""
+import os
+import shutil
+import threading
+from thumbcache import file_content_hash
+
+BLOB_DIR = ".blobs"
+FICLONE = 0x40049409  # ioctl de Linux para clonar un archivo (reflink)
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def _reflink(source, destination):
+    """Clona `source` en `destination` con copy-on-write. False si no se puede."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        return False
+    shutil.copystat(source, destination)
+    return True
+
+def _make_link(target, link):
+    """Enlace duro a `target` en `link`; si no se puede, simbólico; si tampoco, copia."""
+    partial = link + '.part'
+    try:
+        os.link(target, partial)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(target), partial)
+        except OSError:
+            shutil.copy2(target, partial)
+    os.replace(partial, link)
+
+class BlobStore:
+    """
+    Blobs en `<root>/.blobs/aa/bb/<hash><ext>` y vistas en `<root>/<calidad>/`.
+    La clave de un blob es su nombre de archivo (hash + extensión), que se
+    guarda en `image_records.blob_key`.
+    """
+    def __init__(self, root, verify='size', dirs=None):
+        from copy_engine import DirectoryCache
+        self.root = root
+        self.verify = verify
+        self.dirs = dirs if dirs is not None else DirectoryCache()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._view_lock = threading.Lock()
+
+    def blob_path(self, key):
+        return os.path.join(self.root, BLOB_DIR, key[:2], key[2:4], key)
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def put(self, file_path, known_key=None):
+        """
+        Guarda `file_path` en el almacén (si su contenido no estaba) y devuelve
+        su clave. Con `known_key` (la clave de la vez anterior), si el blob
+        tiene el mismo tamaño y fecha que el archivo no se vuelve a leer.
+        """
+        if known_key and os.path.splitext(known_key)[1] == os.path.splitext(file_path)[1].lower():
+            stamp = _stamp(file_path)
+            if stamp is not None and stamp == _stamp(self.blob_path(known_key)):
+                return known_key
+        key = file_content_hash(file_path) + os.path.splitext(file_path)[1].lower()
+        blob = self.blob_path(key)
+        with self._lock(key):
+            if not os.path.exists(blob):
+                self._ingest(file_path, blob)
+        return key
+
+    def _ingest(self, file_path, blob):
+        from copy_engine import copy_verified
+
+        folder = os.path.dirname(blob)
+        self.dirs.ensure(folder)
+        if os.stat(file_path).st_dev == os.stat(folder).st_dev:
+            partial = blob + '.part'
+            if _reflink(file_path, partial):
+                os.replace(partial, blob)
+                return
+            try:
+                os.link(file_path, partial)
+                os.replace(partial, blob)
+                return
+            except OSError:
+                pass  # sistema de archivos sin enlaces duros o sin permiso: copiar
+        result = copy_verified(file_path, blob, self.verify, self.dirs)
+        if not result.ok:
+            raise OSError(result.error)
+
+    def view_path(self, key, file_path, quality):
+        """Ruta de la vista de `file_path` en `<root>/<calidad>/` (con el hash si el nombre está ocupado)."""
+        folder = os.path.join(self.root, quality)
+        name = os.path.basename(file_path)
+        view = os.path.join(folder, name)
+        if not os.path.lexists(view) or self.is_view_of(view, key):
+            return view
+        stem, ext = os.path.splitext(name)
+        return os.path.join(folder, f"{stem}__{key[:8]}{ext}")
+
+    def is_view_of(self, view, key):
+        blob = self.blob_path(key)
+        try:
+            if os.path.samefile(view, blob):
+                return True
+        except OSError:
+            return False
+        # Vista copiada (sistema de archivos sin enlaces): misma fecha y tamaño
+        return _stamp(view) == _stamp(blob)
+
+    def link_view(self, key, file_path, quality):
+        """Crea (si falta) la vista del blob en la carpeta de su calidad y devuelve su ruta."""
+        with self._view_lock:
+            view = self.view_path(key, file_path, quality)
+            if not self.is_view_of(view, key):
+                self.dirs.ensure(os.path.dirname(view))
+                _make_link(self.blob_path(key), view)
+            return view
+
+    def remove_view(self, view):
+        """Borra una vista anterior (sólo dentro de las carpetas de calidad)."""
+        root = os.path.abspath(self.root)
+        view = os.path.abspath(view)
+        if os.path.dirname(os.path.dirname(view)) != root or os.path.basename(os.path.dirname(view)) == BLOB_DIR:
+            return
+        try:
+            os.remove(view)
+        except FileNotFoundError:
+            pass
+
+    def classify(self, file_path, quality, previous_view=None, known_key=None):
+        """
+        Guarda `file_path` y lo muestra en la carpeta de `quality`. Si antes
+        estaba en otra vista (`previous_view`), la quita. Devuelve (vista, clave).
+        """
+        key = self.put(file_path, known_key)
+        view = self.link_view(key, file_path, quality)
+        if previous_view and os.path.abspath(previous_view) != os.path.abspath(view):
+            self.remove_view(previous_view)
+        return view, key
+
+    def iter_blobs(self):
+        """Pares (clave, ruta) de todos los blobs."""
+        for current, _dirs, files in os.walk(os.path.join(self.root, BLOB_DIR)):
+            for name in files:
+                if not name.endswith('.part'):
+                    yield name, os.path.join(current, name)
+
+    def iter_view_folders(self):
+        try:
+            with os.scandir(self.root) as it:
+                return [entry.path for entry in it if entry.is_dir(follow_symlinks=False) and entry.name != BLOB_DIR]
+        except FileNotFoundError:
+            return []
+
+def sync_views(session_factory, store):
+    """
+    Regenera las carpetas de calidad desde la BD: incorpora al almacén las
+    copias antiguas (anteriores a los blobs), crea las vistas que falten y
+    borra las que sobran. Los archivos que no son vistas de un blob no se
+    borran. Devuelve (creadas, borradas, adoptadas, archivos sueltos).
+    """
+    from sqlalchemy import select
+    from database import ImageRecord
+
+    table = ImageRecord.__table__
+    session = session_factory()
+    try:
+        rows = session.execute(select(table.c.id, table.c.original_path, table.c.quality,
+                                      table.c.classified_path, table.c.blob_key)
+                               .where(table.c.quality.isnot(None)).order_by(table.c.id)).all()
+        adopted = 0
+        updates = []
+        for record_id, original_path, quality, classified_path, old_key in rows:
+            key = old_key
+            if key is None:
+                # Copia física de antes del almacén: pasa a ser el blob (mismo sistema de archivos)
+                source = classified_path if classified_path and os.path.exists(classified_path) else original_path
+                if not os.path.exists(source):
+                    continue
+                key = store.put(source)
+                adopted += 1
+            updates.append((record_id, original_path, quality, classified_path, old_key, key))
+
+        # Vistas que deben existir (en orden de id: la primera conserva el nombre original)
+        wanted = {}
+        created = 0
+        changes = []
+        for record_id, original_path, quality, classified_path, old_key, key in updates:
+            if not os.path.exists(store.blob_path(key)):
+                continue
+            folder = os.path.join(store.root, quality)
+            name = os.path.basename(original_path)
+            view = os.path.join(folder, name)
+            if wanted.get(view, key) != key:
+                stem, ext = os.path.splitext(name)
+                view = os.path.join(folder, f"{stem}__{key[:8]}{ext}")
+            wanted[view] = key
+            legacy_copy = old_key is None and os.path.exists(view) and not os.path.samefile(view, store.blob_path(key))
+            if legacy_copy or not store.is_view_of(view, key):
+                store.dirs.ensure(folder)
+                _make_link(store.blob_path(key), view)
+                created += 1
+            if view != classified_path or key != old_key:
+                changes.append({'b_id': record_id, 'b_view': view, 'b_key': key})
+
+        blob_inodes = set()
+        for _key, path in store.iter_blobs():
+            st = os.stat(path)
+            blob_inodes.add((st.st_dev, st.st_ino))
+        removed = loose = 0
+        for folder in store.iter_view_folders():
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.path in wanted:
+                        continue
+                    try:
+                        st = os.stat(entry.path)
+                    except OSError:
+                        st = None  # enlace simbólico roto
+                    if entry.is_symlink() or (st is not None and (st.st_dev, st.st_ino) in blob_inodes):
+                        os.remove(entry.path)
+                        removed += 1
+                    else:
+                        loose += 1
+
+        if changes:
+            from sqlalchemy import bindparam
+            session.execute(table.update().where(table.c.id == bindparam('b_id'))
+                            .values(classified_path=bindparam('b_view'), blob_key=bindparam('b_key')), changes)
+            session.commit()
+    finally:
+        session.close()
+    return created, removed, adopted, loose
+
+def collect_garbage(session_factory, store):
+    """Borra los blobs que ya no usa ningún registro. Devuelve (blobs, bytes) liberados."""
+    from sqlalchemy import select
+    from database import ImageRecord
+
+    session = session_factory()
+    try:
+        used = {key for (key,) in session.execute(select(ImageRecord.__table__.c.blob_key).distinct())}
+    finally:
+        session.close()
+    count = freed = 0
+    for key, path in list(store.iter_blobs()):
+        if key not in used:
+            freed += os.path.getsize(path)
+            os.remove(path)
+            count += 1
+    return count, freed
+
+def verify_blobs(store):
+    """Claves de los blobs cuyo contenido ya no coincide con su hash."""
+    return [key for key, path in store.iter_blobs()
+            if file_content_hash(path) != os.path.splitext(key)[0]]
+
+def remove_views(root):
+    """Borra las carpetas de calidad (vistas) sin tocar `.blobs`. Devuelve cuántas entradas borró."""
+    removed = 0
+    for folder in BlobStore(root).iter_view_folders():
+        for current, _dirs, files in os.walk(folder):
+            removed += len(files)
+        shutil.rmtree(folder)
+    return removed
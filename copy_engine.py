@@ -0,0 +1,361 @@
+"""
+Copia en paralelo de las imágenes clasificadas a la carpeta Clasificadas/.
+
+Cada imagen se guarda una vez en el almacén por contenido (ver blobstore.py)
+y se enlaza en Clasificadas/<calidad>/. Las copias se ejecutan en un pool de
+hilos acotado (con menos hilos si el destino es una unidad de red), se
+reintentan ante errores transitorios, se verifican por tamaño o checksum y
+su resultado queda registrado en la fila de `image_records`, de modo que las
+fallidas se puedan reintentar sin volver a etiquetar:
+    python copy_engine.py retry
+"""
+import errno
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import bindparam, or_, select
+from blobstore import BlobStore
+from database import ImageRecord, normalize_path
+import perf
+
+LOCAL_WORKERS = 4
+NETWORK_WORKERS = 2
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'fuse.sshfs', 'sshfs', '9p', 'afs')
+
+# Errores que suelen ser pasajeros en unidades de red o archivos bloqueados
+TRANSIENT_ERRNOS = {errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ETIMEDOUT,
+                    errno.ECONNRESET, errno.ECONNABORTED, errno.ESTALE}
+# Windows: archivo en uso, red no disponible, nombre de red eliminado, semáforo agotado
+TRANSIENT_WINERRORS = {32, 33, 53, 64, 121}
+
+STATUS_PENDING = "Pending"
+STATUS_COPIED = "Copied"
+STATUS_FAILED = "Failed"
+
+def is_network_path(path):
+    """Detecta si `path` está en una unidad de red (UNC/unidad remota en Windows, NFS/SMB en Linux)."""
+    path = os.path.abspath(path)
+    if os.name == 'nt':
+        if path.startswith('\\\\'):
+            return True
+        try:
+            import ctypes
+            DRIVE_REMOTE = 4
+            return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + '\\') == DRIVE_REMOTE
+        except (AttributeError, OSError):
+            return False
+
+    best_mount, best_type = '', ''
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount_point, fs_type = parts[1], parts[2]
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best_mount):
+                    best_mount, best_type = mount_point, fs_type
+    except OSError:
+        return False
+    return best_type in NETWORK_FILESYSTEMS
+
+def is_transient_error(error):
+    if isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError)):
+        return False
+    return (getattr(error, 'winerror', None) in TRANSIENT_WINERRORS
+            or getattr(error, 'errno', None) in TRANSIENT_ERRNOS)
+
+def _checksum(file_path):
+    from thumbcache import file_content_hash
+    return file_content_hash(file_path)
+
+class CopyResult:
+    """Resultado de la copia de un archivo."""
+    def __init__(self, source, destination=None, error=None, attempts=0, blob_key=None):
+        self.source = source
+        self.destination = destination
+        self.error = error
+        self.attempts = attempts
+        self.blob_key = blob_key
+
+    @property
+    def ok(self):
+        return self.error is None
+
+class DirectoryCache:
+    """Recuerda las carpetas ya creadas para no repetir `os.makedirs` en cada copia."""
+    def __init__(self):
+        self._created = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, directory):
+        if directory in self._created:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._created.add(directory)
+
+_default_dirs = DirectoryCache()
+
+def classified_root(base_dir):
+    return os.path.join(base_dir, "Clasificadas")
+
+def copy_verified(file_path, destination, verify='size', dirs=_default_dirs,
+                  max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """
+    Copia `file_path` a `destination` pasando por un archivo temporal, verifica
+    la copia ('size', 'checksum' o None) y la renombra al destino final.
+    Reintenta con espera exponencial los errores transitorios.
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        partial = destination + '.part'
+        try:
+            dirs.ensure(os.path.dirname(destination))
+            shutil.copy2(file_path, partial)
+            if verify == 'size' and os.path.getsize(partial) != os.path.getsize(file_path):
+                raise OSError(errno.EIO, "El tamaño de la copia no coincide", destination)
+            if verify == 'checksum' and _checksum(partial) != _checksum(file_path):
+                raise OSError(errno.EIO, "El checksum de la copia no coincide", destination)
+            os.replace(partial, destination)
+            return CopyResult(file_path, destination, attempts=attempts)
+        except OSError as e:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            if attempts > max_retries or not is_transient_error(e):
+                return CopyResult(file_path, error=str(e), attempts=attempts)
+            time.sleep(backoff * (2 ** (attempts - 1)))
+
+def previous_copies(session, path_keys, chunk_size=200):
+    """{path_key: (vista, blob)} de la copia anterior de cada imagen ya registrada."""
+    table = ImageRecord.__table__
+    found = {}
+    for start in range(0, len(path_keys), chunk_size):
+        stmt = select(table.c.path_key, table.c.classified_path, table.c.blob_key).where(
+            table.c.path_key.in_(path_keys[start:start + chunk_size]), table.c.blob_key.isnot(None))
+        for key, view, blob_key in session.execute(stmt):
+            found[key] = (view, blob_key)
+    return found
+
+class CopyBatch:
+    """
+    Copias enviadas juntas (p. ej. las de un guardado por lotes), con sus
+    propias cuentas: un motor compartido no mezcla los resultados de lotes
+    distintos. Sólo guarda las copias en curso; las terminadas se sueltan.
+    """
+    def __init__(self):
+        self.copied = 0
+        self.failed = 0
+        self.cancelled = 0
+        self._pending = set()
+        self._cond = threading.Condition()
+
+    def _add(self, future):
+        with self._cond:
+            self._pending.add(future)
+
+    def _record(self, result):
+        with self._cond:
+            if result.ok:
+                self.copied += 1
+            else:
+                self.failed += 1
+
+    def _finished(self, future):
+        with self._cond:
+            self._pending.discard(future)
+            if future.cancelled():
+                self.cancelled += 1
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Espera a que terminen las copias del lote. False si vence `timeout` antes."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def cancel(self):
+        """Cancela las copias que todavía no empezaron (las en curso terminan). Devuelve cuántas."""
+        with self._cond:
+            pending = list(self._pending)
+        return sum(future.cancel() for future in pending)
+
+class CopyEngine:
+    """
+    Pool de hilos acotado para guardar archivos en el almacén de Clasificadas/
+    y enlazarlos en su carpeta de calidad. `submit` bloquea si ya hay
+    `max_pending` copias en cola, para no acumular memoria con lotes enormes.
+    Las copias se agrupan en `CopyBatch` (`new_batch`); sin indicarlo van al
+    lote propio del motor, que `wait` y `cancel` atienden.
+    """
+    def __init__(self, base_dir, workers=None, verify='size', max_pending=None, on_result=None):
+        self.base_dir = base_dir
+        self.verify = verify
+        self.on_result = on_result
+        if workers is None:
+            workers = NETWORK_WORKERS if is_network_path(base_dir) else LOCAL_WORKERS
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="copy")
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 8)
+        self._dirs = DirectoryCache()
+        self.store = BlobStore(classified_root(base_dir), verify, self._dirs)
+        self._batch = CopyBatch()
+
+    def new_batch(self):
+        return CopyBatch()
+
+    def submit(self, file_path, quality, previous=None, batch=None):
+        """
+        `previous`: (vista, blob) de una clasificación anterior; si el archivo no
+        cambió, reclasificar sólo mueve el enlace.
+        """
+        batch = batch or self._batch
+        self._slots.acquire()
+        future = self._executor.submit(self._copy, file_path, quality, previous, batch)
+        batch._add(future)
+        future.add_done_callback(lambda f: self._finished(f, batch))
+        return future
+
+    def _finished(self, future, batch):
+        self._slots.release()
+        batch._finished(future)
+
+    def _copy(self, file_path, quality, previous=None, batch=None):
+        previous_view, known_key = previous or (None, None)
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                with perf.timer('copy'):
+                    destination, key = self.store.classify(file_path, quality, previous_view, known_key)
+                result = CopyResult(file_path, destination, attempts=attempts, blob_key=key)
+            except OSError as e:
+                if attempts <= MAX_RETRIES and is_transient_error(e):
+                    time.sleep(RETRY_BACKOFF * (2 ** (attempts - 1)))
+                    continue
+                result = CopyResult(file_path, error=str(e), attempts=attempts)
+            except Exception as e:
+                result = CopyResult(file_path, error=str(e), attempts=attempts)
+            break
+        if batch is not None:
+            batch._record(result)
+        if not result.ok:
+            perf.count('copy.failed')
+            print(f"Error copiando archivo: {result.error}")
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+    def wait(self):
+        """
+        Espera a que terminen las copias enviadas sin lote propio. Devuelve
+        (copiadas, fallidas) desde la espera anterior; cada resultado llega
+        además a `on_result`.
+        """
+        batch, self._batch = self._batch, CopyBatch()
+        batch.wait()
+        return batch.copied, batch.failed
+
+    def cancel(self):
+        """Cancela las copias sin lote propio que todavía no empezaron."""
+        return self._batch.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class CopyStatusRecorder:
+    """
+    Acumula los resultados de copia y los escribe en `image_records`
+    con un UPDATE por bloques (executemany).
+    """
+    def __init__(self, session_factory, flush_every=200):
+        self.session_factory = session_factory
+        self.flush_every = flush_every
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        with self._lock:
+            self._pending.append({
+                'b_key': normalize_path(result.source),
+                'b_status': STATUS_COPIED if result.ok else STATUS_FAILED,
+                'b_destination': result.destination,
+                'b_blob': result.blob_key,
+                'b_error': result.error,
+            })
+            if len(self._pending) < self.flush_every:
+                return
+            rows, self._pending = self._pending, []
+        self._write(rows)
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if rows:
+            self._write(rows)
+
+    def _write(self, rows):
+        table = ImageRecord.__table__
+        stmt = (table.update()
+                .where(table.c.path_key == bindparam('b_key'))
+                # NULL (filas migradas del esquema anterior) no cumple `!=`
+                .where(or_(table.c.copy_status.is_(None), table.c.copy_status != STATUS_COPIED))
+                .values(copy_status=bindparam('b_status'),
+                        classified_path=bindparam('b_destination'),
+                        blob_key=bindparam('b_blob'),
+                        copy_error=bindparam('b_error')))
+        session = self.session_factory()
+        try:
+            session.execute(stmt, rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Error registrando resultado de copias: {e}")
+        finally:
+            session.close()
+
+def retry_failed_copies(session_factory, base_dir, workers=None):
+    """
+    Vuelve a copiar los archivos cuya copia quedó pendiente, falló o nunca se
+    registró (filas migradas). Devuelve (copiadas, fallidas).
+    """
+    session = session_factory()
+    try:
+        rows = (session.query(ImageRecord.original_path, ImageRecord.quality,
+                              ImageRecord.classified_path, ImageRecord.blob_key)
+                .filter(or_(ImageRecord.copy_status.in_([STATUS_PENDING, STATUS_FAILED]),
+                            ImageRecord.copy_status.is_(None)),
+                        ImageRecord.quality.isnot(None))
+                .all())
+    finally:
+        session.close()
+
+    recorder = CopyStatusRecorder(session_factory)
+    engine = CopyEngine(base_dir, workers=workers, on_result=recorder)
+    for original_path, quality, classified_path, blob_key in rows:
+        engine.submit(original_path, quality, (classified_path, blob_key) if blob_key else None)
+    counts = engine.wait()
+    engine.shutdown()
+    recorder.flush()
+    return counts
+
+def main(argv):
+    if len(argv) != 2 or argv[1] != "retry":
+        print("Uso: python copy_engine.py retry")
+        return 1
+    from database import init_db
+    session_factory = init_db()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    copied, failed = retry_failed_copies(session_factory, base_dir)
+    print(f"✅ Copias reintentadas: {copied + failed} (fallidas: {failed})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,293 @@
+"""
+Exportación del conjunto de entrenamiento: imágenes + etiquetas en fragmentos.
+
+Las imágenes validadas se reparten entre entrenamiento y validación de forma
+estable (según un hash de la ruta, así una imagen nunca cambia de lado) y
+cada parte se divide en fragmentos de unas `shard_size` filas, también por
+un hash de la ruta: validar una imagen sólo cambia el fragmento que le toca,
+no desplaza a los demás. La cantidad de fragmentos de cada parte queda en el
+manifiesto y sólo se recalcula (rehaciendo todo) cuando la parte duplica su
+tamaño o cambian las opciones.
+Cada fragmento son dos archivos .npy que se leen sin copia con
+`np.load(..., mmap_mode='r')`:
+  - <parte>-NNNNN.images.npy: uint8 (N, tamaño, tamaño, 3), la imagen completa
+    reducida con la misma ventana/nivel que la GUI y centrada sobre negro
+  - <parte>-NNNNN.labels.npy: arreglo estructurado alineado con las imágenes:
+    id, códigos de cada campo (0 = vacío, como en la BD), artifacts_mask y
+    valid (0 si la imagen no se pudo leer)
+más <parte>-NNNNN.paths.txt con las rutas originales. manifest.json describe
+los fragmentos, los vocabularios y la partición.
+
+Los fragmentos se generan en paralelo (un proceso por fragmento). Cada uno
+guarda una huella de sus filas (ids, etiquetas, tamaño y fecha de los
+archivos, opciones); al repetir la exportación sólo se regeneran los que
+cambiaron, y una ejecución interrumpida continúa donde quedó.
+
+Uso:
+    python -m sigma [--db URL] dataset <carpeta> [--size 224] [--shard-size 1024] [--val 0.1] [--workers N]
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
+from sqlalchemy import select
+from database import IMAGE_RECORD_CODES, VALIDATION_STATUSES
+import labels
+
+FORMAT_VERSION = 2
+DEFAULT_IMAGE_SIZE = 224
+DEFAULT_SHARD_SIZE = 1024
+DEFAULT_VAL_FRACTION = 0.1
+MANIFEST_NAME = "manifest.json"
+SPLITS = ('train', 'val')
+
+FIELDS = list(labels.FIELD_VOCABULARIES)
+LABEL_DTYPE = np.dtype([('id', '<i8')] + [(name, 'u1') for name in FIELDS]
+                       + [('artifacts_mask', 'u1'), ('valid', 'u1')])
+
+def split_of(path_key, val_fraction, seed=0):
+    """'val' o 'train' según un hash estable de la ruta normalizada."""
+    digest = hashlib.blake2b(f"{seed}|{path_key}".encode('utf-8'), digest_size=8).digest()
+    return 'val' if int.from_bytes(digest, 'big') / 2 ** 64 < val_fraction else 'train'
+
+def bucket_of(path_key, buckets, seed=0):
+    """Fragmento (0..buckets-1) de una imagen según un hash estable de su ruta."""
+    digest = hashlib.blake2b(f"{seed}|shard|{path_key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % buckets
+
+def load_validated_rows(engine):
+    """Filas validadas en orden de id: (id, ruta, clave, códigos..., máscara), códigos NULL como 0."""
+    table = IMAGE_RECORD_CODES
+    columns = [table.c.id, table.c.original_path, table.c.path_key] + \
+              [table.c[name] for name in FIELDS] + [table.c.artifacts]
+    stmt = select(*columns).where(
+        table.c.validation_status == VALIDATION_STATUSES.index("Validated") + 1).order_by(table.c.id)
+    with engine.connect() as conn:
+        return [tuple(row[:3]) + tuple(code or 0 for code in row[3:]) for row in conn.execute(stmt)]
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def shard_fingerprint(rows, image_size):
+    """Huella de un fragmento: cambia si cambian sus filas, etiquetas, archivos u opciones."""
+    h = hashlib.blake2b(f"{FORMAT_VERSION}|{image_size}".encode('utf-8'), digest_size=16)
+    for row in rows:
+        h.update(repr((row, _file_stamp(row[1]))).encode('utf-8'))
+    return h.hexdigest()
+
+def bucket_count(rows, shard_size, previous=None):
+    """
+    Fragmentos para una parte de `rows` filas: los de la exportación anterior
+    mientras el promedio no pase de 2 * `shard_size`, si no uno cada `shard_size`.
+    """
+    needed = max(1, -(-rows // shard_size))
+    if previous and rows <= 2 * previous * shard_size:
+        return previous
+    return needed
+
+def plan_shards(rows, shard_size, val_fraction, seed=0, previous_buckets=None):
+    """
+    Reparte las filas (en orden de id) en fragmentos estables. Devuelve
+    ({'train': {k: [filas]}, 'val': {...}}, {'train': fragmentos, 'val': ...});
+    `previous_buckets` es la cantidad de fragmentos de la exportación anterior.
+    """
+    parts = {split: [] for split in SPLITS}
+    for row in rows:
+        parts[split_of(row[2], val_fraction, seed)].append(row)
+    plan = {}
+    buckets = {}
+    for split, part in parts.items():
+        buckets[split] = bucket_count(len(part), shard_size, (previous_buckets or {}).get(split))
+        shards = {}
+        for row in part:
+            shards.setdefault(bucket_of(row[2], buckets[split], seed), []).append(row)
+        plan[split] = dict(sorted(shards.items()))
+    return plan, buckets
+
+def load_tensor(file_path, image_size):
+    """
+    Imagen como uint8 (tamaño, tamaño, 3): reducida conservando la proporción y
+    centrada sobre negro. None si no se puede leer.
+    """
+    from utils import decode_image_for_display
+
+    image = decode_image_for_display(file_path, (image_size, image_size))
+    if image is None:
+        return None
+    image = image.convert('RGB')
+    canvas = Image.new('RGB', (image_size, image_size))
+    canvas.paste(image, ((image_size - image.width) // 2, (image_size - image.height) // 2))
+    return np.asarray(canvas)
+
+def write_shard(output, name, rows, image_size):
+    """
+    Escribe un fragmento (en un proceso aparte). Las imágenes se van guardando
+    directamente en el .npy mapeado, con memoria constante. Devuelve (nombre, fallidas).
+    """
+    count = len(rows)
+    images_tmp = os.path.join(output, f"{name}.images.tmp.npy")
+    images = np.lib.format.open_memmap(images_tmp, mode='w+', dtype=np.uint8,
+                                       shape=(count, image_size, image_size, 3))
+    table = np.zeros(count, dtype=LABEL_DTYPE)
+    failed = 0
+    for i, row in enumerate(rows):
+        table[i] = (row[0],) + tuple(row[3:]) + (0,)
+        tensor = load_tensor(row[1], image_size)
+        if tensor is None:
+            failed += 1
+            continue
+        images[i] = tensor
+        table['valid'][i] = 1
+    images.flush()
+    del images
+
+    labels_tmp = os.path.join(output, f"{name}.labels.tmp.npy")
+    np.save(labels_tmp, table)
+    paths_tmp = os.path.join(output, f"{name}.paths.tmp")
+    with open(paths_tmp, 'w', encoding='utf-8') as f:
+        f.writelines(row[1] + '\n' for row in rows)
+    os.replace(images_tmp, os.path.join(output, f"{name}.images.npy"))
+    os.replace(labels_tmp, os.path.join(output, f"{name}.labels.npy"))
+    os.replace(paths_tmp, os.path.join(output, f"{name}.paths.txt"))
+    return name, failed
+
+def read_manifest(output):
+    path = os.path.join(output, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+def write_manifest(output, manifest):
+    path = os.path.join(output, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def _shard_files(output, name):
+    return [os.path.join(output, f"{name}.{suffix}") for suffix in ('images.npy', 'labels.npy', 'paths.txt')]
+
+def export_dataset(engine, output, image_size=DEFAULT_IMAGE_SIZE, shard_size=DEFAULT_SHARD_SIZE,
+                   val_fraction=DEFAULT_VAL_FRACTION, seed=0, workers=None, on_progress=None):
+    """
+    Genera o actualiza los fragmentos en `output`.
+    Devuelve (fragmentos escritos, fragmentos ya al día, imágenes ilegibles en total).
+    """
+    os.makedirs(output, exist_ok=True)
+    previous = read_manifest(output) or {}
+    same_options = all(previous.get(key) == value for key, value in (
+        ('format_version', FORMAT_VERSION), ('shard_size', shard_size), ('val_fraction', val_fraction), ('seed', seed)))
+    plan, buckets = plan_shards(load_validated_rows(engine), shard_size, val_fraction, seed,
+                                previous.get('buckets') if same_options else None)
+
+    known = {entry['name']: entry for split in previous.get('splits', {}).values() for entry in split['shards']}
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'image_shape': [image_size, image_size, 3],
+        'shard_size': shard_size,
+        'val_fraction': val_fraction,
+        'seed': seed,
+        'buckets': buckets,
+        'label_columns': FIELDS + ['artifacts_mask'],
+        'categories': dict({name: [""] + list(vocabulary) for name, vocabulary in labels.FIELD_VOCABULARIES.items()},
+                           artifacts_mask=list(labels.ARTIFACTS)),
+        'splits': {},
+    }
+    entries = {}
+    todo = []
+    for split, shards in plan.items():
+        manifest['splits'][split] = {'shards': []}
+        for k, rows in shards.items():
+            name = f"{split}-{k:05d}"
+            entry = {'name': name, 'rows': len(rows), 'fingerprint': shard_fingerprint(rows, image_size)}
+            manifest['splits'][split]['shards'].append(entry)
+            old = known.get(name)
+            if (old is not None and old.get('fingerprint') == entry['fingerprint']
+                    and all(os.path.exists(p) for p in _shard_files(output, name))):
+                entry['failed'] = old.get('failed', 0)
+                entries[name] = entry
+            else:
+                todo.append((name, rows, entry))
+
+    # Fragmentos de una exportación anterior que ya no existen en el plan
+    current = {entry['name'] for split in manifest['splits'].values() for entry in split['shards']}
+    for name in set(known) - current:
+        for path in _shard_files(output, name):
+            if os.path.exists(path):
+                os.remove(path)
+
+    skipped = len(entries)
+    if todo:
+        write_manifest(output, _completed_only(manifest, entries))
+        workers = min(workers or os.cpu_count() or 1, len(todo))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(write_shard, output, name, rows, image_size): entry
+                       for name, rows, entry in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                entry = futures[future]
+                try:
+                    _name, failed = future.result()
+                except Exception as e:
+                    print(f"Error generando fragmento {entry['name']}: {e}")
+                    continue
+                entry['failed'] = failed
+                entries[entry['name']] = entry
+                write_manifest(output, _completed_only(manifest, entries))
+                if on_progress is not None:
+                    on_progress(done, len(todo))
+    write_manifest(output, _completed_only(manifest, entries))
+    return len(entries) - skipped, skipped, sum(entry['failed'] for entry in entries.values())
+
+def _completed_only(manifest, entries):
+    """
+    Manifiesto con sólo los fragmentos terminados: se escribe tras cada uno, así
+    una ejecución interrumpida retoma el resto.
+    """
+    splits = {}
+    for split, info in manifest['splits'].items():
+        shards = [entry for entry in info['shards'] if entry['name'] in entries]
+        splits[split] = {'rows': sum(entry['rows'] for entry in shards), 'shards': shards}
+    complete = all(len(splits[s]['shards']) == len(manifest['splits'][s]['shards']) for s in splits)
+    return dict(manifest, splits=splits, complete=complete)
+
+def open_shard(output, name):
+    """(imágenes, etiquetas) de un fragmento, mapeadas en memoria y sin copia."""
+    images = np.load(os.path.join(output, f"{name}.images.npy"), mmap_mode='r')
+    table = np.load(os.path.join(output, f"{name}.labels.npy"), mmap_mode='r')
+    return images, table
+
+def iter_split(output, split='train'):
+    """Recorre los fragmentos de `split` del manifiesto como pares (imágenes, etiquetas)."""
+    manifest = read_manifest(output)
+    if manifest is None:
+        return
+    for entry in manifest['splits'].get(split, {}).get('shards', []):
+        yield open_shard(output, entry['name'])
+
+def run(engine, output, image_size=DEFAULT_IMAGE_SIZE, shard_size=DEFAULT_SHARD_SIZE,
+        val_fraction=DEFAULT_VAL_FRACTION, seed=0, workers=None):
+    """Ejecución desde línea de comandos con informe de progreso."""
+    start = time.perf_counter()
+
+    def report(done, total):
+        print(f"  {done}/{total} fragmentos")
+
+    written, skipped, failed = export_dataset(engine, output, image_size, shard_size, val_fraction,
+                                              seed, workers, report)
+    manifest = read_manifest(output)
+    rows = {split: info['rows'] for split, info in manifest['splits'].items()}
+    print(f"✅ Conjunto en {output}: {rows['train']} de entrenamiento, {rows['val']} de validación")
+    print(f"Fragmentos generados: {written}, ya al día: {skipped}, imágenes ilegibles: {failed} "
+          f"({time.perf_counter() - start:.1f} s)")
+    return written, skipped, failed
@@ -1,49 +1,298 @@
+"""
+Exportación de las etiquetas guardadas en la base de datos.
+
+Las filas se leen por bloques (`stream_results` + `yield_per`), de modo que
+la memoria se mantiene constante sin importar el tamaño de la tabla.
+Formatos:
+  - csv:     un único archivo CSV (por defecto dataset_labels.csv)
+  - parquet: carpeta con archivos Parquet (requiere pyarrow), columnas de
+             etiquetas codificadas como diccionario
+  - npz:     carpeta con fragmentos NumPy comprimidos, etiquetas como códigos enteros
+
+Con --incremental sólo se exportan las filas guardadas (creadas o
+reclasificadas) después de la última exportación (marca guardada junto a la
+salida); una imagen reclasificada vuelve a aparecer al final con sus
+etiquetas nuevas. Como otra estación puede confirmar filas con una hora
+anterior a la marca, cada exportación vuelve a leer los últimos
+EXPORT_OVERLAP y descarta las filas que ya había escrito (la marca guarda
+sus rutas).
+
+La base de datos es la de SIGMA_DB_URL o el archivo SQLite local; --db
+acepta una ruta de archivo SQLite o una URL de SQLAlchemy.
+
+Uso:
+    python export_data.py [--db RUTA|URL] [--format csv|parquet|npz] [--output RUTA] [--incremental]
+"""
+import argparse
 import csv
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database import ImageRecord
-
-def export_csv():
-    db_path = 'local_medical_data.db'
-    if not os.path.exists(db_path):
-        print(f"❌ No se encontró la base de datos: {db_path}")
-        return
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import make_url, select
+from database import ImageRecord, create_db_engine, get_db_url
+import labels
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = None
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_SHARD_ROWS = 50000
+# Margen ante transacciones confirmadas tarde (PostgreSQL compartido)
+EXPORT_OVERLAP = timedelta(minutes=10)
+
+EXPORT_COLUMNS = [
+    'filename', 'study_type', 'laterality',
+    'sharpness', 'illumination', 'centering', 'field_of_view',
+    'obstructions', 'artifacts',
+    'quality', 'diagnostic_utility', 'doctor_notes'
+]
+CATEGORICAL_COLUMNS = list(labels.FIELD_VOCABULARIES)
+
+def iter_record_chunks(engine, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Genera bloques de filas (tuplas en el orden de EXPORT_COLUMNS + path_key +
+    updated_at) leyendo la tabla en streaming.
+    """
+    table = ImageRecord.__table__
+    stmt = select(*[table.c[name] for name in EXPORT_COLUMNS], table.c.path_key,
+                  table.c.updated_at).order_by(table.c.id)
+    if since is not None:
+        stmt = stmt.where(table.c.updated_at > since)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for partition in result.partitions(chunk_size):
+            yield partition
+
+def watermark_path(output, fmt):
+    return os.path.join(output, "_watermark") if fmt != 'csv' else output + ".watermark"
+
+def read_watermark(path):
+    """
+    Devuelve (marca, {path_key: updated_at}) con las filas ya exportadas dentro
+    del margen. La primera línea es la marca; las siguientes, "hora<TAB>ruta".
+    """
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if not lines or not lines[0].strip():
+        return None, {}
+    seen = {}
+    for line in lines[1:]:
+        stamp, _, key = line.partition('\t')
+        if key:
+            seen[key] = datetime.fromisoformat(stamp)
+    return datetime.fromisoformat(lines[0].strip()), seen
+
+def write_watermark(path, value, seen=None):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(value.isoformat() + '\n')
+        for key, stamp in (seen or {}).items():
+            f.write(f"{stamp.isoformat()}\t{key}\n")
+    os.replace(tmp, path)
+
+def _within_overlap(seen, newest):
+    return {key: stamp for key, stamp in seen.items() if stamp > newest - EXPORT_OVERLAP}
+
+def encode_categorical(values, vocabulary):
+    """
+    Codifica una lista de cadenas como códigos int16 sobre un vocabulario estable:
+    0 = vacío, 1..N = vocabulario; valores desconocidos se agregan al final.
+    Devuelve (códigos, categorías).
+    """
+    categories = [""] + list(vocabulary)
+    index = {value: i for i, value in enumerate(categories)}
+    codes = np.empty(len(values), dtype=np.int16)
+    for i, value in enumerate(values):
+        value = value or ""
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes[i] = code
+    return codes, categories
+
+def encode_artifacts(values):
+    """Convierte 'Reflejos,Sombras' en una máscara de bits uint8 según labels.ARTIFACTS."""
+    bits = {name: 1 << i for i, name in enumerate(labels.ARTIFACTS)}
+    mask = np.zeros(len(values), dtype=np.uint8)
+    for i, value in enumerate(values):
+        if value:
+            for name in value.split(','):
+                mask[i] |= bits.get(name, 0)
+    return mask
+
+def _next_part_index(output, extension):
+    existing = [name for name in os.listdir(output) if name.startswith("part-") and name.endswith(extension)]
+    return len(existing)
+
+class CsvSink:
+    def __init__(self, output, append):
+        exists = append and os.path.exists(output)
+        self._file = open(output, 'a' if exists else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if not exists:
+            self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(row[:len(EXPORT_COLUMNS)] for row in rows)
+
+    def close(self):
+        self._file.close()
+
+class ColumnarSink:
+    """Agrupa bloques en fragmentos de `shard_rows` filas y los escribe en Parquet o npz."""
+    def __init__(self, output, fmt, append, shard_rows=DEFAULT_SHARD_ROWS):
+        if fmt == 'parquet' and pa is None:
+            raise RuntimeError("El formato parquet requiere pyarrow (pip install pyarrow); use --format npz")
+        os.makedirs(output, exist_ok=True)
+        if not append:
+            # Exportación completa: reemplazar los fragmentos anteriores
+            for name in os.listdir(output):
+                if name.startswith("part-") and name.endswith('.' + fmt):
+                    os.remove(os.path.join(output, name))
+        self.output = output
+        self.fmt = fmt
+        self.shard_rows = shard_rows
+        self._buffer = []
+        self._part = _next_part_index(output, '.' + fmt)
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.shard_rows:
+            self._flush(self._buffer[:self.shard_rows])
+            self._buffer = self._buffer[self.shard_rows:]
 
-    engine = create_engine(f'sqlite:///{db_path}')
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
+    def close(self):
+        if self._buffer:
+            self._flush(self._buffer)
+            self._buffer = []
+
+    def _flush(self, rows):
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(EXPORT_COLUMNS)}
+        path = os.path.join(self.output, f"part-{self._part:05d}.{self.fmt}")
+        self._part += 1
+        if self.fmt == 'parquet':
+            self._write_parquet(path, columns)
+        else:
+            self._write_npz(path, columns)
+
+    def _write_parquet(self, path, columns):
+        arrays = {}
+        for name, values in columns.items():
+            if name in CATEGORICAL_COLUMNS:
+                codes, categories = encode_categorical(values, labels.FIELD_VOCABULARIES[name])
+                arrays[name] = pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(categories))
+            elif name == 'artifacts':
+                arrays['artifacts_mask'] = pa.array(encode_artifacts(values))
+            else:
+                arrays[name] = pa.array(values, type=pa.string())
+        pq.write_table(pa.table(arrays), path, compression='zstd')
+
+    def _write_npz(self, path, columns):
+        arrays = {}
+        for name, values in columns.items():
+            if name in CATEGORICAL_COLUMNS:
+                codes, categories = encode_categorical(values, labels.FIELD_VOCABULARIES[name])
+                arrays[name] = codes
+                arrays[name + "__categories"] = np.array(categories, dtype=str)
+            elif name == 'artifacts':
+                arrays['artifacts_mask'] = encode_artifacts(values)
+                arrays['artifacts__categories'] = np.array(labels.ARTIFACTS, dtype=str)
+            else:
+                arrays[name] = np.array([v or "" for v in values], dtype=str)
+        np.savez_compressed(path, **arrays)
+
+def export(engine, output, fmt='csv', incremental=False, chunk_size=DEFAULT_CHUNK_SIZE,
+           shard_rows=DEFAULT_SHARD_ROWS):
+    """Exporta la tabla en streaming. Devuelve el número de filas escritas."""
+    mark_path = watermark_path(output, fmt)
+    since, seen = read_watermark(mark_path) if incremental else (None, {})
+
+    if fmt == 'csv':
+        sink = CsvSink(output, append=incremental)
+    else:
+        sink = ColumnarSink(output, fmt, incremental, shard_rows)
+
+    total = 0
+    newest = since
+    exported = dict(seen)
+    try:
+        for rows in iter_record_chunks(engine, since - EXPORT_OVERLAP if since else None, chunk_size):
+            # Filas del margen que ya se escribieron con esta misma versión
+            rows = [row for row in rows if row[-1] is None or seen.get(row[-2]) != row[-1]]
+            if not rows:
+                continue
+            sink.write(rows)
+            total += len(rows)
+            chunk_newest = max((row[-1] for row in rows if row[-1] is not None), default=None)
+            if chunk_newest is not None and (newest is None or chunk_newest > newest):
+                newest = chunk_newest
+            exported.update((row[-2], row[-1]) for row in rows if row[-1] is not None)
+            if newest is not None:
+                exported = _within_overlap(exported, newest)
+    finally:
+        sink.close()
+
+    if newest is not None:
+        write_watermark(mark_path, newest, _within_overlap(exported, newest))
+    return total
+
+def open_engine(db=None):
+    """Crea el engine para `db` (ruta SQLite o URL); None si el archivo SQLite no existe."""
+    url = make_url(get_db_url(db))
+    if url.get_backend_name() == 'sqlite' and not os.path.exists(url.database or ''):
+        print(f"❌ No se encontró la base de datos: {url.database}")
+        return None
+    return create_db_engine(url)
+
+def export_csv(db_path=None, filename='dataset_labels.csv', incremental=False,
+               chunk_size=DEFAULT_CHUNK_SIZE):
+    """Exporta las etiquetas a CSV (compatibilidad con la versión anterior)."""
+    engine = open_engine(db_path)
+    if engine is None:
+        return 0
     try:
-        records = session.query(ImageRecord).all()
-        
-        filename = 'dataset_labels.csv'
-        
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            # Header
-            writer.writerow([
-                'filename', 'study_type', 'laterality', 
-                'sharpness', 'illumination', 'centering', 'field_of_view',
-                'obstructions', 'artifacts', 
-                'quality', 'diagnostic_utility', 'doctor_notes'
-            ])
-            
-            for r in records:
-                writer.writerow([
-                    r.filename, r.study_type, r.laterality,
-                    r.sharpness, r.illumination, r.centering, r.field_of_view,
-                    r.obstructions, r.artifacts,
-                    r.quality, r.diagnostic_utility, r.doctor_notes
-                ])
-                
+        total = export(engine, filename, 'csv', incremental, chunk_size)
         print(f"✅ Exportado exitosamente a {filename}")
-        print(f"Total registros: {len(records)}")
-        
+        print(f"Total registros: {total}")
+        return total
+    except Exception as e:
+        print(f"❌ Error exportando datos: {e}")
+        return 0
+    finally:
+        engine.dispose()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta las etiquetas de la base de datos")
+    parser.add_argument("--db", default=None, help="Archivo SQLite o URL (por defecto SIGMA_DB_URL o el local)")
+    parser.add_argument("--format", choices=['csv', 'parquet', 'npz'], default='csv')
+    parser.add_argument("--output", help="Archivo CSV o carpeta de fragmentos (parquet/npz)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Sólo filas nuevas desde la última exportación")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.format == 'csv':
+        export_csv(args.db, args.output or 'dataset_labels.csv', args.incremental, args.chunk_size)
+        return
+
+    engine = open_engine(args.db)
+    if engine is None:
+        return
+    output = args.output or f'dataset_labels_{args.format}'
+    try:
+        total = export(engine, output, args.format, args.incremental, args.chunk_size)
+        print(f"✅ Exportado exitosamente a {output}")
+        print(f"Total registros: {total}")
     except Exception as e:
         print(f"❌ Error exportando datos: {e}")
     finally:
-        session.close()
+        engine.dispose()
 
 if __name__ == '__main__':
-    export_csv()
+    main()
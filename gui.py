@@ -1,12 +1,45 @@
 """
 Módulo que define la interfaz gráfica de usuario (GUI) para la aplicación.
+
+Sólo importa al cargar módulos livianos, para que la ventana aparezca de
+inmediato. Los pesados (pydicom, PIL, NumPy, SQLAlchemy, el predictor) se
+importan en un hilo de fondo mientras se muestra la ventana, junto con la
+inicialización de la base de datos; dentro de los métodos se importan de
+forma local (a esa altura ya están cargados).
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-import random
-from database import ImageRecord
-from utils import load_image_for_display, copy_file_based_on_quality
+import queue
+import threading
+import labels
+from prefetch import ImageCache, ImagePrefetcher
+from scanner import FolderScanner
+from journal import ChangeJournal
+from annotations import AnnotationStore
+import perf
+
+# Intervalo (ms) con el que la GUI comprueba si terminó la carga de módulos en segundo plano
+BACKEND_POLL_MS = 50
+# Intervalo (ms) con el que la GUI recoge los lotes del escáner de carpetas
+SCAN_POLL_MS = 30
+# Intervalo (ms) con el que se actualiza el progreso del guardado por lotes
+BATCH_POLL_MS = 100
+# Intervalo (ms) con el que se comprueba si terminó la búsqueda de duplicados
+DUPLICATES_POLL_MS = 200
+# Intervalo (ms) con el que se recogen las imágenes nuevas de la carpeta vigilada
+WATCH_POLL_MS = 500
+# Intervalo (ms) con el que se recoge el orden por incertidumbre del aprendizaje activo
+RANK_POLL_MS = 300
+# Intervalo (ms) de refresco de la superposición de rendimiento (F12)
+PERF_POLL_MS = 500
+# Tamaño de visualización y memoria de la caché de cortes de un volumen OCT
+DISPLAY_SIZE = (500, 500)
+FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+def _decode_for_display(file_path):
+    from utils import decode_image_for_display
+    return decode_image_for_display(file_path)
 
 class ToolTip:
     """
@@ -45,22 +78,111 @@ class MedicalImageApp:
     """
     Clase principal de la interfaz gráfica para la clasificación de imágenes.
     """
-    def __init__(self, root, db_session):
+    def __init__(self, root, db_session=None):
         self.root = root
+        # Fábrica de sesiones; si no se indica, init_db() se ejecuta en segundo plano
         self.session = db_session
         self.root.title("Clasificador de Imágenes Oftalmológicas")
         self.root.geometry("1200x800")  # Aumentado para mostrar todos los controles
         
         self.current_image_path = None
         self.photo_image = None # Referencia para evitar garbage collection
+        self.current_image = None # Miniatura PIL de la imagen actual (para el predictor)
         
         # Variables para manejo de carpetas
         self.image_list = []
         self.current_index = -1
         self.folder_path = None
-        self.pending_changes = {} # Diccionario para guardar cambios en memoria antes de guardar en DB
+        self.annotations = AnnotationStore() # Cambios en memoria antes de guardar en DB
+        self.scanner = None # Escaneo de carpeta en curso
+        self.watcher = None # Vigilancia de la carpeta (imágenes nuevas de la estación de captura)
+        self.ingest = None # Decodificación y predicción en segundo plano de las imágenes nuevas
+        self.validated_paths = set() # Imágenes de la carpeta que ya están validadas en la BD
+        self.skipped_validated = 0 # Validadas que se omitieron de la lista
+        self.batch_writer = None # Guardado por lotes en curso
+        self.learner = None # Modelo que ordena las imágenes por incertidumbre (ver active_learning.py)
+        self.ranking = None # Último orden calculado por el modelo
+        self.unranked_order = None # Posición original de cada imagen, para deshacer el orden
+        self.batch_snapshot = None
+
+        # Miniaturas persistentes en disco (junto a la base de datos) para reabrir carpetas sin decodificar
+        self.thumbnail_store = None # Se abre en segundo plano (ver _load_backend)
+        self.warm_stop = None
+
+        # Grupos de imágenes casi duplicadas de la carpeta (ver phash.py)
+        self.duplicate_finder = None
+        self.duplicates = None
+
+        # Ventana de estadísticas del etiquetado (ver stats.py), si está abierta
+        self.stats_window = None
+
+        # Precarga en segundo plano de las imágenes vecinas para navegar sin bloqueos
+        self.prefetcher = ImagePrefetcher(_decode_for_display, ahead=3, behind=1)
+
+        # Volumen multi-frame (OCT) abierto y precarga de sus cortes vecinos
+        self.volume = None
+        self.frame_prefetcher = None
+        self.volume_frames = []
+
+        # Visor con zoom: pirámides construidas en segundo plano
+        self.zoom_results = queue.Queue()
+        self.zoom_generation = 0
+
+        # Sugerencias automáticas (modelo entrenado si existe, si no reglas); se carga en segundo plano
+        self.predictor = None
+        self.backend_ready = threading.Event()
+        self.backend_error = None
+
+        # Diario en disco de los cambios en memoria, para recuperarlos tras un cierre inesperado
+        self.journal = ChangeJournal()
+
+        # Resumen periódico de tiempos en perf_log.jsonl (sólo con SIGMA_PERF=1)
+        self.perf_reporter = perf.start_reporting()
 
         self._setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Mostrar la ventana primero; los módulos pesados y la BD se cargan detrás
+        threading.Thread(target=self._load_backend, name="backend-loader", daemon=True).start()
+        self.root.after(BACKEND_POLL_MS, self._poll_backend)
+
+    def _load_backend(self):
+        """Importa los módulos pesados e inicializa BD, miniaturas y predictor (hilo de fondo)."""
+        try:
+            import utils  # noqa: F401  (pydicom, PIL, NumPy)
+            import batch_writer  # noqa: F401
+            import precompute  # noqa: F401
+            import volume  # noqa: F401
+            from database import init_db
+            from predictor import load_predictor
+            from thumbcache import ThumbnailStore
+
+            if self.session is None:
+                self.session = init_db()
+            self.thumbnail_store = ThumbnailStore()
+            self.predictor = load_predictor()
+        except Exception as e:
+            self.backend_error = e
+        finally:
+            self.backend_ready.set()
+
+    def _poll_backend(self):
+        """Habilita la aplicación cuando termina la carga en segundo plano."""
+        if not self.backend_ready.is_set():
+            self.root.after(BACKEND_POLL_MS, self._poll_backend)
+            return
+        if self.backend_error is not None:
+            self.lbl_status.config(text="Error iniciando la aplicación", fg="red")
+            messagebox.showerror("Error", f"No se pudo iniciar la base de datos:\n{self.backend_error}")
+            return
+
+        from utils import set_thumbnail_store
+        set_thumbnail_store(self.thumbnail_store)
+        self.btn_load.config(state=tk.NORMAL)
+        self.btn_save_batch.config(state=tk.NORMAL)
+        self.btn_stats.config(state=tk.NORMAL)
+        self.lbl_status.config(text="Esperando...")
+        self.offer_session_restore()
 
     def _setup_ui(self):
         # Frame principal dividido en dos: Imagen (Izquierda) y Controles (Derecha)
@@ -105,13 +227,56 @@ class MedicalImageApp:
         nav_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
         
         tk.Button(nav_frame, text="<< Anterior", command=self.prev_image).pack(side=tk.LEFT, padx=20)
-        self.btn_load = tk.Button(nav_frame, text="Seleccionar Carpeta", command=self.load_folder)
+        self.btn_load = tk.Button(nav_frame, text="Seleccionar Carpeta", command=self.load_folder, state=tk.DISABLED)
         self.btn_load.pack(side=tk.LEFT, expand=True)
+        self.recursive_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(nav_frame, text="Incluir subcarpetas", variable=self.recursive_var,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.skip_validated_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(nav_frame, text="Omitir validadas", variable=self.skip_validated_var,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.skip_duplicates_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(nav_frame, text="Omitir duplicados", variable=self.skip_duplicates_var,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.watch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(nav_frame, text="Vigilar carpeta", variable=self.watch_var, command=self.toggle_watch,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.rank_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(nav_frame, text="Priorizar dudosas", variable=self.rank_var, command=self.toggle_ranking,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.zoom_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(nav_frame, text="Zoom", variable=self.zoom_var, command=self.toggle_zoom,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
         tk.Button(nav_frame, text="Siguiente >>", command=self.next_image).pack(side=tk.RIGHT, padx=20)
         
         self.lbl_progress = tk.Label(left_frame, text="0 / 0", bg="gray", fg="white")
         self.lbl_progress.pack(side=tk.BOTTOM)
 
+        # Controles de volumen (sólo visibles con DICOM multi-frame)
+        self.volume_frame = tk.Frame(left_frame, bg="gray")
+        self.slice_scale = tk.Scale(self.volume_frame, orient=tk.HORIZONTAL, from_=0, to=0, showvalue=False,
+                                    command=self.show_slice, bg="gray", fg="white", highlightthickness=0)
+        self.slice_scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        self.mip_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.volume_frame, text="MIP", variable=self.mip_var, command=self.show_slice,
+                       bg="gray", activebackground="gray").pack(side=tk.LEFT)
+        self.lbl_slice = tk.Label(self.volume_frame, text="", bg="gray", fg="white", width=16)
+        self.lbl_slice.pack(side=tk.LEFT, padx=10)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.image_label.bind(sequence, self._on_slice_wheel)
+
+        # Visor con zoom a resolución completa (reemplaza a image_label mientras está activo);
+        # se crea al activarlo por primera vez
+        self.image_area = left_frame
+        self.zoom_viewer = None
+
+        # Superposición de rendimiento (F12 para mostrar/ocultar)
+        self.lbl_perf = tk.Label(left_frame, text="", bg="black", fg="lime", font=("Courier", 9), anchor="w")
+        self.perf_overlay = False
+        self.root.bind("<F12>", lambda e: self.toggle_perf_overlay())
+        if perf.is_enabled():
+            self.toggle_perf_overlay()
+
         # --- Controles ---
         tk.Label(right_frame, text="Validación de Estudio", font=("Arial", 14, "bold")).pack(pady=(0, 20))
 
@@ -119,14 +284,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Tipo de Estudio:").pack(anchor="w")
         self.study_var = tk.StringVar()
         self.cb_study = ttk.Combobox(right_frame, textvariable=self.study_var, 
-                                     values=[
-                                         "Retinografía",
-                                         "OCT",
-                                         "OCTA",
-                                         "Campimetría",
-                                         "Fotografía estereoscópica",
-                                         "Segmento anterior"
-                                     ])
+                                     values=labels.STUDY_TYPES, state="readonly")
         self.cb_study.pack(fill=tk.X, pady=5)
         ToolTip(self.cb_study, "Seleccione la técnica de imagen utilizada.")
 
@@ -134,7 +292,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Lateralidad:").pack(anchor="w")
         self.laterality_var = tk.StringVar()
         self.cb_laterality = ttk.Combobox(right_frame, textvariable=self.laterality_var, 
-                                          values=["OD (Derecho)", "OS (Izquierdo)", "No identificado"])
+                                          values=labels.LATERALITIES, state="readonly")
         self.cb_laterality.pack(fill=tk.X, pady=5)
         ToolTip(self.cb_laterality, "Indique si la imagen corresponde al ojo derecho (OD) o izquierdo (OS).")
 
@@ -145,7 +303,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Nitidez:").pack(anchor="w")
         self.sharpness_var = tk.StringVar()
         self.cb_sharpness = ttk.Combobox(right_frame, textvariable=self.sharpness_var,
-                                         values=["Excelente nitidez", "Buena nitidez", "Borroso leve", "Borroso severo / No útil"])
+                                         values=labels.SHARPNESS, state="readonly")
         self.cb_sharpness.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_sharpness, "Evalúa si los detalles relevantes están bien enfocados.")
 
@@ -153,7 +311,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Iluminación:").pack(anchor="w")
         self.illumination_var = tk.StringVar()
         self.cb_illumination = ttk.Combobox(right_frame, textvariable=self.illumination_var,
-                                            values=["Bien iluminada", "Sobreexpuesta", "Subexpuesta", "Iluminación irregular"])
+                                            values=labels.ILLUMINATION, state="readonly")
         self.cb_illumination.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_illumination, "Confirma si la imagen tiene la exposición correcta.")
 
@@ -161,7 +319,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Centrado:").pack(anchor="w")
         self.centering_var = tk.StringVar()
         self.cb_centering = ttk.Combobox(right_frame, textvariable=self.centering_var,
-                                         values=["Correctamente centrada", "Descentrada hacia nasal", "Descentrada hacia temporal", "Mala composición"])
+                                         values=labels.CENTERING, state="readonly")
         self.cb_centering.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_centering, "Valora si la zona relevante está centrada.")
 
@@ -169,7 +327,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Campo de Visión:").pack(anchor="w")
         self.fov_var = tk.StringVar()
         self.cb_fov = ttk.Combobox(right_frame, textvariable=self.fov_var,
-                                   values=["Campo adecuado", "Campo incompleto", "Demasiado cercano", "Demasiado lejano"])
+                                   values=labels.FIELD_OF_VIEW, state="readonly")
         self.cb_fov.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_fov, "Indica si abarca lo necesario.")
 
@@ -196,7 +354,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Obstrucciones:").pack(anchor="w")
         self.obstruction_var = tk.StringVar()
         self.cb_obstruction = ttk.Combobox(right_frame, textvariable=self.obstruction_var,
-                                           values=["Ninguna", "Opacidad de medios", "Miodesopsias", "Sangrado/Hemorragia"])
+                                           values=labels.OBSTRUCTIONS, state="readonly")
         self.cb_obstruction.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_obstruction, "Causadas por opacidades, flotadores o sangrado.")
 
@@ -207,7 +365,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Gradabilidad Clínica:").pack(anchor="w")
         self.quality_var = tk.StringVar()
         self.cb_quality = ttk.Combobox(right_frame, textvariable=self.quality_var, 
-                                       values=["Grado A (Alta calidad)", "Grado B (Limitada)", "No gradable"])
+                                       values=labels.QUALITY, state="readonly")
         self.cb_quality.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_quality, "Clasificación global de la calidad de la imagen.")
 
@@ -215,7 +373,7 @@ class MedicalImageApp:
         tk.Label(right_frame, text="Utilidad Diagnóstica:").pack(anchor="w")
         self.utility_var = tk.StringVar()
         self.cb_utility = ttk.Combobox(right_frame, textvariable=self.utility_var,
-                                       values=["Útil para diagnóstico", "Útil con limitaciones", "No útil"])
+                                       values=labels.DIAGNOSTIC_UTILITY, state="readonly")
         self.cb_utility.pack(fill=tk.X, pady=2)
         ToolTip(self.cb_utility, "El criterio más importante: ¿Sirve para diagnosticar?")
 
@@ -232,35 +390,326 @@ class MedicalImageApp:
             command=self.process_batch,
             bg="blue",
             fg="white",
-            font=("Arial", 10, "bold")
+            font=("Arial", 10, "bold"),
+            state=tk.DISABLED
         )
-        self.btn_save_batch.pack(fill=tk.X, pady=20)
+        self.btn_save_batch.pack(fill=tk.X, pady=(20, 5))
+
+        self.btn_accept_confident = tk.Button(right_frame, text="Aceptar seguras", command=self.accept_confident,
+                                              state=tk.DISABLED)
+        self.btn_accept_confident.pack(fill=tk.X, pady=(0, 5))
+        ToolTip(self.btn_accept_confident, "Acepta con la sugerencia las imágenes que el modelo clasifica con mucha confianza.")
+
+        self.btn_stats = tk.Button(right_frame, text="Estadísticas", command=self.show_stats, state=tk.DISABLED)
+        self.btn_stats.pack(fill=tk.X, pady=(0, 20))
+        ToolTip(self.btn_stats, "Resumen de las imágenes validadas por calidad, utilidad, tipo y artefactos.")
 
-        self.lbl_status = tk.Label(right_frame, text="Esperando...", fg="blue")
+        self.lbl_status = tk.Label(right_frame, text="Cargando...", fg="blue")
         self.lbl_status.pack(side=tk.BOTTOM)
 
     def load_folder(self):
         folder_selected = filedialog.askdirectory()
         if not folder_selected:
             return
-            
+        self.open_folder(folder_selected)
+
+    def open_folder(self, folder_selected):
+        """Comienza a escanear `folder_selected` y a mostrar sus imágenes."""
         self.folder_path = folder_selected
+        self.journal.set_folder(folder_selected)
         self.image_list = []
+        self.current_index = -1
+        self.validated_paths = set()
+        self.skipped_validated = 0
+        self.ranking = None
+        self.unranked_order = None
+        self.btn_accept_confident.config(state=tk.DISABLED)
+        self.close_volume()
+        self.prefetcher.cancel_all()
+        self.stop_warming()
+        self.stop_duplicates()
+        self.duplicates = None
+        self.stop_scan()
+        self.stop_watch()
+        # La vigilancia empieza antes del escaneo para no perder lo que llegue mientras tanto
+        if self.watch_var.get():
+            self.start_watch()
         
-        # Escanear carpeta
-        valid_extensions = ('.jpg', '.jpeg', '.png', '.dcm', '.dicom')
-        for f in os.listdir(self.folder_path):
-            if f.lower().endswith(valid_extensions):
-                self.image_list.append(os.path.join(self.folder_path, f))
-        
-        self.image_list.sort()
-        
+        # Escanear carpeta en segundo plano; las rutas llegan por lotes y cada lote
+        # se cruza con la BD (una consulta por lote) en el mismo hilo del escáner
+        self.scanner = FolderScanner(self.folder_path, recursive=self.recursive_var.get(),
+                                     resolver=self._find_validated).start()
+        self.lbl_progress.config(text="Escaneando carpeta...")
+        self.root.after(SCAN_POLL_MS, self._poll_scan)
+
+    def _poll_scan(self):
+        """Incorpora a la lista los lotes que el escáner haya encontrado."""
+        scanner = self.scanner
+        if scanner is None:
+            return
+
+        new_paths, validated = scanner.drain()
+        if validated and self.skip_validated_var.get():
+            self.skipped_validated += len(validated)
+            new_paths = [path for path in new_paths if path not in validated]
+        else:
+            self.validated_paths |= validated
+        if new_paths:
+            start = len(self.image_list)
+            self.image_list.extend(new_paths)
+            first_pending = next((i for i, path in enumerate(new_paths, start)
+                                  if path not in self.validated_paths), None)
+            if self.current_index < 0 and first_pending is not None:
+                # Mostrar la primera imagen sin etiquetar sin esperar al resto del árbol
+                self.current_index = first_pending
+                self.load_current_image()
+            else:
+                self.update_progress_label()
+                if self.current_index >= 0:
+                    self.prefetcher.update(self.image_list, self.current_index)
+
+        if not scanner.is_done():
+            self.root.after(SCAN_POLL_MS, self._poll_scan)
+            return
+
+        self.scanner = None
+        if self.current_index < 0 and self.image_list:
+            # Todas las imágenes ya estaban validadas: empezar por la primera
+            self.current_index = 0
+            self.load_current_image()
+        self.update_progress_label()
+        self.request_ranking()
         if not self.image_list:
-            messagebox.showwarning("Carpeta vacía", "No se encontraron imágenes válidas en la carpeta.")
+            if self.watcher is not None:
+                self.lbl_status.config(text="Esperando imágenes nuevas en la carpeta...")
+            elif self.skipped_validated:
+                messagebox.showinfo("Carpeta completa",
+                                    f"Las {self.skipped_validated} imágenes de la carpeta ya están validadas.")
+            else:
+                messagebox.showwarning("Carpeta vacía", "No se encontraron imágenes válidas en la carpeta.")
             return
-            
-        self.current_index = 0
-        self.load_current_image()
+
+        self.find_duplicates()
+
+    def find_duplicates(self):
+        """Busca en segundo plano las imágenes casi duplicadas de la carpeta."""
+        from phash import DuplicateFinder
+        from utils import decode_image_for_display
+        # La búsqueda decodifica (y deja en la caché de miniaturas) las imágenes sin hash
+        self.duplicate_finder = DuplicateFinder(self.session, self.image_list, decode_image_for_display).start()
+        self.root.after(DUPLICATES_POLL_MS, self._poll_duplicates)
+
+    def _poll_duplicates(self):
+        finder = self.duplicate_finder
+        if finder is None:
+            return
+        if not finder.finished.is_set():
+            self.root.after(DUPLICATES_POLL_MS, self._poll_duplicates)
+            return
+        self.duplicate_finder = None
+        self.duplicates = finder.result
+        if self.duplicates is not None and len(self.duplicates):
+            self.lbl_status.config(text=f"Se encontraron {len(self.duplicates)} grupos de imágenes casi duplicadas")
+        self.update_progress_label()
+
+        # Generar en segundo plano las miniaturas que falten del resto de la carpeta
+        from thumbcache import start_warming
+        from utils import decode_image_for_display
+        self.warm_stop = start_warming(self.thumbnail_store, self.image_list, decode_image_for_display)
+
+    def stop_duplicates(self):
+        """Detiene la búsqueda de duplicados en curso, si la hay."""
+        if self.duplicate_finder is not None:
+            self.duplicate_finder.stop()
+            self.duplicate_finder = None
+
+    def _find_validated(self, paths):
+        """Devuelve las rutas de `paths` ya validadas (se llama desde el hilo del escáner)."""
+        from database import find_validated
+        session = self.session()
+        try:
+            return find_validated(session, paths)
+        finally:
+            session.close()
+
+    def stop_scan(self):
+        """Detiene el escaneo de carpeta en curso, si lo hay."""
+        if self.scanner is not None:
+            self.scanner.stop()
+            self.scanner = None
+
+    def toggle_watch(self):
+        if self.watch_var.get():
+            if self.folder_path and self.watcher is None:
+                self.start_watch()
+        else:
+            self.stop_watch()
+        self.update_progress_label()
+
+    def start_watch(self):
+        """Empieza a vigilar la carpeta abierta y a preparar las imágenes que lleguen."""
+        from watcher import FolderWatcher, IngestQueue
+        if self.ingest is None:
+            self.ingest = IngestQueue(self.session, self.predictor, self.prefetcher.cache,
+                                      _decode_for_display).start()
+        self.watcher = FolderWatcher(self.folder_path, recursive=self.recursive_var.get(),
+                                     resolver=self._find_validated).start()
+        self.root.after(WATCH_POLL_MS, self._poll_watch)
+
+    def _poll_watch(self):
+        watcher = self.watcher
+        if watcher is None:
+            return
+        # Mientras dura el escaneo se espera: lo que llegue puede aparecer en ambos
+        if self.scanner is None:
+            paths, validated = watcher.drain()
+            if paths:
+                self._add_watched(paths, validated)
+        self.root.after(WATCH_POLL_MS, self._poll_watch)
+
+    def _add_watched(self, paths, validated):
+        """Agrega al final de la lista las imágenes nuevas y encola todas para prepararlas."""
+        # Las modificadas que ya estaban en la lista sólo se vuelven a preparar
+        self.ingest.put(paths)
+        listed = set(self.image_list)
+        new_paths = [path for path in paths if path not in listed]
+        if validated and self.skip_validated_var.get():
+            self.skipped_validated += len(validated)
+            new_paths = [path for path in new_paths if path not in validated]
+        else:
+            self.validated_paths |= validated
+        if not new_paths:
+            return
+        start = len(self.image_list)
+        self.image_list.extend(new_paths)
+        if self.learner is not None:
+            self.learner.add_candidates(new_paths)
+        self.lbl_status.config(text=f"{len(new_paths)} imágenes nuevas en la carpeta")
+        if self.current_image_path is None:
+            # No había nada en pantalla (carpeta vacía o lote recién guardado)
+            self.current_index = start
+            self.load_current_image()
+        else:
+            self.update_progress_label()
+            self.prefetcher.update(self.image_list, self.current_index)
+
+    def toggle_ranking(self):
+        if self.rank_var.get():
+            if self.ranking is not None:
+                self.apply_ranking()
+            self.request_ranking()
+        elif self.unranked_order is not None:
+            # Volver al orden de la carpeta en las imágenes que faltan
+            order = self.unranked_order
+            tail = self.image_list[self.current_index + 1:]
+            tail.sort(key=lambda path: order.get(path, len(order)))
+            self.image_list[self.current_index + 1:] = tail
+            self.prefetcher.update(self.image_list, self.current_index)
+
+    def request_ranking(self):
+        """Pide al modelo que ordene las imágenes de la carpeta (en segundo plano)."""
+        if not self.rank_var.get() or self.scanner is not None or not self.image_list:
+            return
+        if self.learner is None:
+            from active_learning import ActiveLearner
+            self.learner = ActiveLearner(self.session).start()
+            self.root.after(RANK_POLL_MS, self._poll_ranking)
+        self.learner.set_candidates(self.image_list)
+
+    def _poll_ranking(self):
+        learner = self.learner
+        if learner is None:
+            return
+        ranking = False
+        while not learner.results.empty():
+            ranking = learner.results.get_nowait()
+        if ranking is None:
+            self.lbl_status.config(text="Faltan imágenes validadas con sugerencias precalculadas para priorizar")
+        elif ranking is not False:
+            self.ranking = ranking
+            self.btn_accept_confident.config(state=tk.NORMAL)
+            if self.rank_var.get():
+                self.apply_ranking()
+        self.root.after(RANK_POLL_MS, self._poll_ranking)
+
+    def apply_ranking(self):
+        """
+        Reordena las imágenes que siguen a la actual: primero las más inciertas,
+        luego las que no tienen características y al final las ya etiquetadas.
+        """
+        ranking = self.ranking
+        if self.unranked_order is None:
+            self.unranked_order = {path: i for i, path in enumerate(self.image_list)}
+        unscored = len(ranking)
+
+        def key(path):
+            if path in self.annotations or path in self.validated_paths:
+                return unscored + 1
+            return ranking.position.get(path, unscored)
+
+        tail = self.image_list[self.current_index + 1:]
+        tail.sort(key=key)  # estable: las que empatan conservan su orden
+        self.image_list[self.current_index + 1:] = tail
+        self.prefetcher.update(self.image_list, self.current_index)
+        self.update_progress_label()
+        self.lbl_status.config(text=f"Imágenes ordenadas por incertidumbre (modelo con {ranking.samples} validadas)")
+
+    def accept_confident(self):
+        """Acepta en bloque, con su sugerencia, las imágenes que el modelo clasifica con confianza."""
+        from active_learning import ACCEPT_CONFIDENCE
+        from precompute import load_precomputed_many
+
+        listed = set(self.image_list)
+        candidates = {path: quality for path, quality, _p in self.ranking.confident()
+                      if path in listed and path not in self.annotations
+                      and path not in self.validated_paths and path != self.current_image_path}
+        session = self.session()
+        try:
+            suggestions = load_precomputed_many(session, candidates)
+        except Exception as e:
+            print(f"Error leyendo sugerencias precalculadas: {e}")
+            suggestions = {}
+        finally:
+            session.close()
+        # Sólo donde el modelo coincide con la sugerencia precalculada
+        accepted = [(path, data) for path, data in suggestions.items() if data['quality'] == candidates[path]]
+        if not accepted:
+            messagebox.showinfo("Info", "No hay imágenes pendientes que el modelo clasifique con confianza.")
+            return
+        if not messagebox.askyesno("Confirmar", f"¿Aceptar {len(accepted)} imágenes con su sugerencia? "
+                                   f"El modelo les asigna la misma calidad con al menos "
+                                   f"{ACCEPT_CONFIDENCE:.0%} de confianza."):
+            return
+        for path, data in accepted:
+            data['doctor_notes'] = "Aceptada en bloque (aprendizaje activo)"
+            if self.annotations.set_path(path, data):
+                self.journal.append(path, data)
+        if self.rank_var.get():
+            self.apply_ranking()
+        self.lbl_status.config(text=f"{len(accepted)} imágenes aceptadas en memoria. Guarde el lote para confirmarlas.")
+
+    def stop_watch(self):
+        """Detiene la vigilancia de la carpeta, si la hay."""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def update_progress_label(self):
+        text = f"Imagen {self.current_index + 1} de {len(self.image_list)}"
+        if self.current_image_path in self.validated_paths:
+            text += " (ya validada)"
+        group = self.duplicates.group(self.current_image_path) if self.duplicates is not None else None
+        if group is not None and len(group) > 1:
+            text += f" (duplicada: grupo de {len(group)})"
+        elif group is not None:
+            text += " (duplicada de una validada)"
+        if self.skipped_validated:
+            text += f" - {self.skipped_validated} validadas omitidas"
+        if self.scanner is not None:
+            text += " (escaneando...)"
+        elif self.watcher is not None:
+            text += " (vigilando carpeta)"
+        self.lbl_progress.config(text=text)
 
     def load_current_image(self):
         if not self.image_list or self.current_index < 0 or self.current_index >= len(self.image_list):
@@ -270,33 +719,162 @@ class MedicalImageApp:
         self.current_image_path = file_path
         
         # Actualizar progreso
-        self.lbl_progress.config(text=f"Imagen {self.current_index + 1} de {len(self.image_list)}")
+        self.update_progress_label()
         
-        # Mostrar imagen
-        img = load_image_for_display(file_path)
+        from utils import to_photo_image
+
+        # Mostrar imagen (normalmente ya decodificada por la precarga)
+        self.current_image = self.prefetcher.get(file_path)
+        img = to_photo_image(self.current_image)
         if img:
             self.photo_image = img
             self.image_label.config(image=img, text="")
             self.restore_selection() # Cargar datos guardados o predecir
         else:
             self.image_label.config(image="", text="Error cargando imagen")
+        self.open_current_volume(file_path)
+        if self.zoom_var.get():
+            self.load_zoom_pyramid(file_path)
+
+        # Preparar las vecinas mientras el usuario revisa esta
+        self.prefetcher.update(self.image_list, self.current_index)
+
+    def toggle_zoom(self):
+        """Alterna entre la miniatura y el visor con zoom a resolución completa."""
+        if self.zoom_var.get():
+            if self.zoom_viewer is None:
+                from zoom_viewer import ZoomViewer
+                self.zoom_viewer = ZoomViewer(self.image_area)
+            self.image_label.pack_forget()
+            self.zoom_viewer.pack(expand=True, fill=tk.BOTH)
+            if self.current_image_path:
+                self.load_zoom_pyramid(self.current_image_path)
+        else:
+            self.zoom_generation += 1  # descartar pirámides en construcción
+            self.zoom_viewer.clear()
+            self.zoom_viewer.pack_forget()
+            self.image_label.pack(expand=True)
+
+    def load_zoom_pyramid(self, file_path):
+        """Abre (o construye en segundo plano) la pirámide de la imagen para el visor con zoom."""
+        self.zoom_generation += 1
+        generation = self.zoom_generation
+        self.zoom_viewer.show_message("Preparando imagen a resolución completa...")
+
+        def build():
+            from pyramid import open_pyramid
+            try:
+                result = open_pyramid(file_path)
+            except Exception as e:
+                print(f"Error generando pirámide: {e}")
+                result = None
+            self.zoom_results.put((generation, result))
+
+        threading.Thread(target=build, name="pyramid", daemon=True).start()
+        self.root.after(SCAN_POLL_MS, self._poll_zoom)
+
+    def _poll_zoom(self):
+        try:
+            generation, pyramid = self.zoom_results.get_nowait()
+        except queue.Empty:
+            self.root.after(SCAN_POLL_MS, self._poll_zoom)
+            return
+        if generation != self.zoom_generation or not self.zoom_var.get():
+            if pyramid is not None:
+                pyramid.close()
+            return
+        if pyramid is None:
+            self.zoom_viewer.show_message("Error cargando imagen")
+        else:
+            self.zoom_viewer.set_pyramid(pyramid)
+
+    def open_current_volume(self, file_path):
+        """Si la imagen es un volumen multi-frame, muestra el control de cortes."""
+        from volume import open_volume
+        self.close_volume()
+        volume = open_volume(file_path)
+        if volume is None:
+            return
+        self.volume = volume
+        self.volume_frames = list(range(volume.frames))
+        # Cortes decodificados en segundo plano alrededor del actual, en una caché propia
+        self.frame_prefetcher = ImagePrefetcher(
+            lambda index: volume.display_image(index, DISPLAY_SIZE),
+            cache=ImageCache(FRAME_CACHE_BYTES), ahead=4, behind=4, max_workers=1)
+        # La vista inicial es la miniatura (corte central), ya en pantalla
+        self.slice_scale.config(to=volume.frames - 1)
+        self.slice_scale.set(volume.frames // 2)
+        self.lbl_slice.config(text=f"Corte {volume.frames // 2 + 1} de {volume.frames}")
+        self.volume_frame.pack(side=tk.BOTTOM, fill=tk.X, after=self.lbl_progress)
+
+    def close_volume(self):
+        if self.volume is None:
+            return
+        self.volume_frame.pack_forget()
+        self.frame_prefetcher.shutdown()
+        self.frame_prefetcher = None
+        self.volume.close()
+        self.volume = None
+        self.volume_frames = []
+        self.mip_var.set(False)
+
+    def show_slice(self, _value=None):
+        """Muestra el corte elegido en el deslizador (o la MIP del volumen)."""
+        if self.volume is None:
+            return
+        from utils import to_photo_image
+        if self.mip_var.get():
+            image = self.volume.mip_image(DISPLAY_SIZE)
+            self.lbl_slice.config(text=f"MIP de {self.volume.frames} cortes")
+        else:
+            index = int(self.slice_scale.get())
+            image = self.frame_prefetcher.get(index)
+            self.frame_prefetcher.update(self.volume_frames, index)
+            self.lbl_slice.config(text=f"Corte {index + 1} de {self.volume.frames}")
+        img = to_photo_image(image)
+        if img:
+            self.photo_image = img
+            self.image_label.config(image=img, text="")
+
+    def _on_slice_wheel(self, event):
+        if self.volume is None or self.mip_var.get():
+            return
+        step = -1 if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0 else 1
+        self.slice_scale.set(min(max(int(self.slice_scale.get()) + step, 0), self.volume.frames - 1))
 
     def next_image(self):
         self.save_current_selection() # Guardar en memoria
         if self.current_index < len(self.image_list) - 1:
-            self.current_index += 1
+            self.current_index = self._skip_duplicates(self.current_index + 1, 1)
             self.load_current_image()
+        elif self.scanner is not None:
+            self.lbl_status.config(text="Aún se están buscando imágenes en la carpeta...")
         else:
             messagebox.showinfo("Fin", "Has llegado a la última imagen de la carpeta.")
 
     def prev_image(self):
         self.save_current_selection() # Guardar en memoria
         if self.current_index > 0:
-            self.current_index -= 1
+            self.current_index = self._skip_duplicates(self.current_index - 1, -1)
             self.load_current_image()
 
+    def _skip_duplicates(self, index, step):
+        """
+        Salta los duplicados que ya recibieron la etiqueta de su grupo. Si no queda
+        ninguna otra imagen en esa dirección, devuelve `index` sin saltar.
+        """
+        if self.duplicates is None or not self.skip_duplicates_var.get():
+            return index
+        candidate = index
+        while 0 <= candidate < len(self.image_list):
+            path = self.image_list[candidate]
+            if self.duplicates.is_first(path) or path not in self.annotations:
+                return candidate
+            candidate += step
+        return index
+
     def save_current_selection(self):
-        """Guarda la selección actual en el diccionario de memoria."""
+        """Guarda la selección actual en el almacén de memoria."""
         if not self.current_image_path:
             return
 
@@ -322,134 +900,309 @@ class MedicalImageApp:
             'diagnostic_utility': self.utility_var.get(),
             'doctor_notes': self.txt_notes.get("1.0", tk.END).strip()
         }
-        self.pending_changes[self.current_image_path] = data
-        self.lbl_status.config(text="Cambios guardados en memoria")
+        if not self.annotations.set_path(self.current_image_path, data):
+            return # Sin cambios: no repetir la entrada en el diario
+        self.journal.append(self.current_image_path, data)
+
+        # La misma etiqueta vale para todo el grupo de casi duplicados
+        group = self.duplicates.group(self.current_image_path) if self.duplicates is not None else None
+        copies = 0
+        for path in group or ():
+            if path != self.current_image_path and self.annotations.set_path(path, data):
+                self.journal.append(path, data)
+                copies += 1
+        if copies:
+            self.lbl_status.config(text=f"Cambios guardados en memoria (también en {copies} duplicadas)")
+        else:
+            self.lbl_status.config(text="Cambios guardados en memoria")
 
     def restore_selection(self):
         """Restaura la selección desde memoria si existe, sino predice."""
-        if self.current_image_path in self.pending_changes:
-            data = self.pending_changes[self.current_image_path]
-            
-            self.study_var.set(data['study_type'])
-            self.laterality_var.set(data['laterality'])
-            self.sharpness_var.set(data['sharpness'])
-            self.illumination_var.set(data['illumination'])
-            self.centering_var.set(data['centering'])
-            self.fov_var.set(data['field_of_view'])
-            self.obstruction_var.set(data['obstructions'])
-            self.quality_var.set(data['quality'])
-            self.utility_var.set(data['diagnostic_utility'])
-            
-            self.txt_notes.delete("1.0", tk.END)
-            self.txt_notes.insert("1.0", data['doctor_notes'])
-            
-            # Restaurar checkboxes de artefactos
-            artifacts = data['artifacts'].split(',')
-            self.art_reflejos.set("Reflejos" in artifacts)
-            self.art_sombras.set("Sombras" in artifacts)
-            self.art_pestanas.set("Pestañas" in artifacts)
-            self.art_parpadeo.set("Parpadeo" in artifacts)
-            self.art_rota.set("Img Rota" in artifacts)
-            
+        data = self.annotations.get_path(self.current_image_path)
+        if data is not None:
+            self.fill_form(data)
             self.lbl_status.config(text="Datos recuperados de memoria")
+        elif self.current_image_path in self.validated_paths and self.load_saved_selection():
+            self.lbl_status.config(text="Imagen ya validada: etiquetas guardadas cargadas")
+        elif self.duplicates is not None and self.duplicates.validated_match(self.current_image_path) \
+                and self.load_saved_selection(self.duplicates.validated_match(self.current_image_path)):
+            self.lbl_status.config(text="Duplicada de una imagen ya validada: etiquetas copiadas. Por favor revise.")
         else:
             self.predict_values()
 
+    def load_saved_selection(self, path=None):
+        """Carga en el formulario las etiquetas guardadas en la BD para `path` (por defecto, la imagen actual)."""
+        from database import load_saved_labels
+        session = self.session()
+        try:
+            data = load_saved_labels(session, path or self.current_image_path)
+        except Exception as e:
+            print(f"Error leyendo etiquetas guardadas: {e}")
+            data = None
+        finally:
+            session.close()
+        if data is None:
+            return False
+        self.fill_form(data)
+        return True
+
+    def fill_form(self, data):
+        """Carga en los controles una selección (guardada o sugerida)."""
+        self.study_var.set(data['study_type'])
+        self.laterality_var.set(data['laterality'])
+        self.sharpness_var.set(data['sharpness'])
+        self.illumination_var.set(data['illumination'])
+        self.centering_var.set(data['centering'])
+        self.fov_var.set(data['field_of_view'])
+        self.obstruction_var.set(data['obstructions'])
+        self.quality_var.set(data['quality'])
+        self.utility_var.set(data['diagnostic_utility'])
+        
+        self.txt_notes.delete("1.0", tk.END)
+        self.txt_notes.insert("1.0", data['doctor_notes'])
+        
+        # Restaurar checkboxes de artefactos
+        artifacts = data['artifacts'].split(',')
+        self.art_reflejos.set("Reflejos" in artifacts)
+        self.art_sombras.set("Sombras" in artifacts)
+        self.art_pestanas.set("Pestañas" in artifacts)
+        self.art_parpadeo.set("Parpadeo" in artifacts)
+        self.art_rota.set("Img Rota" in artifacts)
+
+    @perf.timed('predict')
     def predict_values(self):
         """
-        Simula el autocompletado por IA.
-        Aquí es donde conectarías tu modelo de Machine Learning.
+        Autocompleta el formulario con las sugerencias del predictor, calculadas
+        sobre la miniatura ya decodificada de la imagen actual.
         """
+        from precompute import load_precomputed
+        from predictor import predict_image
+
+        # Sugerencias precalculadas con `python -m sigma precompute`, si existen
+        session = self.session()
+        try:
+            data = load_precomputed(session, self.current_image_path)
+        except Exception as e:
+            print(f"Error leyendo sugerencias precalculadas: {e}")
+            data = None
+        finally:
+            session.close()
+        if data is not None:
+            self.fill_form(data)
+            self.lbl_status.config(text="Sugerencias precalculadas cargadas. Por favor revise.")
+            return
+
+        if self.current_image is None:
+            return
         self.lbl_status.config(text="IA analizando imagen...")
-        
-        # --- LÓGICA DUMMY (A reemplazar por modelo real) ---
-        # En el futuro, aquí cargarías tu modelo y harías model.predict(imagen)
-        predicted_study = random.choice([
-            "Fondo de Ojo (Centrado en Papila)",
-            "Fondo de Ojo (Centrado en Mácula)",
-            "OCT Macular",
-            "OCT Nervio Óptico"
-        ])
-        
-        # Autocompletar GUI con valores por defecto "ideales"
-        self.study_var.set(predicted_study)
-        self.laterality_var.set("Desconocido")
-        
-        self.sharpness_var.set("Adecuada")
-        self.illumination_var.set("Adecuada")
-        self.centering_var.set("Centrada")
-        self.fov_var.set("Completo")
-        self.obstruction_var.set("Ninguna")
-        self.quality_var.set("Aceptable")
-        self.utility_var.set("Util")
-        
-        self.txt_notes.delete("1.0", tk.END)
-        
-        # Resetear checkboxes
-        self.art_reflejos.set(False)
-        self.art_sombras.set(False)
-        self.art_pestanas.set(False)
-        self.art_parpadeo.set(False)
-        self.art_rota.set(False)
-        
+        self.fill_form(predict_image(self.predictor, self.current_image))
         self.lbl_status.config(text="Sugerencias de IA cargadas. Por favor revise.")
 
     def process_batch(self):
-        """Guarda todos los cambios pendientes en la BD y mueve archivos."""
+        """Guarda todos los cambios pendientes en la BD y copia los archivos en segundo plano."""
         self.save_current_selection() # Asegurar que la actual se guarde
         
-        if not self.pending_changes:
+        if self.batch_writer is not None:
+            messagebox.showinfo("Info", "Ya hay un lote guardándose.")
+            return
+
+        if not self.annotations:
             messagebox.showinfo("Info", "No hay cambios pendientes para guardar.")
             return
             
-        if not messagebox.askyesno("Confirmar", f"¿Deseas procesar {len(self.pending_changes)} imágenes?"):
+        if not messagebox.askyesno("Confirmar", f"¿Deseas procesar {len(self.annotations)} imágenes?"):
             return
 
-        session = self.session()
-        count = 0
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        
+        # Se guarda una instantánea: el médico puede seguir etiquetando mientras tanto
+        self.batch_snapshot = self.annotations.snapshot()
+        from batch_writer import BatchWriter
+        self.batch_writer = BatchWriter(self.session, self.batch_snapshot, base_dir).start()
+        self.btn_save_batch.config(state=tk.DISABLED)
+        self._open_batch_dialog(self.batch_writer.total)
+        self.root.after(BATCH_POLL_MS, self._poll_batch)
+
+    def show_stats(self):
+        """Abre (o trae al frente) la ventana con el resumen del etiquetado."""
+        if self.stats_window is not None:
+            self.stats_window.lift()
+            self.refresh_stats()
+            return
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("Estadísticas del etiquetado")
+        self.stats_window.transient(self.root)
+        self.stats_window.protocol("WM_DELETE_WINDOW", self.close_stats)
+        self.txt_stats = tk.Text(self.stats_window, width=60, height=40, font=("Courier", 10))
+        self.txt_stats.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        tk.Button(self.stats_window, text="Actualizar", command=self.refresh_stats).pack(pady=(0, 10))
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        """Lee el resumen de label_stats (unas pocas filas, sin recorrer image_records)."""
+        from stats import format_stats, read_stats
+        session = self.session()
         try:
-            for file_path, data in self.pending_changes.items():
-                # 1. Guardar en BD
-                new_record = ImageRecord(
-                    filename=os.path.basename(file_path),
-                    original_path=file_path,
-                    study_type=data['study_type'],
-                    laterality=data['laterality'],
-                    
-                    # Nuevos campos técnicos
-                    sharpness=data['sharpness'],
-                    illumination=data['illumination'],
-                    centering=data['centering'],
-                    field_of_view=data['field_of_view'],
-                    obstructions=data['obstructions'],
-                    artifacts=data['artifacts'],
-                    
-                    # Valoración global
-                    quality=data['quality'],
-                    diagnostic_utility=data['diagnostic_utility'],
-                    
-                    doctor_notes=data['doctor_notes'],
-                    validation_status="Validated"
-                )
-                session.add(new_record)
-                
-                # 2. Copiar archivo
-                copy_file_based_on_quality(file_path, data['quality'], base_dir)
-                count += 1
-            
-            session.commit()
-            messagebox.showinfo("Éxito", f"Se procesaron {count} imágenes correctamente.")
-            
+            text = "\n".join(format_stats(*read_stats(session)))
+        except Exception as e:
+            print(f"Error leyendo estadísticas: {e}")
+            text = f"No se pudieron leer las estadísticas:\n{e}"
+        finally:
+            session.close()
+        self.txt_stats.config(state=tk.NORMAL)
+        self.txt_stats.delete("1.0", tk.END)
+        self.txt_stats.insert(tk.END, text)
+        self.txt_stats.config(state=tk.DISABLED)
+
+    def close_stats(self):
+        self.stats_window.destroy()
+        self.stats_window = None
+
+    def _open_batch_dialog(self, total):
+        """Ventana con barra de progreso y botón para cancelar el guardado."""
+        self.batch_dialog = tk.Toplevel(self.root)
+        self.batch_dialog.title("Guardando lote")
+        self.batch_dialog.transient(self.root)
+        self.batch_dialog.resizable(False, False)
+        self.batch_dialog.protocol("WM_DELETE_WINDOW", self.cancel_batch)
+
+        self.lbl_batch = tk.Label(self.batch_dialog, text=f"0 de {total} imágenes")
+        self.lbl_batch.pack(padx=20, pady=(15, 5))
+        self.batch_progress = ttk.Progressbar(self.batch_dialog, length=300, maximum=total)
+        self.batch_progress.pack(padx=20, pady=5)
+        self.btn_cancel_batch = tk.Button(self.batch_dialog, text="Cancelar", command=self.cancel_batch)
+        self.btn_cancel_batch.pack(pady=(5, 15))
+
+    def cancel_batch(self):
+        if self.batch_writer is not None:
+            self.batch_writer.cancel()
+            self.btn_cancel_batch.config(state=tk.DISABLED, text="Cancelando...")
+
+    def _poll_batch(self):
+        """Actualiza el progreso del guardado y lo cierra al terminar."""
+        writer = self.batch_writer
+        done = None
+        while not writer.progress.empty():
+            stage, done, total = writer.progress.get_nowait()
+        if done is not None:
+            self.batch_progress.config(value=done, maximum=max(total, 1))
+            self.lbl_batch.config(text=f"{stage}: {done} de {total} imágenes")
+
+        if not writer.finished.is_set():
+            self.root.after(BATCH_POLL_MS, self._poll_batch)
+            return
+
+        result = writer.result
+        self.batch_writer = None
+        self.batch_dialog.destroy()
+        self.btn_save_batch.config(state=tk.NORMAL)
+
+        # Quitar de pendientes sólo lo guardado y que no se haya vuelto a editar
+        self.annotations.discard_saved(self.batch_snapshot, result.saved_paths)
+        self.batch_snapshot = None
+        self.validated_paths.update(result.saved_paths)
+        if self.learner is not None:
+            self.learner.learn(result.saved_paths)
+
+        summary = (f"Insertadas: {result.inserted}\nFallidas: {result.failed}\n"
+                   f"Copias fallidas: {result.copy_failed} (reintentar con 'python copy_engine.py retry')")
+        if result.cancelled:
+            if result.copy_cancelled:
+                summary += f"\nCopias canceladas: {result.copy_cancelled} (quedan pendientes para reintentar)"
+            messagebox.showwarning("Cancelado", f"Guardado cancelado.\n{summary}")
+        elif result.failed or result.copy_failed:
+            messagebox.showerror("Error", f"Ocurrieron errores guardando el lote.\n{summary}\n\n{result.errors[0] if result.errors else ''}")
+        else:
+            messagebox.showinfo("Éxito", f"Se procesaron {result.inserted} imágenes correctamente.")
+
+        # El diario sólo conserva lo que sigue pendiente
+        self.journal.compact(self.annotations, self.folder_path)
+        if self.stats_window is not None:
+            self.refresh_stats()
+
+        if not self.annotations:
             # Limpiar
-            self.pending_changes.clear()
             self.image_list = [] # Vaciar lista porque los archivos se movieron
+            self.close_volume()
+            self.prefetcher.cancel_all()
+            self.prefetcher.cache.clear()
+            self.stop_warming()
+            self.stop_duplicates()
+            self.duplicates = None
+            self.stop_scan()
             self.image_label.config(image="", text="Lote procesado. Cargar nueva carpeta.")
             self.current_image_path = None
-            
-        except Exception as e:
-            session.rollback()
-            messagebox.showerror("Error", f"Ocurrió un error guardando el lote: {e}")
-        finally:
-            session.close()
+        self.lbl_status.config(text=f"Lote guardado: {result.inserted} insertadas, {result.failed} fallidas")
+
+    def offer_session_restore(self):
+        """Ofrece recuperar los cambios sin guardar de una sesión anterior."""
+        folder, changes = self.journal.replay()
+        if not changes:
+            self.journal.clear()
+            return
+        if not messagebox.askyesno(
+                "Sesión anterior",
+                f"Se encontraron {len(changes)} imágenes etiquetadas sin guardar.\n¿Deseas recuperarlas?"):
+            self.journal.clear()
+            return
+
+        restored, moved = self.annotations.restore(changes)
+        # Dejar el diario compacto (y en el formato actual) antes de seguir agregando
+        self.journal.compact(self.annotations, folder)
+        status = f"Recuperadas {restored} imágenes sin guardar"
+        if moved:
+            status += f" ({moved} con valores antiguos movidos a las notas)"
+        self.lbl_status.config(text=status)
+        if folder and os.path.isdir(folder):
+            self.open_folder(folder)
+
+    def stop_warming(self):
+        """Detiene la generación de miniaturas en segundo plano, si está activa."""
+        if self.warm_stop is not None:
+            self.warm_stop.set()
+            self.warm_stop = None
+
+    def toggle_perf_overlay(self):
+        """Muestra u oculta la barra con los tiempos de decodificación y la tasa de aciertos de caché."""
+        self.perf_overlay = not self.perf_overlay
+        if not self.perf_overlay:
+            self.lbl_perf.pack_forget()
+            return
+        perf.enable()
+        self.lbl_perf.pack(side=tk.BOTTOM, fill=tk.X)
+        self._update_perf_overlay()
+
+    def _update_perf_overlay(self):
+        if not self.perf_overlay:
+            return
+
+        def ms(name):
+            value = perf.last(name)
+            return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+        cache = self.prefetcher.cache
+        self.lbl_perf.config(text=(
+            f"Decodificación: {ms('decode')}  Miniatura: {ms('thumbnail')}  PhotoImage: {ms('photoimage')}  "
+            f"Predicción: {ms('predict')}  Caché: {cache.hit_rate() * 100:.0f}% aciertos ({len(cache)} imágenes)"))
+        self.root.after(PERF_POLL_MS, self._update_perf_overlay)
+
+    def on_close(self):
+        """Detiene la precarga en segundo plano y cierra la ventana."""
+        if self.batch_writer is not None and not messagebox.askyesno(
+                "Guardado en curso", "Hay un lote guardándose. ¿Cerrar de todos modos?"):
+            return
+        self.stop_warming()
+        self.stop_duplicates()
+        self.stop_scan()
+        self.stop_watch()
+        if self.ingest is not None:
+            self.ingest.stop()
+        if self.learner is not None:
+            self.learner.stop()
+        self.close_volume()
+        self.prefetcher.shutdown()
+        if self.thumbnail_store is not None:
+            self.thumbnail_store.close()
+        self.journal.close()
+        if self.perf_reporter is not None:
+            self.perf_reporter.stop()
+        self.root.destroy()
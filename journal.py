@@ -0,0 +1,109 @@
+"""
+Diario (journal) de cambios pendientes en formato JSON-lines.
+
+Cada selección guardada en memoria se agrega al final del archivo en O(1).
+Al iniciar la aplicación se reproduce para recuperar la sesión tras un
+cierre inesperado, y se compacta cuando el lote se guarda en la base de datos.
+"""
+import json
+import os
+import time
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pending_changes.journal")
+# Intervalo mínimo entre fsync: acota la pérdida ante un corte de luz sin pagar un fsync por imagen
+FSYNC_INTERVAL = 1.0
+
+class ChangeJournal:
+    """
+    Registro de sólo-agregar de los cambios pendientes (ver annotations.AnnotationStore).
+    Cada línea es {"path": ..., "data": {...}} o {"folder": ...}.
+    """
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._last_sync = 0.0
+
+    def _handle(self):
+        if self._file is None:
+            # Si el último cierre dejó una línea a medias, no pegarle la siguiente entrada
+            needs_newline = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b'\n'
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if needs_newline:
+                self._file.write('\n')
+        return self._file
+
+    def _write(self, record):
+        f = self._handle()
+        f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        f.flush()
+        now = time.monotonic()
+        if self.fsync_interval is not None and now - self._last_sync >= self.fsync_interval:
+            os.fsync(f.fileno())
+            self._last_sync = now
+
+    def append(self, file_path, data):
+        """Registra la selección de una imagen."""
+        self._write({'path': file_path, 'data': data})
+
+    def set_folder(self, folder_path):
+        """Registra la carpeta de trabajo, para reabrirla al restaurar la sesión."""
+        self._write({'folder': folder_path})
+
+    def replay(self):
+        """
+        Reconstruye la sesión desde el diario. Devuelve (carpeta, cambios);
+        la última entrada de cada imagen prevalece. Una última línea truncada
+        (cierre a mitad de escritura) se ignora.
+        """
+        folder = None
+        changes = {}
+        if not os.path.exists(self.path):
+            return folder, changes
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'folder' in record:
+                    folder = record['folder']
+                elif 'path' in record:
+                    changes[record['path']] = record['data']
+        return folder, changes
+
+    def compact(self, pending_changes, folder_path=None):
+        """
+        Reescribe el diario sólo con los cambios aún pendientes (de forma atómica).
+        `pending_changes` es un AnnotationStore o un dict {ruta: datos}.
+        """
+        self.close()
+        if not pending_changes:
+            self.clear()
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if folder_path:
+                f.write(json.dumps({'folder': folder_path}, ensure_ascii=False) + '\n')
+            for file_path, data in pending_changes.items():
+                f.write(json.dumps({'path': file_path, 'data': data}, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Elimina el diario (no quedan cambios pendientes)."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,46 @@
+"""
+Vocabularios de etiquetas usados en la clasificación.
+Son las opciones de los combobox de la GUI y los valores que se guardan en la BD.
+"""
+
+STUDY_TYPES = [
+    "Retinografía",
+    "OCT",
+    "OCTA",
+    "Campimetría",
+    "Fotografía estereoscópica",
+    "Segmento anterior",
+]
+LATERALITIES = ["OD (Derecho)", "OS (Izquierdo)", "No identificado"]
+SHARPNESS = ["Excelente nitidez", "Buena nitidez", "Borroso leve", "Borroso severo / No útil"]
+ILLUMINATION = ["Bien iluminada", "Sobreexpuesta", "Subexpuesta", "Iluminación irregular"]
+CENTERING = ["Correctamente centrada", "Descentrada hacia nasal", "Descentrada hacia temporal", "Mala composición"]
+FIELD_OF_VIEW = ["Campo adecuado", "Campo incompleto", "Demasiado cercano", "Demasiado lejano"]
+OBSTRUCTIONS = ["Ninguna", "Opacidad de medios", "Miodesopsias", "Sangrado/Hemorragia"]
+QUALITY = ["Grado A (Alta calidad)", "Grado B (Limitada)", "No gradable"]
+DIAGNOSTIC_UTILITY = ["Útil para diagnóstico", "Útil con limitaciones", "No útil"]
+ARTIFACTS = ["Reflejos", "Sombras", "Pestañas", "Parpadeo", "Img Rota"]
+
+# Campo de ImageRecord -> vocabulario
+FIELD_VOCABULARIES = {
+    'study_type': STUDY_TYPES,
+    'laterality': LATERALITIES,
+    'sharpness': SHARPNESS,
+    'illumination': ILLUMINATION,
+    'centering': CENTERING,
+    'field_of_view': FIELD_OF_VIEW,
+    'obstructions': OBSTRUCTIONS,
+    'quality': QUALITY,
+    'diagnostic_utility': DIAGNOSTIC_UTILITY,
+}
+
+def artifacts_to_mask(value):
+    """'Reflejos,Sombras' -> máscara de bits según la posición en ARTIFACTS."""
+    mask = 0
+    for name in value.split(','):
+        if name:
+            mask |= 1 << ARTIFACTS.index(name)
+    return mask
+
+def mask_to_artifacts(mask):
+    return ",".join(name for i, name in enumerate(ARTIFACTS) if mask & (1 << i))
@@ -0,0 +1,200 @@
+"""
+Instrumentación de los puntos calientes (decodificación, miniaturas,
+conversión a PhotoImage, guardado en BD, copias y predicción).
+
+Desactivada por defecto: cada `timer()` devuelve entonces un contexto vacío
+compartido y `timed` llama directamente a la función, con un costo de una
+consulta a una variable global. Se activa con la variable de entorno
+SIGMA_PERF=1 (o con `enable()`, p. ej. desde la superposición de la GUI).
+
+Los tiempos se acumulan en histogramas de cubetas logarítmicas (memoria fija)
+de los que se obtienen p50/p95/p99. Con `start_reporting()` se escribe
+periódicamente un resumen por ventana de tiempo en un log JSON-lines
+rotativo (perf_log.jsonl junto al código).
+"""
+import bisect
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_log.jsonl")
+REPORT_INTERVAL = 60.0
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+# Cubetas de 1 µs a ~100 s, 8 por octava (error relativo < 10 %)
+BUCKETS_PER_OCTAVE = 8
+_BUCKET_EDGES = [1e-6 * 2 ** (i / BUCKETS_PER_OCTAVE) for i in range(27 * BUCKETS_PER_OCTAVE)]
+
+_enabled = os.environ.get("SIGMA_PERF", "").lower() in ("1", "true", "yes", "si", "sí")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_last = {}
+
+class Histogram:
+    """Histograma de duraciones (segundos) con cubetas logarítmicas fijas."""
+    def __init__(self):
+        self.buckets = [0] * (len(_BUCKET_EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(_BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Valor aproximado (borde superior de la cubeta) del cuantil `q`."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(_BUCKET_EDGES[i] if i < len(_BUCKET_EDGES) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.50) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+def record(name, seconds):
+    """Registra una duración medida por el llamador."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+        _last[name] = seconds
+
+def count(name, n=1):
+    """Incrementa un contador."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def last(name):
+    """Última duración registrada para `name` (segundos) o None."""
+    return _last.get(name)
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name):
+    """Contexto que mide el bloque: `with perf.timer('decode'): ...`"""
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+def timed(name):
+    """Decorador que mide cada llamada a la función."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def snapshot(reset=False):
+    """Devuelve {'timers': {nombre: resumen}, 'counters': {...}}; con `reset` inicia una ventana nueva."""
+    global _histograms, _counters
+    with _lock:
+        histograms, counters = _histograms, _counters
+        if reset:
+            _histograms, _counters = {}, {}
+        else:
+            counters = dict(counters)
+        timers = {name: h.summary() for name, h in histograms.items()}
+    return {'timers': timers, 'counters': counters}
+
+class PerfReporter:
+    """Hilo que escribe un resumen por ventana en un log JSON-lines rotativo."""
+    def __init__(self, path=DEFAULT_LOG_PATH, interval=REPORT_INTERVAL,
+                 max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.interval = interval
+        self._logger = logging.getLogger("sigma.perf")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(self._handler)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="perf-report", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Escribe el resumen de la ventana actual (si hubo mediciones) y la reinicia."""
+        data = snapshot(reset=True)
+        if not data['timers'] and not data['counters']:
+            return
+        data['ts'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._logger.info(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+def start_reporting(path=DEFAULT_LOG_PATH, interval=REPORT_INTERVAL):
+    """Inicia el log periódico si la instrumentación está activa; devuelve el reporter o None."""
+    if not _enabled:
+        return None
+    return PerfReporter(path, interval)
@@ -0,0 +1,290 @@
+"""
+Detección de imágenes casi duplicadas con un hash perceptual (dHash).
+
+El dHash de 64 bits compara el brillo de celdas vecinas de una grilla 9x8
+calculada con promedios por bloques (NumPy) sobre la miniatura ya reducida:
+dos ráfagas de la misma retina o una copia renombrada/recomprimida difieren en
+pocos bits. Los hashes se guardan en la tabla `image_hashes` junto con el
+tamaño y mtime del archivo, así cada imagen se procesa una sola vez.
+
+La búsqueda por distancia de Hamming usa multi-index hashing: el hash se parte
+en 4 bandas de 16 bits y dos hashes a distancia <= d coinciden en alguna banda
+con a lo sumo d // 4 bits distintos, de modo que cada consulta sólo mira unas
+pocas cubetas en lugar de comparar contra todo el índice.
+
+Las imágenes de una carpeta se agrupan entre sí (unión de pares cercanos) y
+cada grupo se compara además con las imágenes ya validadas en la BD.
+"""
+import itertools
+import os
+import threading
+import numpy as np
+from sqlalchemy import select
+from database import ImageHash, ImageRecord, normalize_path, upsert_rows
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+# Distancia máxima (bits distintos de 64) para considerar dos imágenes duplicadas.
+# Las ráfagas y copias recomprimidas quedan en 0-2; se deja margen sin acercarse
+# a la distancia entre retinografías distintas, que comparten viñeteado y máscara.
+DEFAULT_MAX_DISTANCE = 4
+# Fracción central de la imagen que se usa: el borde negro de la máscara circular
+# es igual en todas las retinografías y sólo restaría bits útiles
+CENTER_CROP = 0.8
+LOOKUP_CHUNK_SIZE = 500
+WRITE_CHUNK_SIZE = 500
+
+def dhash(array):
+    """dHash de 64 bits (int sin signo) de la zona central de una imagen uint8 gris o RGB."""
+    gray = np.asarray(array, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    height, width = gray.shape
+    top, left = int(height * (1 - CENTER_CROP) / 2), int(width * (1 - CENTER_CROP) / 2)
+    gray = gray[top:height - top, left:width - left]
+    height, width = gray.shape
+    if height < 8 or width < 9:
+        raise ValueError("Imagen demasiado pequeña para el hash perceptual")
+    # Promedio por bloques de una grilla de 8 filas x 9 columnas
+    rows = np.linspace(0, height, 9).astype(np.intp)[:-1]
+    cols = np.linspace(0, width, 10).astype(np.intp)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, height)), np.diff(np.append(cols, width)))
+    grid = sums / counts
+    bits = grid[:, 1:] > grid[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def to_signed(value):
+    """Hash sin signo -> BIGINT con signo para la BD."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def _band_variants(max_flips):
+    """Máscaras de 16 bits con a lo sumo `max_flips` bits activos."""
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in itertools.combinations(range(BAND_BITS), flips):
+            masks.append(sum(1 << p for p in positions))
+    return masks
+
+class HashIndex:
+    """Índice multi-banda para buscar hashes a distancia de Hamming acotada."""
+    def __init__(self):
+        self._bands = [{} for _ in range(BANDS)]
+        self._variants = {}
+
+    def add(self, value, item):
+        for band, buckets in enumerate(self._bands):
+            key = (value >> (band * BAND_BITS)) & 0xFFFF
+            buckets.setdefault(key, []).append((value, item))
+
+    def search(self, value, max_distance=DEFAULT_MAX_DISTANCE):
+        """Pares (distancia, item) a distancia <= `max_distance` de `value`, de menor a mayor."""
+        flips = max_distance // BANDS
+        variants = self._variants.get(flips)
+        if variants is None:
+            variants = self._variants[flips] = _band_variants(flips)
+        found = {}
+        for band, buckets in enumerate(self._bands):
+            key = (value >> (band * BAND_BITS)) & 0xFFFF
+            for mask in variants:
+                for other, item in buckets.get(key ^ mask, ()):
+                    if item not in found:
+                        distance = hamming(value, other)
+                        if distance <= max_distance:
+                            found[item] = distance
+        return sorted((distance, item) for item, distance in found.items())
+
+class DuplicateGroups:
+    """
+    Grupos de casi duplicados de una carpeta. `group(path)` devuelve la lista de
+    rutas del grupo (en el orden de la carpeta) o None si la imagen no tiene
+    duplicados; `validated_match(path)` la imagen validada más parecida, si hay.
+    """
+    def __init__(self, groups, matches):
+        self._group_of = {}
+        for members in groups:
+            for path in members:
+                self._group_of[path] = members
+        self._matches = matches
+
+    def __len__(self):
+        return len({id(members) for members in self._group_of.values()})
+
+    def group(self, path):
+        return self._group_of.get(path)
+
+    def validated_match(self, path):
+        members = self._group_of.get(path)
+        return self._matches.get(members[0]) if members else None
+
+    def is_first(self, path):
+        members = self._group_of.get(path)
+        return members is None or members[0] == path
+
+def group_near_duplicates(hashes, validated=None, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    `hashes`: lista de (ruta, hash) de la carpeta, en su orden. `validated`:
+    {ruta: hash} de imágenes ya validadas. Devuelve un DuplicateGroups con los
+    grupos de más de una imagen o con una validada parecida.
+    """
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    index = HashIndex()
+    for i, (_path, value) in enumerate(hashes):
+        for _distance, j in index.search(value, max_distance):
+            a, b = find(i), find(j)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+        index.add(value, i)
+
+    members = {}
+    for i in range(len(hashes)):
+        members.setdefault(find(i), []).append(i)
+
+    validated_index = HashIndex()
+    for path, value in (validated or {}).items():
+        validated_index.add(value, path)
+
+    groups = []
+    matches = {}
+    for indices in members.values():
+        paths = [hashes[i][0] for i in indices]
+        best = None
+        for i in indices:
+            for distance, path in validated_index.search(hashes[i][1], max_distance):
+                if path in paths:
+                    continue  # la misma imagen, ya validada
+                if best is None or distance < best[0]:
+                    best = (distance, path)
+                break
+        if len(paths) > 1 or best is not None:
+            groups.append(paths)
+            if best is not None:
+                matches[paths[0]] = best[1]
+    return DuplicateGroups(groups, matches)
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def load_hashes(session, paths, chunk_size=LOOKUP_CHUNK_SIZE):
+    """{ruta: hash} de las rutas con hash guardado y vigente (mismo tamaño y mtime)."""
+    table = ImageHash.__table__
+    by_key = {normalize_path(path): path for path in paths}
+    keys = list(by_key)
+    found = {}
+    for start in range(0, len(keys), chunk_size):
+        stmt = select(table.c.path_key, table.c.file_size, table.c.file_mtime_ns, table.c.dhash).where(
+            table.c.path_key.in_(keys[start:start + chunk_size]))
+        for key, size, mtime_ns, value in session.execute(stmt):
+            path = by_key[key]
+            if _stamp(path) == (size, mtime_ns):
+                found[path] = to_unsigned(value)
+    return found
+
+def hash_row(path, value):
+    """Fila para `image_hashes`, o None si el archivo ya no existe."""
+    stamp = _stamp(path)
+    if stamp is None:
+        return None
+    return {'path_key': normalize_path(path), 'original_path': path, 'file_size': stamp[0],
+            'file_mtime_ns': stamp[1], 'dhash': to_signed(value)}
+
+def save_hashes(session, items):
+    """Guarda pares (ruta, hash) en `image_hashes`."""
+    rows = [row for row in (hash_row(path, value) for path, value in items) if row is not None]
+    for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+        upsert_rows(session, ImageHash.__table__, rows[start:start + WRITE_CHUNK_SIZE], ['path_key'])
+    session.commit()
+
+def load_validated_hashes(session):
+    """{ruta: hash} de todas las imágenes validadas con hash guardado."""
+    hashes, records = ImageHash.__table__, ImageRecord.__table__
+    stmt = select(records.c.original_path, hashes.c.dhash).join(
+        hashes, hashes.c.path_key == records.c.path_key).where(
+        records.c.validation_status == "Validated")
+    return {path: to_unsigned(value) for path, value in session.execute(stmt)}
+
+def hash_image_file(file_path, loader):
+    """Hash de un archivo decodificado con `loader(ruta)` (imagen PIL), o None."""
+    image = loader(file_path)
+    if image is None:
+        return None
+    try:
+        return dhash(np.asarray(image))
+    except ValueError:
+        return None
+
+class DuplicateFinder:
+    """
+    Busca en segundo plano los casi duplicados de las imágenes de una carpeta.
+    Calcula (y guarda) los hashes que falten con `loader`, que normalmente lee
+    de la caché de miniaturas. El resultado queda en `self.result`.
+    """
+    def __init__(self, session_factory, paths, loader, max_distance=DEFAULT_MAX_DISTANCE):
+        self.session_factory = session_factory
+        self.paths = list(paths)
+        self.loader = loader
+        self.max_distance = max_distance
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="duplicates", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Ejecuta la búsqueda en el hilo actual."""
+        self._run()
+        return self.result
+
+    def _run(self):
+        try:
+            session = self.session_factory()
+            try:
+                known = load_hashes(session, self.paths)
+                new = []
+                for path in self.paths:
+                    if self._stop.is_set():
+                        return
+                    if path not in known:
+                        value = hash_image_file(path, self.loader)
+                        if value is not None:
+                            known[path] = value
+                            new.append((path, value))
+                    if len(new) >= WRITE_CHUNK_SIZE:
+                        save_hashes(session, new)
+                        new = []
+                save_hashes(session, new)
+                validated = load_validated_hashes(session)
+            finally:
+                session.close()
+            hashes = [(path, known[path]) for path in self.paths if path in known]
+            self.result = group_near_duplicates(hashes, validated, self.max_distance)
+        except Exception as e:
+            self.error = e
+            print(f"Error buscando duplicados: {e}")
+        finally:
+            self.finished.set()
@@ -0,0 +1,204 @@
+"""
+Preclasificación sin interfaz gráfica de carpetas completas.
+
+Reparte las imágenes entre procesos (`ProcessPoolExecutor`): cada uno
+decodifica la imagen, calcula sus características y sugerencias y genera
+la miniatura. El proceso principal guarda las miniaturas en la caché en
+disco y escribe por bloques las sugerencias en `image_predictions` y el hash
+perceptual de cada miniatura en `image_hashes` (ver phash.py).
+Las imágenes que no cambiaron desde la última ejecución se omiten.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sqlalchemy import select
+from database import ImagePrediction, normalize_path
+from predictor import FEATURE_NAMES, compute_features, load_predictor
+from scanner import iter_images
+
+WRITE_CHUNK_SIZE = 500
+LABEL_FIELDS = ['study_type', 'laterality', 'sharpness', 'illumination', 'centering',
+                'field_of_view', 'artifacts', 'obstructions', 'quality', 'diagnostic_utility']
+
+_worker_predictor = None
+
+def _init_worker():
+    global _worker_predictor
+    _worker_predictor = load_predictor()
+
+def process_image(file_path, max_size=(500, 500)):
+    """
+    Trabajo de cada proceso: decodifica, calcula características y sugerencias.
+    Devuelve (fila para image_predictions, miniatura uint8 RGB) o (None, None).
+    """
+    from utils import decode_image_for_display
+
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None, None
+    image = decode_image_for_display(file_path, max_size)
+    if image is None:
+        return None, None
+
+    thumbnail = np.asarray(image.convert('RGB'))
+    return prediction_row(file_path, st, thumbnail, _worker_predictor), thumbnail
+
+def prediction_row(file_path, st, thumbnail, predictor):
+    """Fila para image_predictions a partir de la miniatura uint8 RGB y el `os.stat` del archivo."""
+    features = compute_features(thumbnail)
+    prediction = predictor.predict(features)
+
+    row = {'path_key': normalize_path(file_path), 'original_path': file_path,
+           'file_size': st.st_size, 'file_mtime_ns': st.st_mtime_ns}
+    row.update({f'f_{name}': features[name] for name in FEATURE_NAMES})
+    row.update({field: prediction[field] for field in LABEL_FIELDS})
+    return row
+
+def thumbnail_hash_row(file_path, thumbnail):
+    """Fila para image_hashes con el dHash de la miniatura, o None."""
+    from phash import dhash, hash_row
+
+    try:
+        return hash_row(file_path, dhash(thumbnail))
+    except ValueError:
+        return None  # miniatura demasiado pequeña
+
+def save_results(session_factory, rows, hash_rows):
+    """Guarda (upsert) sugerencias y hashes en una transacción."""
+    from database import ImageHash, upsert_rows
+
+    session = session_factory()
+    try:
+        upsert_rows(session, ImagePrediction.__table__, rows, ['path_key'])
+        upsert_rows(session, ImageHash.__table__, hash_rows, ['path_key'])
+        session.commit()
+    finally:
+        session.close()
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def find_up_to_date(session, paths):
+    """Rutas cuya predicción ya existe para el mismo tamaño y mtime del archivo."""
+    table = ImagePrediction.__table__
+    by_key = {normalize_path(path): path for path in paths}
+    known = {}
+    for chunk in _chunks(list(by_key), WRITE_CHUNK_SIZE):
+        stmt = select(table.c.path_key, table.c.file_size, table.c.file_mtime_ns).where(
+            table.c.path_key.in_(chunk))
+        for key, size, mtime_ns in session.execute(stmt):
+            known[by_key[key]] = (size, mtime_ns)
+
+    fresh = set()
+    for path, stamp in known.items():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stamp == (st.st_size, st.st_mtime_ns):
+            fresh.add(path)
+    return fresh
+
+def precompute_folder(session_factory, folder, recursive=True, workers=None, thumbnail_store=None,
+                      force=False, on_progress=None):
+    """Precalcula las sugerencias de todas las imágenes de `folder`. Devuelve (procesadas, fallidas)."""
+    paths = list(iter_images(folder, recursive=recursive))
+    if not force:
+        session = session_factory()
+        try:
+            fresh = find_up_to_date(session, paths)
+        finally:
+            session.close()
+        paths = [p for p in paths if p not in fresh]
+
+    done = failed = 0
+    pending_rows = []
+    hash_rows = []
+
+    def flush():
+        save_results(session_factory, pending_rows, hash_rows)
+        pending_rows.clear()
+        hash_rows.clear()
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # chunksize reparte el trabajo en paquetes para amortizar la comunicación entre procesos
+        chunksize = max(1, min(64, len(paths) // (workers * 4) or 1))
+        for path, (row, thumbnail) in zip(paths, executor.map(process_image, paths, chunksize=chunksize)):
+            if row is None:
+                failed += 1
+            else:
+                pending_rows.append(row)
+                hashed = thumbnail_hash_row(path, thumbnail)
+                if hashed is not None:
+                    hash_rows.append(hashed)
+                if thumbnail_store is not None:
+                    thumbnail_store.put(path, thumbnail)
+                if len(pending_rows) >= WRITE_CHUNK_SIZE:
+                    flush()
+            done += 1
+            if on_progress is not None:
+                on_progress(done, len(paths))
+    if pending_rows:
+        flush()
+    return done - failed, failed
+
+def _suggestion(row):
+    """Datos del formulario de una fila de image_predictions, o None si el archivo cambió."""
+    try:
+        st = os.stat(row['original_path'])
+    except OSError:
+        return None
+    if (row['file_size'], row['file_mtime_ns']) != (st.st_size, st.st_mtime_ns):
+        return None
+    data = {field: row[field] or "" for field in LABEL_FIELDS}
+    data['doctor_notes'] = ""
+    return data
+
+def load_precomputed(session, file_path):
+    """
+    Devuelve las sugerencias precalculadas de `file_path` (dict con los campos
+    del formulario) si siguen vigentes para el archivo actual, o None.
+    """
+    table = ImagePrediction.__table__
+    row = session.execute(
+        select(table).where(table.c.path_key == normalize_path(file_path))).mappings().first()
+    return None if row is None else _suggestion(row)
+
+def load_precomputed_many(session, paths):
+    """{ruta: sugerencias} de las rutas de `paths` con sugerencias vigentes (consultas por bloques)."""
+    table = ImagePrediction.__table__
+    by_key = {normalize_path(path): path for path in paths}
+    found = {}
+    for chunk in _chunks(list(by_key), WRITE_CHUNK_SIZE):
+        for row in session.execute(select(table).where(table.c.path_key.in_(chunk))).mappings():
+            data = _suggestion(row)
+            if data is not None:
+                found[by_key[row['path_key']]] = data
+    return found
+
+def run(session_factory, folder, recursive=True, workers=None, use_thumbnails=True, force=False):
+    """Ejecución desde línea de comandos con informe de progreso."""
+    from thumbcache import ThumbnailStore
+
+    store = ThumbnailStore() if use_thumbnails else None
+    start = time.perf_counter()
+    last_report = [0.0]
+
+    def report(done, total):
+        now = time.perf_counter()
+        if now - last_report[0] >= 2 or done == total:
+            last_report[0] = now
+            rate = done / max(now - start, 1e-6)
+            print(f"  {done}/{total} imágenes ({rate:.1f}/s)")
+
+    try:
+        ok, failed = precompute_folder(session_factory, folder, recursive, workers, store, force, report)
+    finally:
+        if store is not None:
+            store.close()
+    print(f"✅ Precalculadas {ok} imágenes ({failed} con error) en {time.perf_counter() - start:.1f} s")
+    return ok, failed
@@ -0,0 +1,323 @@
+"""
+Predicción de la calidad técnica de una imagen.
+
+Calcula características vectorizadas sobre la miniatura ya decodificada
+(nitidez por varianza del Laplaciano, exposición por histograma, centrado
+por centroide y cobertura de la máscara de campo de visión) y las traduce
+a los vocabularios de `labels`. Si existe un modelo entrenado con
+scikit-learn sobre los `ImageRecord` validados se usa en su lugar:
+    python predictor.py train
+"""
+import os
+import pickle
+import sys
+import numpy as np
+import labels
+
+try:
+    import cv2
+except ImportError:  # OpenCV es opcional: hay una versión en NumPy
+    cv2 = None
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quality_model.pkl")
+
+FEATURE_NAMES = [
+    'sharpness', 'brightness', 'clipped_high', 'clipped_low', 'uniformity',
+    'center_dx', 'center_dy', 'fov_coverage', 'colorfulness', 'aspect_ratio', 'disc_dx',
+]
+
+# Umbrales heurísticos (miniaturas de ~500 px); el modelo entrenado los reemplaza
+SHARPNESS_THRESHOLDS = (150.0, 60.0, 20.0)
+FOV_THRESHOLD = 20
+UNDEREXPOSED = 60
+OVEREXPOSED = 190
+CLIPPED_LIMIT = 0.05
+UNIFORMITY_LIMIT = 0.45
+CENTER_TOLERANCE = 0.12
+DISC_OFFSET = 0.1
+
+def _laplacian_variance(gray):
+    """Varianza del Laplaciano (medida clásica de enfoque)."""
+    if cv2 is not None:
+        return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    lap = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+           - 4.0 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+def compute_features(array):
+    """
+    Calcula las características de calidad de una imagen uint8
+    (gris (alto, ancho) o color (alto, ancho, 3)). Devuelve un dict de floats.
+    """
+    array = np.asarray(array)
+    if array.ndim == 3:
+        rgb = array[..., :3].astype(np.float32)
+        gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        colorfulness = float(np.abs(rgb[..., 0] - rgb[..., 1]).mean() + np.abs(rgb[..., 1] - rgb[..., 2]).mean())
+    else:
+        gray = array.astype(np.float32)
+        colorfulness = 0.0
+    height, width = gray.shape
+
+    # Máscara del campo de visión: el fondo de ojo está rodeado de negro
+    mask = gray > FOV_THRESHOLD
+    coverage = float(mask.mean())
+    inside = gray[mask] if coverage > 0 else gray.ravel()
+
+    hist = np.bincount(inside.astype(np.uint8).ravel(), minlength=256)
+    total = max(int(hist.sum()), 1)
+    brightness = float(inside.mean())
+    clipped_high = float(hist[250:].sum() / total)
+    clipped_low = float(hist[:FOV_THRESHOLD + 10].sum() / total)
+
+    # Uniformidad: dispersión del brillo medio dentro del campo en una rejilla 4x4
+    bh, bw = height // 4, width // 4
+    uniformity = 0.0
+    if bh and bw:
+        block_mask = mask[:bh * 4, :bw * 4].reshape(4, bh, 4, bw).sum(axis=(1, 3))
+        block_sum = (gray[:bh * 4, :bw * 4] * mask[:bh * 4, :bw * 4]).reshape(4, bh, 4, bw).sum(axis=(1, 3))
+        valid = block_mask > (bh * bw) // 2
+        if valid.sum() >= 2:
+            blocks = block_sum[valid] / block_mask[valid]
+            uniformity = float(blocks.std() / (blocks.mean() + 1e-6))
+
+    # Centrado: centroide de la máscara respecto al centro de la imagen
+    ys, xs = np.nonzero(mask)
+    if len(xs):
+        center_dx = float(xs.mean() / width - 0.5)
+        center_dy = float(ys.mean() / height - 0.5)
+    else:
+        center_dx = center_dy = 0.0
+
+    # Papila: zona más brillante (1% superior); su lado sugiere la lateralidad
+    if inside.size:
+        cutoff = np.percentile(inside, 99)
+        bys, bxs = np.nonzero(gray >= cutoff)
+        disc_dx = float(bxs.mean() / width - 0.5) if len(bxs) else 0.0
+    else:
+        disc_dx = 0.0
+
+    return {
+        'sharpness': _laplacian_variance(gray),
+        'brightness': brightness,
+        'clipped_high': clipped_high,
+        'clipped_low': clipped_low,
+        'uniformity': uniformity,
+        'center_dx': center_dx,
+        'center_dy': center_dy,
+        'fov_coverage': coverage,
+        'colorfulness': colorfulness,
+        'aspect_ratio': float(width / height) if height else 1.0,
+        'disc_dx': disc_dx,
+    }
+
+def features_vector(features):
+    return [features[name] for name in FEATURE_NAMES]
+
+class RulePredictor:
+    """Traduce las características a etiquetas con umbrales fijos."""
+
+    def predict(self, features):
+        f = features
+        excellent, good, mild = SHARPNESS_THRESHOLDS
+        if f['sharpness'] >= excellent:
+            sharpness = labels.SHARPNESS[0]
+        elif f['sharpness'] >= good:
+            sharpness = labels.SHARPNESS[1]
+        elif f['sharpness'] >= mild:
+            sharpness = labels.SHARPNESS[2]
+        else:
+            sharpness = labels.SHARPNESS[3]
+
+        if f['brightness'] > OVEREXPOSED or f['clipped_high'] > CLIPPED_LIMIT:
+            illumination = labels.ILLUMINATION[1]
+        elif f['brightness'] < UNDEREXPOSED:
+            illumination = labels.ILLUMINATION[2]
+        elif f['uniformity'] > UNIFORMITY_LIMIT:
+            illumination = labels.ILLUMINATION[3]
+        else:
+            illumination = labels.ILLUMINATION[0]
+
+        if f['disc_dx'] > DISC_OFFSET:
+            laterality = labels.LATERALITIES[0]
+        elif f['disc_dx'] < -DISC_OFFSET:
+            laterality = labels.LATERALITIES[1]
+        else:
+            laterality = labels.LATERALITIES[2]
+
+        if abs(f['center_dy']) > CENTER_TOLERANCE:
+            centering = labels.CENTERING[3]
+        elif abs(f['center_dx']) > CENTER_TOLERANCE:
+            # La papila está del lado nasal: desplazamiento hacia ella = nasal
+            towards_disc = (f['center_dx'] > 0) == (f['disc_dx'] > 0)
+            centering = labels.CENTERING[1] if towards_disc else labels.CENTERING[2]
+        else:
+            centering = labels.CENTERING[0]
+
+        if f['fov_coverage'] > 0.97:
+            field_of_view = labels.FIELD_OF_VIEW[2]
+        elif f['fov_coverage'] < 0.25:
+            field_of_view = labels.FIELD_OF_VIEW[1]
+        elif f['fov_coverage'] < 0.45:
+            field_of_view = labels.FIELD_OF_VIEW[3]
+        else:
+            field_of_view = labels.FIELD_OF_VIEW[0]
+
+        artifacts = []
+        if f['clipped_high'] > CLIPPED_LIMIT / 2:
+            artifacts.append("Reflejos")
+        if f['clipped_low'] > 0.1 and f['fov_coverage'] > 0.25:
+            artifacts.append("Sombras")
+
+        # Conclusión: puntuación sencilla a partir de los criterios técnicos
+        problems = (labels.SHARPNESS.index(sharpness) >= 2) + (illumination != labels.ILLUMINATION[0]) \
+            + (centering != labels.CENTERING[0]) + (field_of_view != labels.FIELD_OF_VIEW[0])
+        if sharpness == labels.SHARPNESS[3] or problems >= 3:
+            quality, utility = labels.QUALITY[2], labels.DIAGNOSTIC_UTILITY[2]
+        elif problems:
+            quality, utility = labels.QUALITY[1], labels.DIAGNOSTIC_UTILITY[1]
+        else:
+            quality, utility = labels.QUALITY[0], labels.DIAGNOSTIC_UTILITY[0]
+
+        if f['colorfulness'] > 8:
+            study_type = labels.STUDY_TYPES[0]  # Retinografía
+        else:
+            study_type = labels.STUDY_TYPES[1]  # OCT (escala de grises)
+
+        return {
+            'study_type': study_type,
+            'laterality': laterality,
+            'sharpness': sharpness,
+            'illumination': illumination,
+            'centering': centering,
+            'field_of_view': field_of_view,
+            'artifacts': ",".join(artifacts),
+            'obstructions': labels.OBSTRUCTIONS[0],
+            'quality': quality,
+            'diagnostic_utility': utility,
+            'doctor_notes': "",
+        }
+
+def forest_predict(forest, x):
+    """
+    Etiquetas predichas por un bosque de scikit-learn para una sola fila `x`
+    (array float32 de forma (1, n)), una por salida. Promedia las probabilidades
+    de cada árbol como `predict`, pero sin su validación ni el paralelismo de
+    joblib, que con una sola imagen cuestan más que los árboles.
+    """
+    total = 0
+    for tree in forest.estimators_:
+        value = tree.tree_.value[tree.tree_.apply(x)[0]]  # hoja de x: (salidas, clases)
+        total = total + value / value.sum(axis=1, keepdims=True)
+    classes = forest.classes_ if forest.n_outputs_ > 1 else [forest.classes_]
+    return [labels_[total[k, :len(labels_)].argmax()] for k, labels_ in enumerate(classes)]
+
+class SklearnPredictor:
+    """
+    Usa un bosque de scikit-learn multi-salida (una salida por campo), entrenado
+    con los registros validados. Los campos sin modelo se completan con las
+    reglas. Acepta también el formato anterior (un clasificador por campo).
+    Predice en un solo hilo: se llama imagen por imagen (desde la GUI o desde
+    procesos del pool de precompute) y lanzar hilos de joblib cuesta más que
+    la predicción.
+    """
+    def __init__(self, models):
+        if 'model' in models and 'fields' in models:
+            self.fields = models['fields']
+            self.models = {None: models['model']}
+        else:
+            self.fields = None
+            self.models = models
+        for model in self.models.values():
+            if hasattr(model, 'n_jobs'):
+                model.n_jobs = 1
+        self.rules = RulePredictor()
+
+    def predict(self, features):
+        result = self.rules.predict(features)
+        x = np.array([features_vector(features)], dtype=np.float32)
+        if self.fields is not None:
+            result.update(zip(self.fields, self._predict(self.models[None], x)))
+            return result
+        for field, model in self.models.items():
+            result[field] = self._predict(model, x)[0]
+        return result
+
+    @staticmethod
+    def _predict(model, x):
+        if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+            return forest_predict(model, x)
+        prediction = model.predict(x)[0]
+        return prediction if np.ndim(prediction) else [prediction]
+
+def load_predictor(model_path=DEFAULT_MODEL_PATH):
+    """Devuelve el predictor entrenado si existe, o el de reglas."""
+    if os.path.exists(model_path):
+        try:
+            with open(model_path, 'rb') as f:
+                return SklearnPredictor(pickle.load(f))
+        except Exception as e:
+            print(f"Error cargando modelo {model_path}: {e}")
+    return RulePredictor()
+
+def predict_image(predictor, image):
+    """Predice las etiquetas de una imagen PIL o array ya reducido."""
+    return predictor.predict(compute_features(np.asarray(image)))
+
+def train_from_records(session_factory, model_path=DEFAULT_MODEL_PATH, loader=None, min_samples=20):
+    """
+    Entrena un RandomForest multi-salida (una salida por campo) con los
+    ImageRecord validados y lo guarda en `model_path`. Devuelve el número de
+    muestras usadas.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from database import ImageRecord
+    if loader is None:
+        from utils import decode_image_for_display as loader
+
+    session = session_factory()
+    try:
+        records = session.query(ImageRecord).filter(ImageRecord.validation_status == "Validated").all()
+    finally:
+        session.close()
+
+    X = []
+    targets = {field: [] for field in labels.FIELD_VOCABULARIES}
+    for record in records:
+        image = loader(record.original_path)
+        if image is None:
+            continue
+        X.append(features_vector(compute_features(np.asarray(image))))
+        for field in targets:
+            targets[field].append(getattr(record, field) or "")
+
+    if len(X) < min_samples:
+        print(f"Se necesitan al menos {min_samples} imágenes validadas (hay {len(X)}).")
+        return len(X)
+
+    X = np.array(X, dtype=np.float32)
+    fields = [field for field, y in targets.items() if len(set(y)) >= 2]
+    if not fields:
+        print("Las imágenes validadas no tienen etiquetas distintas para entrenar.")
+        return len(X)
+    Y = np.array([targets[field] for field in fields], dtype=object).T
+    # Entrenar en paralelo; al guardarlo queda en un hilo (ver SklearnPredictor)
+    model = RandomForestClassifier(n_estimators=100, max_depth=8, n_jobs=-1, random_state=0)
+    model.fit(X, Y if len(fields) > 1 else Y[:, 0])
+    model.n_jobs = 1
+
+    with open(model_path, 'wb') as f:
+        pickle.dump({'fields': fields, 'model': model}, f)
+    return len(X)
+
+def main(argv):
+    if len(argv) != 2 or argv[1] != "train":
+        print("Uso: python predictor.py train")
+        return 1
+    from database import init_db
+    samples = train_from_records(init_db())
+    print(f"✅ Modelo entrenado con {samples} imágenes en {DEFAULT_MODEL_PATH}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,155 @@
+"""
+Precarga en segundo plano de imágenes y caché LRU de imágenes listas para mostrar.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+def image_nbytes(image):
+    """Estima la memoria ocupada por una imagen PIL decodificada."""
+    if image is None:
+        return 0
+    return image.width * image.height * len(image.getbands())
+
+class ImageCache:
+    """
+    Caché LRU de imágenes decodificadas, limitada por tamaño en bytes.
+    Es segura para usarse desde varios hilos.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Devuelve la imagen en caché (marcándola como reciente) o None."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, image):
+        """Guarda una imagen y expulsa las menos recientes si se supera el límite."""
+        size = image_nbytes(image)
+        if image is None or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._items[key] = (image, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._items:
+                _key, (_image, old_size) = self._items.popitem(last=False)
+                self.current_bytes -= old_size
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def hit_rate(self):
+        """Proporción de aciertos desde la creación de la caché."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class ImagePrefetcher:
+    """
+    Decodifica en un pool de hilos las imágenes vecinas a la actual
+    (las N siguientes y las M anteriores de la lista) para que la navegación
+    encuentre la imagen ya lista en la caché.
+    """
+    def __init__(self, loader, cache=None, ahead=3, behind=1, max_workers=2):
+        self.loader = loader
+        self.cache = cache if cache is not None else ImageCache()
+        self.ahead = ahead
+        self.behind = behind
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="prefetch")
+        self._futures = {}
+        self._wanted = set()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Devuelve la imagen lista para mostrar. Si hay una decodificación en curso
+        la espera; si no, decodifica de forma síncrona.
+        """
+        image = self.cache.get(path)
+        if image is not None:
+            return image
+
+        with self._lock:
+            future = self._futures.get(path)
+        if future is not None:
+            try:
+                image = future.result()
+            except CancelledError:
+                image = None
+            if image is not None:
+                return image
+
+        image = self.loader(path)
+        self.cache.put(path, image)
+        return image
+
+    def update(self, image_list, index):
+        """
+        Programa la decodificación de la ventana alrededor de `index` y cancela
+        el trabajo pendiente de imágenes que ya quedaron fuera de ella.
+        """
+        start = max(0, index - self.behind)
+        end = min(len(image_list), index + self.ahead + 1)
+        # Priorizar las siguientes, luego las anteriores
+        order = list(range(index + 1, end)) + list(range(index - 1, start - 1, -1))
+        window = [image_list[i] for i in order]
+
+        with self._lock:
+            self._wanted = set(window)
+            for path, future in list(self._futures.items()):
+                if future.done():
+                    del self._futures[path]
+                elif path not in self._wanted:
+                    future.cancel()
+                    del self._futures[path]
+
+            for path in window:
+                if path in self._futures or path in self.cache:
+                    continue
+                self._futures[path] = self._executor.submit(self._decode, path)
+
+    def cancel_all(self):
+        """Cancela toda la precarga pendiente (por ejemplo al cambiar de carpeta)."""
+        with self._lock:
+            self._wanted = set()
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+
+    def _decode(self, path):
+        # Si el usuario ya se alejó de esta imagen antes de empezar, no decodificar
+        with self._lock:
+            if path not in self._wanted:
+                return None
+        image = self.loader(path)
+        self.cache.put(path, image)
+        return image
@@ -0,0 +1,143 @@
+"""
+Pirámide multi-resolución de una imagen para el visor con zoom.
+
+Se construye una sola vez por imagen a partir de la decodificación a
+resolución completa: el nivel 0 es la imagen original y cada nivel siguiente
+la mitad del anterior, hasta que cabe en una tesela. Cada nivel se guarda en
+disco como .npy (pyramid_cache/ junto al código) y se abre con
+`np.load(mmap_mode='r')`, de modo que el visor lee sólo las teselas visibles
+sin volver a decodificar. La caché se recorta por antigüedad de uso.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from PIL import Image
+import perf
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyramid_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+TILE_SIZE = 256
+
+def pyramid_key(file_path):
+    """Clave de la pirámide: ruta, tamaño y fecha de modificación del archivo."""
+    from database import normalize_path
+    stat = os.stat(file_path)
+    raw = f"{normalize_path(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+def decode_full_resolution(file_path):
+    """Decodifica la imagen completa a uint8 (gris o RGB) con ventana/nivel si es DICOM."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ('.dcm', '.dicom', ''):
+        import pydicom
+        from utils import dicom_to_display_array
+        from volume import DEFER_SIZE, DicomVolume, number_of_frames
+
+        ds = pydicom.dcmread(file_path, defer_size=DEFER_SIZE)
+        full_size = (int(ds.Columns), int(ds.Rows))
+        if number_of_frames(ds) > 1:
+            volume = DicomVolume(file_path, ds)
+            try:
+                return volume.display_frame(volume.frames // 2, full_size)
+            finally:
+                volume.close()
+        return dicom_to_display_array(ds, full_size)
+
+    with Image.open(file_path) as image:
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('L' if image.mode in ('1', 'I', 'I;16', 'F') else 'RGB')
+        return np.asarray(image)
+
+class ImagePyramid:
+    """Niveles de una pirámide ya construida, mapeados en memoria."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.tile_size = meta['tile_size']
+        self.levels = [np.load(os.path.join(directory, f"level_{i}.npy"), mmap_mode='r')
+                       for i in range(meta['levels'])]
+        # Marca de uso para el recorte de la caché
+        os.utime(directory)
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    def level_for_scale(self, scale):
+        """
+        Nivel más pequeño que sigue teniendo al menos `scale` píxeles por píxel de
+        pantalla; devuelve (nivel, escala a aplicar a ese nivel).
+        """
+        level = 0
+        while level + 1 < len(self.levels) and scale * (2 ** (level + 1)) <= 1.0:
+            level += 1
+        return level, scale * (2 ** level)
+
+    def tile(self, level, tx, ty):
+        """Tesela (tx, ty) del nivel: vista de a lo sumo tile_size x tile_size."""
+        size = self.tile_size
+        return self.levels[level][ty * size:(ty + 1) * size, tx * size:(tx + 1) * size]
+
+    def tile_counts(self, level):
+        height, width = self.levels[level].shape[:2]
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def close(self):
+        self.levels = []
+
+def build_pyramid(file_path, directory, tile_size=TILE_SIZE):
+    """Decodifica `file_path` una vez y escribe sus niveles en `directory`."""
+    array = decode_full_resolution(file_path)
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    level = 0
+    while True:
+        np.save(os.path.join(tmp, f"level_{level}.npy"), np.ascontiguousarray(array))
+        level += 1
+        if max(array.shape[:2]) <= tile_size:
+            break
+        # Reducción 2x por promedio de bloques (rápida y sin aliasing)
+        array = np.asarray(Image.fromarray(array).reduce(2))
+    with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({'levels': level, 'tile_size': tile_size, 'source': file_path}, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+def prune_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, keep=None):
+    """Borra las pirámides usadas hace más tiempo hasta quedar bajo `max_bytes`."""
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.is_dir() or entry.name.endswith(".tmp"):
+            continue
+        size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+        entries.append((entry.stat().st_mtime, size, entry.path))
+        total += size
+    entries.sort()
+    for _mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def open_pyramid(file_path, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """Devuelve la pirámide de `file_path`, construyéndola si no está en la caché."""
+    directory = os.path.join(cache_dir, pyramid_key(file_path))
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        os.makedirs(cache_dir, exist_ok=True)
+        started = time.perf_counter()
+        build_pyramid(file_path, directory)
+        perf.record('pyramid.build', time.perf_counter() - started)
+        prune_cache(cache_dir, max_bytes, keep=directory)
+    return ImagePyramid(directory)
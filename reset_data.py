@@ -13,24 +13,37 @@ def reset_project():
     else:
         print(f"ℹ️ No se encontró la base de datos '{db_file}'.")
 
-    # 2. Borrar la carpeta de imágenes clasificadas
-    # NOTA: Como ahora el programa COPIA las imágenes, borrar esta carpeta es seguro.
-    # Las imágenes originales en tu carpeta de origen NO se tocarán.
-    
+    # 2. Borrar las carpetas de calidad de Clasificadas/
+    # Son sólo enlaces a los archivos de Clasificadas/.blobs (ver blobstore.py):
+    # borrarlas no toca los datos. Las imágenes originales NO se tocarán.
     classified_dir = "Clasificadas"
     if os.path.exists(classified_dir):
-        response = input(f"⚠️ ¿Estás seguro de que quieres borrar la carpeta '{classified_dir}' y todo su contenido? (s/n): ")
+        response = input(f"⚠️ ¿Estás seguro de que quieres borrar las carpetas de calidad de '{classified_dir}'? (s/n): ")
         if response.lower() == 's':
             try:
-                shutil.rmtree(classified_dir)
-                print(f"✅ Carpeta '{classified_dir}' eliminada.")
+                from blobstore import remove_views
+                removed = remove_views(classified_dir)
+                print(f"✅ Carpetas de calidad eliminadas ({removed} enlaces).")
             except Exception as e:
-                print(f"❌ Error eliminando carpeta: {e}")
+                print(f"❌ Error eliminando carpetas: {e}")
         else:
             print("ℹ️ Operación cancelada para la carpeta de imágenes.")
     else:
         print(f"ℹ️ No se encontró la carpeta '{classified_dir}'.")
 
+    # 3. Borrar el almacén de archivos (con enlaces duros, los originales siguen intactos)
+    blobs_dir = os.path.join(classified_dir, ".blobs")
+    if os.path.exists(blobs_dir):
+        response = input(f"⚠️ ¿Borrar también el almacén '{blobs_dir}'? Volver a clasificar tendrá que copiar de nuevo (s/n): ")
+        if response.lower() == 's':
+            try:
+                shutil.rmtree(blobs_dir)
+                print(f"✅ Almacén '{blobs_dir}' eliminado.")
+            except Exception as e:
+                print(f"❌ Error eliminando almacén: {e}")
+        else:
+            print("ℹ️ Se conserva el almacén de archivos.")
+
     print("\n✨ Proyecto limpio. Listo para entregar.")
 
 if __name__ == "__main__":
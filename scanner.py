@@ -0,0 +1,161 @@
+"""
+Escaneo incremental de carpetas de imágenes.
+
+Recorre el árbol con `os.scandir` (opcionalmente recursivo), reconoce las
+imágenes por extensión o por la firma DICOM ('DICM' tras el preámbulo de
+128 bytes) y entrega las rutas en orden natural y por lotes, para que la
+interfaz pueda mostrar la primera imagen mientras sigue la enumeración.
+"""
+import os
+import queue
+import re
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.dcm', '.dicom')
+DICOM_PREAMBLE_SIZE = 128
+DICOM_MAGIC = b'DICM'
+
+_DIGITS = re.compile(r'(\d+)')
+
+def natural_key(name):
+    """Clave de orden natural: 'img2' va antes que 'img10'."""
+    return [int(part) if part.isdigit() else part.lower() for part in _DIGITS.split(name)]
+
+def is_dicom_file(file_path):
+    """Comprueba la firma 'DICM' de un archivo DICOM Part 10."""
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(DICOM_PREAMBLE_SIZE + len(DICOM_MAGIC))
+        return header[DICOM_PREAMBLE_SIZE:] == DICOM_MAGIC
+    except OSError:
+        return False
+
+def is_image_file(file_path, sniff_dicom=True):
+    """True si `file_path` es una imagen soportada (por extensión o firma DICOM)."""
+    name = os.path.basename(file_path).lower()
+    if name.endswith(IMAGE_EXTENSIONS):
+        return True
+    # Los equipos suelen exportar DICOM sin extensión o con nombres tipo UID
+    # ("1.2.840.113619"): leer sólo la cabecera de esos archivos
+    ext = os.path.splitext(name)[1]
+    return sniff_dicom and (ext == '' or ext[1:].isdigit()) and is_dicom_file(file_path)
+
+def _is_image(entry, sniff_dicom):
+    return is_image_file(entry.path, sniff_dicom)
+
+def iter_images(folder, recursive=False, sniff_dicom=True, stop_event=None):
+    """
+    Genera las rutas de imágenes de `folder` en orden natural: primero los archivos
+    de cada carpeta y luego sus subcarpetas (si `recursive`).
+    """
+    pending = [folder]
+    while pending:
+        if stop_event is not None and stop_event.is_set():
+            return
+        current = pending.pop()
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            files.append(entry)
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Error leyendo carpeta {current}: {e}")
+            continue
+
+        files.sort(key=lambda e: natural_key(e.name))
+        for entry in files:
+            if stop_event is not None and stop_event.is_set():
+                return
+            if _is_image(entry, sniff_dicom):
+                yield entry.path
+
+        # Pila: se apilan en orden inverso para visitarlas en orden natural
+        subdirs.sort(key=lambda p: natural_key(os.path.basename(p)), reverse=True)
+        pending.extend(subdirs)
+
+def iter_batches(paths, batch_size=500, max_delay=0.1):
+    """
+    Agrupa las rutas en lotes. El primer lote se entrega con la primera imagen y
+    los siguientes al llenarse o al pasar `max_delay` segundos.
+    """
+    batch = []
+    last_flush = time.perf_counter()
+    first = True
+    for path in paths:
+        batch.append(path)
+        now = time.perf_counter()
+        if first or len(batch) >= batch_size or now - last_flush >= max_delay:
+            yield batch
+            batch = []
+            last_flush = now
+            first = False
+    if batch:
+        yield batch
+
+class FolderScanner:
+    """
+    Ejecuta el escaneo en un hilo de fondo y deja los lotes en una cola que el
+    hilo de Tk vacía periódicamente (Tkinter no es seguro entre hilos).
+    Si se indica `resolver`, se le pasa cada lote (en el hilo de fondo) y debe
+    devolver el subconjunto de rutas ya validadas.
+    """
+    def __init__(self, folder, recursive=False, sniff_dicom=True, batch_size=500, resolver=None):
+        self.folder = folder
+        self.recursive = recursive
+        self.sniff_dicom = sniff_dicom
+        self.batch_size = batch_size
+        self.resolver = resolver
+        self.batches = queue.Queue()
+        self.finished = threading.Event()
+        self.stop_event = threading.Event()
+        self.total = 0
+        self._thread = threading.Thread(target=self._run, name="folder-scan", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        try:
+            paths = iter_images(self.folder, self.recursive, self.sniff_dicom, self.stop_event)
+            for batch in iter_batches(paths, self.batch_size):
+                self.total += len(batch)
+                validated = set()
+                if self.resolver is not None:
+                    try:
+                        validated = self.resolver(batch)
+                    except Exception as e:
+                        print(f"Error consultando imágenes validadas: {e}")
+                self.batches.put((batch, validated))
+        finally:
+            self.finished.set()
+
+    def drain(self):
+        """
+        Devuelve (rutas, validadas) con todo lo escaneado desde la última llamada
+        (sin bloquear).
+        """
+        paths = []
+        validated = set()
+        while True:
+            try:
+                batch, batch_validated = self.batches.get_nowait()
+            except queue.Empty:
+                return paths, validated
+            paths.extend(batch)
+            validated |= batch_validated
+
+    def is_done(self):
+        """True cuando el escaneo terminó y ya se entregaron todos los lotes."""
+        return self.finished.is_set() and self.batches.empty()
@@ -0,0 +1,197 @@
+"""
+Comandos de línea de la aplicación (sin interfaz gráfica).
+
+La base de datos es la de SIGMA_DB_URL o el archivo SQLite local; --db la
+reemplaza (ruta SQLite o URL de SQLAlchemy).
+
+Uso:
+    python -m sigma [--db URL] precompute <carpeta> [--workers N] [--no-recursive] [--force]
+    python -m sigma [--db URL] dbcheck [--writers N] [--rows N]
+    python -m sigma [--db URL] dataset <carpeta> [--size 224] [--shard-size 1024] [--val 0.1] [--workers N]
+    python -m sigma [--db URL] stats [--rebuild]
+    python -m sigma [--db URL] classified [--gc] [--verify]
+"""
+import argparse
+import sys
+import threading
+import time
+
+DBCHECK_TABLE = 'sigma_dbcheck'
+DBCHECK_CHUNK = 50
+
+def cmd_precompute(args):
+    from database import init_db
+    import precompute
+
+    session_factory = init_db(args.db)
+    precompute.run(session_factory, args.folder, recursive=not args.no_recursive,
+                   workers=args.workers, use_thumbnails=not args.no_thumbnails, force=args.force)
+    return 0
+
+def check_concurrent_writes(engine, writers=4, rows=500):
+    """
+    Simula varias estaciones guardando lotes a la vez: `writers` hilos insertan
+    `rows` filas cada uno en bloques con commit en una tabla temporal de prueba.
+    Devuelve (segundos, filas escritas, errores).
+    """
+    from sqlalchemy import MetaData, Table, Column, Integer, String
+
+    metadata = MetaData()
+    table = Table(DBCHECK_TABLE, metadata,
+                  Column('id', Integer, primary_key=True, autoincrement=True),
+                  Column('writer', Integer), Column('path', String))
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    errors = []
+    written = [0] * writers
+
+    def write(worker):
+        try:
+            for start in range(0, rows, DBCHECK_CHUNK):
+                batch = [{'writer': worker, 'path': f'/estacion{worker}/img_{i}.dcm'}
+                         for i in range(start, min(start + DBCHECK_CHUNK, rows))]
+                with engine.begin() as conn:
+                    conn.execute(table.insert(), batch)
+                written[worker] += len(batch)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    metadata.drop_all(engine)
+    return elapsed, sum(written), errors
+
+def cmd_dbcheck(args):
+    from database import create_db_engine, describe_engine
+
+    engine = create_db_engine(args.db)
+    try:
+        for key, value in describe_engine(engine).items():
+            print(f"{key}: {value}")
+        elapsed, written, errors = check_concurrent_writes(engine, args.writers, args.rows)
+    except Exception as e:
+        print(f"❌ Error conectando a la base de datos: {e}")
+        return 1
+    finally:
+        engine.dispose()
+
+    print(f"Escritura concurrente: {args.writers} estaciones, {written} filas en {elapsed:.2f} s")
+    if errors:
+        print(f"❌ {len(errors)} estaciones fallaron: {errors[0]}")
+        return 1
+    print("✅ Base de datos lista")
+    return 0
+
+def cmd_dataset(args):
+    from database import create_db_engine
+    import dataset_export
+
+    engine = create_db_engine(args.db)
+    try:
+        dataset_export.run(engine, args.output, image_size=args.size, shard_size=args.shard_size,
+                           val_fraction=args.val, seed=args.seed, workers=args.workers)
+    except Exception as e:
+        print(f"❌ Error exportando el conjunto: {e}")
+        return 1
+    finally:
+        engine.dispose()
+    return 0
+
+def cmd_stats(args):
+    from database import init_db
+    import stats
+
+    try:
+        session_factory = init_db(args.db)
+        session = session_factory()
+        try:
+            if args.rebuild:
+                stats.rebuild(session)
+                session.commit()
+                print("✅ Estadísticas recalculadas desde image_records")
+            lines = stats.format_stats(*stats.read_stats(session))
+        finally:
+            session.close()
+    except Exception as e:
+        print(f"❌ Error leyendo las estadísticas: {e}")
+        return 1
+    print("\n".join(lines))
+    return 0
+
+def cmd_classified(args):
+    import os
+    import blobstore
+    from copy_engine import classified_root
+    from database import init_db
+
+    store = blobstore.BlobStore(classified_root(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        session_factory = init_db(args.db)
+        created, removed, adopted, loose = blobstore.sync_views(session_factory, store)
+        print(f"✅ Vistas de Clasificadas/: {created} creadas, {removed} borradas, {adopted} copias incorporadas al almacén")
+        if loose:
+            print(f"ℹ️ {loose} archivos en las carpetas de calidad no son vistas del almacén (no se tocaron)")
+        if args.gc:
+            count, freed = blobstore.collect_garbage(session_factory, store)
+            print(f"✅ Blobs sin uso borrados: {count} ({freed / 1e6:.1f} MB)")
+        if args.verify:
+            damaged = blobstore.verify_blobs(store)
+            if damaged:
+                print(f"❌ {len(damaged)} blobs no coinciden con su hash (¿original modificado?):")
+                for key in damaged:
+                    print(f"  {store.blob_path(key)}")
+                return 1
+            print("✅ Todos los blobs coinciden con su hash")
+    except Exception as e:
+        print(f"❌ Error actualizando Clasificadas/: {e}")
+        return 1
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m sigma", description="Herramientas de Sigma IA")
+    parser.add_argument("--db", default=None, help="Archivo SQLite o URL (por defecto SIGMA_DB_URL o el local)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("precompute", help="Precalcula sugerencias y miniaturas de una carpeta")
+    p.add_argument("folder")
+    p.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    p.add_argument("--no-recursive", action="store_true", help="No incluir subcarpetas")
+    p.add_argument("--no-thumbnails", action="store_true", help="No guardar miniaturas en la caché")
+    p.add_argument("--force", action="store_true", help="Recalcular aunque el archivo no haya cambiado")
+    p.set_defaults(func=cmd_precompute)
+
+    p = sub.add_parser("dbcheck", help="Muestra la configuración de la BD y prueba escrituras concurrentes")
+    p.add_argument("--writers", type=int, default=4, help="Estaciones simuladas")
+    p.add_argument("--rows", type=int, default=500, help="Filas por estación")
+    p.set_defaults(func=cmd_dbcheck)
+
+    p = sub.add_parser("dataset", help="Exporta imágenes y etiquetas validadas en fragmentos para entrenamiento")
+    p.add_argument("output", help="Carpeta de salida (se actualiza si ya existe)")
+    p.add_argument("--size", type=int, default=224, help="Lado de las imágenes en píxeles")
+    p.add_argument("--shard-size", type=int, default=1024, help="Imágenes por fragmento")
+    p.add_argument("--val", type=float, default=0.1, help="Fracción de validación")
+    p.add_argument("--seed", type=int, default=0, help="Semilla de la partición entrenamiento/validación")
+    p.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por núcleo)")
+    p.set_defaults(func=cmd_dataset)
+
+    p = sub.add_parser("stats", help="Resumen de las imágenes validadas por etiqueta")
+    p.add_argument("--rebuild", action="store_true", help="Recalcular el resumen desde image_records")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("classified", help="Regenera las carpetas de calidad de Clasificadas/ desde la BD")
+    p.add_argument("--gc", action="store_true", help="Borrar los blobs que ya no usa ningún registro")
+    p.add_argument("--verify", action="store_true", help="Comprobar el hash de todos los blobs")
+    p.set_defaults(func=cmd_classified)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Estadísticas del etiquetado mantenidas de forma incremental.
+
+La tabla `label_stats` guarda, para las imágenes validadas, cuántas hay con
+cada valor de calidad, utilidad diagnóstica, tipo de estudio, lateralidad y
+artefacto, más el total. No se recalcula con GROUP BY sobre image_records:
+cada bloque del guardado por lotes suma las filas nuevas y resta los valores
+que reemplaza (imágenes guardadas otra vez), dentro de la misma transacción
+que el upsert. Leer el resumen es una consulta sobre unas pocas decenas de
+filas, sin importar el tamaño de image_records.
+
+La primera vez (base existente sin resumen) se construye con una pasada
+completa; `python -m sigma stats --rebuild` la repite si hiciera falta.
+
+Uso:
+    python -m sigma [--db URL] stats [--rebuild]
+"""
+from collections import Counter
+from sqlalchemy import func, select
+from database import IMAGE_RECORD_CODES, LabelStat, VALIDATION_STATUSES
+import labels
+
+STAT_FIELDS = ['quality', 'diagnostic_utility', 'study_type', 'laterality']
+ARTIFACTS_FIELD = 'artifacts'
+TOTAL_FIELD = 'total'
+FIELD_TITLES = {
+    'quality': "Calidad",
+    'diagnostic_utility': "Utilidad diagnóstica",
+    'study_type': "Tipo de estudio",
+    'laterality': "Lateralidad",
+    'artifacts': "Artefactos",
+}
+LOOKUP_CHUNK_SIZE = 500
+
+VALIDATED_CODE = VALIDATION_STATUSES.index("Validated") + 1
+
+def artifact_keys(mask):
+    """Claves de una máscara de artefactos: una por artefacto, o (artifacts, 0) si no hay."""
+    if not mask:
+        return [(ARTIFACTS_FIELD, 0)]
+    return [(ARTIFACTS_FIELD, bit + 1) for bit in range(len(labels.ARTIFACTS)) if mask & (1 << bit)]
+
+def stat_keys(row):
+    """Claves (campo, código) que cuenta una fila de image_records con etiquetas codificadas."""
+    keys = [(TOTAL_FIELD, 0)]
+    keys.extend((name, row[name] or 0) for name in STAT_FIELDS)
+    keys.extend(artifact_keys(row['artifacts']))
+    return keys
+
+def _validated_rows(session, path_keys):
+    """Filas validadas ya guardadas para `path_keys` (las que un upsert va a reemplazar)."""
+    table = IMAGE_RECORD_CODES
+    columns = [table.c[name] for name in STAT_FIELDS] + [table.c.artifacts]
+    rows = []
+    for start in range(0, len(path_keys), LOOKUP_CHUNK_SIZE):
+        stmt = select(*columns).where(
+            table.c.path_key.in_(path_keys[start:start + LOOKUP_CHUNK_SIZE]),
+            table.c.validation_status == VALIDATED_CODE).order_by(table.c.path_key).with_for_update()
+        rows.extend(session.execute(stmt).mappings())
+    return rows
+
+def apply_deltas(session, deltas):
+    """
+    Suma `deltas` ({(campo, código): n}) a label_stats con un único upsert. Las
+    filas van ordenadas por clave: dos estaciones que guardan a la vez bloquean
+    las filas en el mismo orden y no se interbloquean.
+    """
+    rows = [{'field': field, 'code': code, 'count': n} for (field, code), n in sorted(deltas.items()) if n]
+    if not rows:
+        return
+    table = LabelStat.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.field, table.c.code],
+                                          set_={table.c.count: table.c.count + stmt.excluded['count']})
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = session.execute(table.update().where(
+            table.c.field == row['field'], table.c.code == row['code']).values(count=table.c.count + row['count']))
+        if not updated.rowcount:
+            session.execute(table.insert(), row)
+
+def _lock_summary(session):
+    """
+    Bloquea la fila del total hasta el commit. Dos estaciones que guardan a la
+    vez la misma imagen nueva se turnan: la segunda lee la fila ya insertada
+    por la primera y no la cuenta dos veces. En SQLite no hace falta (un solo
+    escritor) y FOR UPDATE se omite.
+    """
+    table = LabelStat.__table__
+    session.execute(select(table.c.count).where(
+        table.c.field == TOTAL_FIELD, table.c.code == 0).with_for_update())
+
+def record_batch(session, rows):
+    """
+    Actualiza el resumen por un bloque de filas validadas que se va a guardar con
+    upsert (filas de `annotations.AnnotationStore.record_rows`). Debe llamarse en
+    la misma transacción, antes del upsert, para leer los valores reemplazados.
+    """
+    _lock_summary(session)
+    deltas = Counter()
+    for old in _validated_rows(session, [row['path_key'] for row in rows]):
+        deltas.subtract(stat_keys(old))
+    for row in rows:
+        if row.get('validation_status') == VALIDATED_CODE:
+            deltas.update(stat_keys(row))
+    apply_deltas(session, deltas)
+
+def rebuild(session):
+    """Recalcula el resumen desde image_records (una pasada con GROUP BY)."""
+    table = IMAGE_RECORD_CODES
+    validated = table.c.validation_status == VALIDATED_CODE
+    deltas = Counter({(TOTAL_FIELD, 0): session.execute(
+        select(func.count()).select_from(table).where(validated)).scalar() or 0})
+    for name in STAT_FIELDS:
+        column = table.c[name]
+        for code, n in session.execute(select(column, func.count()).where(validated).group_by(column)):
+            deltas[(name, code or 0)] += n
+    for mask, n in session.execute(select(table.c.artifacts, func.count()).where(validated)
+                                   .group_by(table.c.artifacts)):
+        for key in artifact_keys(mask):
+            deltas[key] += n
+    session.execute(LabelStat.__table__.delete())
+    # El total se guarda aunque sea 0: marca que el resumen ya existe
+    rows = [{'field': f, 'code': c, 'count': n} for (f, c), n in deltas.items() if n or f == TOTAL_FIELD]
+    session.execute(LabelStat.__table__.insert(), rows)
+
+def ensure_stats(session_factory):
+    """Construye el resumen si todavía no existe (p. ej. base creada con una versión anterior)."""
+    table = LabelStat.__table__
+    session = session_factory()
+    try:
+        exists = session.execute(select(table.c.count).where(table.c.field == TOTAL_FIELD)).first()
+        if exists is None:
+            rebuild(session)
+            session.commit()
+    finally:
+        session.close()
+
+def read_stats(session):
+    """
+    Devuelve (total, {campo: [(etiqueta, cantidad), ...]}) en el orden de los
+    vocabularios; lee sólo label_stats.
+    """
+    counts = {(field, code): n for field, code, n in session.execute(
+        select(LabelStat.__table__.c.field, LabelStat.__table__.c.code, LabelStat.__table__.c.count))}
+    total = counts.get((TOTAL_FIELD, 0), 0)
+    summary = {}
+    for name in STAT_FIELDS:
+        vocabulary = labels.FIELD_VOCABULARIES[name]
+        summary[name] = [(value, counts.get((name, i + 1), 0)) for i, value in enumerate(vocabulary)]
+        summary[name].append(("Sin dato", counts.get((name, 0), 0)))
+    summary[ARTIFACTS_FIELD] = [(value, counts.get((ARTIFACTS_FIELD, i + 1), 0))
+                                for i, value in enumerate(labels.ARTIFACTS)]
+    summary[ARTIFACTS_FIELD].append(("Ninguno", counts.get((ARTIFACTS_FIELD, 0), 0)))
+    return total, summary
+
+def format_stats(total, summary):
+    """Líneas de texto del resumen (CLI y panel de la GUI)."""
+    lines = [f"Imágenes validadas: {total}"]
+    for name, entries in summary.items():
+        lines.append("")
+        lines.append(FIELD_TITLES[name] + ":")
+        for value, n in entries:
+            share = f" ({n / total * 100:.1f}%)" if total else ""
+            lines.append(f"  {value:<32} {n:>8}{share}")
+    return lines
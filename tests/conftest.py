@@ -0,0 +1,31 @@
+"""
+Configuración común de las pruebas: los módulos de la aplicación están en la
+raíz del repositorio y cada prueba usa su propia base SQLite temporal.
+
+    python -m pytest -q
+"""
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def session_factory(tmp_path):
+    from database import init_db
+    factory = init_db(f"sqlite:///{tmp_path / 'test.db'}")
+    yield factory
+    factory.kw['bind'].dispose()
+
+def form_data(**values):
+    """Datos del formulario de la GUI con todos los campos vacíos salvo `values`."""
+    from annotations import FIELDS
+    data = {name: "" for name in FIELDS}
+    data.update(artifacts="", doctor_notes="")
+    data.update(values)
+    return data
+
+def record(path, **values):
+    """Fila de `image_records` con lo mínimo para insertarla con `upsert_rows`."""
+    return dict({'filename': path.rsplit('/', 1)[-1], 'original_path': path, 'path_key': path}, **values)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import labels
+from active_learning import (FEATURE_COLUMNS, ActiveLearner, load_candidate_features, load_training_rows,
+                             rank_by_uncertainty)
+from database import ImagePrediction, ImageRecord, normalize_path, upsert_rows
+from conftest import record
+
+def prediction(path, sharpness):
+    row = {name: 0.5 for name in FEATURE_COLUMNS}
+    row.update(path_key=normalize_path(path), original_path=path, f_sharpness=sharpness)
+    return row
+
+def add_images(session_factory, predictions, records=()):
+    session = session_factory()
+    upsert_rows(session, ImagePrediction.__table__, list(predictions), ['path_key'])
+    upsert_rows(session, ImageRecord.__table__, list(records), ['path_key'])
+    session.commit()
+    session.close()
+
+def validated(path, quality):
+    return record(normalize_path(path), original_path=path, validation_status="Validated", quality=quality)
+
+def test_rank_puts_least_certain_first():
+    proba = np.array([[0.9, 0.05, 0.05], [0.4, 0.35, 0.25], [0.1, 0.2, 0.7]])
+    order, confidence, codes = rank_by_uncertainty(proba)
+    assert order.tolist() == [1, 2, 0]
+    assert codes.tolist() == [1, 1, 3]
+    assert confidence.tolist() == [0.9, 0.4, 0.7]
+
+def test_lookups_match_paths_by_normalized_key(session_factory, tmp_path):
+    path = str(tmp_path / "a.jpg")
+    alias = str(tmp_path / "sub/../a.jpg")
+    # La predicción se guardó con otra escritura de la ruta que el registro
+    add_images(session_factory, [prediction(alias, 3.0)], [validated(path, labels.QUALITY[2])])
+    session = session_factory()
+    X, y = load_training_rows(session)
+    assert X.shape == (1, len(FEATURE_COLUMNS)) and y.tolist() == [3]
+    assert load_training_rows(session, [alias])[1].tolist() == [3]
+    found, features = load_candidate_features(session, [alias, str(tmp_path / "b.jpg")])
+    assert found == [alias] and features.shape == (1, len(FEATURE_COLUMNS))
+    session.close()
+
+def test_learner_ranks_candidates(session_factory):
+    pytest.importorskip("sklearn")
+    rng = np.random.default_rng(0)
+    train = [(f"/val/{i}.jpg", float(rng.uniform(0, 1)) + (2 if i % 2 else 0)) for i in range(60)]
+    candidates = [(f"/new/{i}.jpg", float(rng.uniform(0, 1)) + (2 if i % 3 else 0)) for i in range(30)]
+    add_images(session_factory, [prediction(path, value) for path, value in train + candidates],
+               [validated(path, labels.QUALITY[0] if value > 1.5 else labels.QUALITY[2]) for path, value in train])
+
+    learner = ActiveLearner(session_factory).start()
+    try:
+        learner.set_candidates([path for path, _value in candidates] + ["/sin/caracteristicas.jpg"])
+        ranking = learner.results.get(timeout=10)
+    finally:
+        learner.stop()
+    assert ranking is not None and ranking.samples == 60
+    assert sorted(ranking.paths) == sorted(path for path, _value in candidates)
+    confident = ranking.confident(0.9)
+    assert confident
+    for path, quality, _confidence in confident:
+        value = dict(candidates)[path]
+        assert quality == (labels.QUALITY[0] if value > 1.5 else labels.QUALITY[2])
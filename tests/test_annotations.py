@@ -0,0 +1,47 @@
+import labels
+from annotations import AnnotationStore
+from conftest import form_data
+
+def test_set_get_and_discard():
+    store = AnnotationStore()
+    data = form_data(quality=labels.QUALITY[1], artifacts=labels.ARTIFACTS[0], doctor_notes="revisar")
+    assert store.set_path("/a.jpg", data)
+    assert not store.set_path("/a.jpg", dict(data))  # sin cambios
+    assert store.get_path("/a.jpg") == data
+    assert "/a.jpg" in store and len(store) == 1
+    store.discard(store.intern("/a.jpg"))
+    assert store.get_path("/a.jpg") is None
+    assert "/a.jpg" not in store and len(store) == 0
+
+def test_discard_saved_keeps_later_edits():
+    store = AnnotationStore.from_items([(p, form_data(quality=labels.QUALITY[0])) for p in ("/a.jpg", "/b.jpg")])
+    snapshot = store.snapshot()
+    store.set_path("/b.jpg", form_data(quality=labels.QUALITY[2]))  # editada mientras se guardaba
+    store.discard_saved(snapshot, ["/a.jpg", "/b.jpg"])
+    assert [path for path, _data in store.items()] == ["/b.jpg"]
+
+def test_record_rows_use_codes():
+    store = AnnotationStore.from_items([("/img/a.jpg", form_data(quality=labels.QUALITY[1],
+                                                                  artifacts=labels.ARTIFACTS[1]))])
+    row, = store.record_rows(store.pending_indices())
+    assert (row['filename'], row['quality'], row['sharpness']) == ("a.jpg", 2, None)
+    assert row['artifacts'] == 1 << 1
+    arrays = store.to_arrays()
+    assert arrays['quality__categories'][arrays['quality'][0]] == labels.QUALITY[1]
+    assert AnnotationStore().to_arrays()['quality'].size == 0
+
+def test_restore_moves_old_values_to_notes():
+    # Diario de una versión anterior: valores de texto libre y entradas ilegibles
+    store = AnnotationStore()
+    restored, moved = store.restore({
+        "/a.jpg": {'quality': "Buena", 'artifacts': "Polvo," + labels.ARTIFACTS[0], 'doctor_notes': "ok"},
+        "/b.jpg": "ilegible",
+        "/c.jpg": form_data(quality=labels.QUALITY[0]),
+    })
+    assert (restored, moved) == (2, 1)
+    data = store.get_path("/a.jpg")
+    assert data['quality'] == ""
+    assert data['artifacts'] == labels.ARTIFACTS[0]
+    assert data['doctor_notes'] == "ok [Valores anteriores: quality=Buena; artifacts=Polvo]"
+    assert store.get_path("/c.jpg")['quality'] == labels.QUALITY[0]
+    assert store.get_path("/b.jpg") is None
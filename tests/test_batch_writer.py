@@ -0,0 +1,80 @@
+import os
+import threading
+from sqlalchemy import func, select
+import batch_writer
+import copy_engine
+import labels
+from batch_writer import BatchWriter
+from database import ImageRecord
+from conftest import form_data
+
+def save(session_factory, items, **options):
+    return BatchWriter(session_factory, items, None, copy_files=False, **options).run()
+
+def test_resave_updates_without_duplicates(session_factory):
+    items = [(f"/img/{i}.jpg", form_data(quality=labels.QUALITY[0])) for i in range(7)]
+    result = save(session_factory, items, chunk_size=3)
+    assert (result.inserted, result.failed) == (7, 0)
+    result = save(session_factory, [("/img/0.jpg", form_data(quality=labels.QUALITY[2]))])
+    assert result.saved_paths == ["/img/0.jpg"]
+
+    session = session_factory()
+    assert session.execute(select(func.count()).select_from(ImageRecord)).scalar() == 7
+    assert session.execute(select(ImageRecord.quality).where(
+        ImageRecord.path_key == "/img/0.jpg")).scalar() == labels.QUALITY[2]
+    session.close()
+
+def test_other_errors_discard_only_the_chunk(session_factory, monkeypatch):
+    real_upsert = batch_writer.upsert_rows
+
+    def failing_upsert(session, table, rows, keys):
+        if any(row['path_key'] == "/img/0.jpg" for row in rows):
+            raise ValueError("falla")
+        return real_upsert(session, table, rows, keys)
+
+    monkeypatch.setattr(batch_writer, 'upsert_rows', failing_upsert)
+    items = [(f"/img/{i}.jpg", form_data(quality=labels.QUALITY[0])) for i in range(4)]
+    result = save(session_factory, items, chunk_size=2)
+    assert (result.inserted, result.failed) == (2, 2)
+
+def test_cancel_during_copies_leaves_the_rest_pending(session_factory, tmp_path, monkeypatch):
+    sources = []
+    for i in range(6):
+        sources.append(str(tmp_path / f"src/{i}.jpg"))
+        os.makedirs(os.path.dirname(sources[-1]), exist_ok=True)
+        with open(sources[-1], 'wb') as f:
+            f.write(f"imagen {i}".encode())
+
+    # Una sola copia a la vez, detenida hasta que se cancelen las que esperan
+    started, release = threading.Event(), threading.Event()
+    real_classify = copy_engine.BlobStore.classify
+    real_cancel = copy_engine.CopyBatch.cancel
+
+    def slow_classify(store, *args):
+        started.set()
+        release.wait(5)
+        return real_classify(store, *args)
+
+    def cancel_and_release(batch):
+        cancelled = real_cancel(batch)
+        release.set()
+        return cancelled
+
+    monkeypatch.setattr(copy_engine, 'LOCAL_WORKERS', 1)
+    monkeypatch.setattr(copy_engine.BlobStore, 'classify', slow_classify)
+    monkeypatch.setattr(copy_engine.CopyBatch, 'cancel', cancel_and_release)
+    monkeypatch.setattr(batch_writer, 'CANCEL_POLL_SECONDS', 0.01)
+
+    items = [(path, form_data(quality=labels.QUALITY[0])) for path in sources]
+    writer = BatchWriter(session_factory, items, str(tmp_path / "app")).start()
+    assert started.wait(5)
+    writer.cancel()
+    assert writer.finished.wait(5)
+    result = writer.result
+    assert result.cancelled
+    assert (result.inserted, result.copied, result.copy_failed, result.copy_cancelled) == (6, 1, 0, 5)
+
+    session = session_factory()
+    status = [value for (value,) in session.query(ImageRecord.copy_status)]
+    session.close()
+    assert sorted(status) == [copy_engine.STATUS_COPIED] + [copy_engine.STATUS_PENDING] * 5
@@ -0,0 +1,68 @@
+import os
+import blobstore
+import labels
+from batch_writer import BatchWriter
+from blobstore import BlobStore
+from database import ImageRecord
+from conftest import form_data
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def test_put_deduplicates_identical_content(tmp_path):
+    store = BlobStore(str(tmp_path / "Clasificadas"))
+    a = write(str(tmp_path / "src/a/x.jpg"), b"uno")
+    b = write(str(tmp_path / "src/b/copia.JPG"), b"uno")
+    key = store.put(a)
+    assert store.put(b) == key
+    assert key.endswith(".jpg")
+    assert len(list(store.iter_blobs())) == 1
+
+def test_same_name_from_different_folders_does_not_collide(tmp_path):
+    store = BlobStore(str(tmp_path / "Clasificadas"))
+    quality = labels.QUALITY[0]
+    view_a, key_a = store.classify(write(str(tmp_path / "src/a/x.jpg"), b"uno"), quality)
+    view_b, key_b = store.classify(write(str(tmp_path / "src/b/x.jpg"), b"dos"), quality)
+    assert os.path.basename(view_a) == "x.jpg"
+    assert os.path.basename(view_b) == f"x__{key_b[:8]}.jpg"
+    with open(view_b, 'rb') as f:
+        assert f.read() == b"dos"
+
+def test_regrade_moves_link_without_rehashing(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "Clasificadas"))
+    source = write(str(tmp_path / "src/x.jpg"), b"uno")
+    view, key = store.classify(source, labels.QUALITY[0])
+    monkeypatch.setattr(blobstore, 'file_content_hash', lambda path: _unexpected_read())
+    new_view, new_key = store.classify(source, labels.QUALITY[2], view, key)
+    assert new_key == key
+    assert not os.path.exists(view)
+    assert os.path.dirname(new_view).endswith(labels.QUALITY[2])
+
+def _unexpected_read():
+    raise AssertionError("no debería volver a leer el archivo")
+
+def test_sync_gc_and_verify(session_factory, tmp_path):
+    base = str(tmp_path / "app")
+    sources = [write(str(tmp_path / f"src/{i}.jpg"), f"imagen {i}".encode()) for i in range(3)]
+    items = [(path, form_data(quality=labels.QUALITY[0])) for path in sources]
+    result = BatchWriter(session_factory, items, base).run()
+    assert (result.copied, result.copy_failed) == (3, 0)
+
+    store = BlobStore(os.path.join(base, "Clasificadas"))
+    assert blobstore.remove_views(store.root) == 3
+    assert blobstore.sync_views(session_factory, store) == (3, 0, 0, 0)
+    assert blobstore.sync_views(session_factory, store) == (0, 0, 0, 0)
+
+    # Un blob que ningún registro usa se recoge; los demás siguen verificando
+    orphan = store.put(write(str(tmp_path / "src/huerfana.jpg"), b"sin registro"))
+    assert blobstore.collect_garbage(session_factory, store) == (1, len(b"sin registro"))
+    assert not os.path.exists(store.blob_path(orphan))
+    assert blobstore.verify_blobs(store) == []
+
+    session = session_factory()
+    keys = {key for (key,) in session.query(ImageRecord.blob_key)}
+    session.close()
+    assert keys == {key for key, _path in store.iter_blobs()}
@@ -0,0 +1,70 @@
+import os
+import threading
+import labels
+from copy_engine import STATUS_COPIED, STATUS_FAILED, CopyEngine, retry_failed_copies
+from database import ImageRecord, normalize_path, upsert_rows
+from conftest import record
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def test_batches_keep_their_own_counts(tmp_path):
+    engine = CopyEngine(str(tmp_path / "app"), workers=2)
+    first, second = engine.new_batch(), engine.new_batch()
+    quality = labels.QUALITY[0]
+    for i in range(3):
+        engine.submit(write(str(tmp_path / f"src/{i}.jpg"), f"imagen {i}".encode()), quality, batch=first)
+    engine.submit(str(tmp_path / "src/no_existe.jpg"), quality, batch=second)
+    engine.submit(write(str(tmp_path / "src/otra.jpg"), b"otra"), quality)
+    assert first.wait(5) and second.wait(5)
+    assert (first.copied, first.failed) == (3, 0)
+    assert (second.copied, second.failed) == (0, 1)
+    assert engine.wait() == (1, 0)
+    assert engine.wait() == (0, 0)  # las cuentas del lote propio empiezan de nuevo
+    assert not first._pending and not second._pending  # las copias terminadas se sueltan
+    engine.shutdown()
+
+def test_cancel_skips_copies_not_started(tmp_path, monkeypatch):
+    engine = CopyEngine(str(tmp_path / "app"), workers=1)
+    started, release = threading.Event(), threading.Event()
+    real_classify = engine.store.classify
+
+    def slow_classify(*args):
+        started.set()
+        release.wait(5)
+        return real_classify(*args)
+
+    monkeypatch.setattr(engine.store, 'classify', slow_classify)
+    batch = engine.new_batch()
+    for i in range(4):
+        engine.submit(write(str(tmp_path / f"src/{i}.jpg"), f"imagen {i}".encode()), labels.QUALITY[0], batch=batch)
+    assert started.wait(5)
+    assert not batch.wait(0.05)
+    assert batch.cancel() == 3
+    release.set()
+    assert batch.wait(5)
+    assert (batch.copied, batch.failed, batch.cancelled) == (1, 0, 3)
+    engine.shutdown()
+
+def test_retry_copies_pending_failed_and_unrecorded(session_factory, tmp_path):
+    base = str(tmp_path / "app")
+    sources = [write(str(tmp_path / f"src/{i}.jpg"), f"imagen {i}".encode()) for i in range(3)]
+    quality = labels.QUALITY[0]
+    rows = [record(normalize_path(sources[0]), original_path=sources[0], quality=quality, copy_status=STATUS_FAILED),
+            # Fila migrada del esquema anterior: nunca registró su copia
+            record(normalize_path(sources[1]), original_path=sources[1], quality=quality, copy_status=None),
+            record(normalize_path(sources[2]), original_path=sources[2], quality=quality, copy_status=STATUS_COPIED)]
+    session = session_factory()
+    upsert_rows(session, ImageRecord.__table__, rows, ['path_key'])
+    session.commit()
+    session.close()
+
+    assert retry_failed_copies(session_factory, base, workers=2) == (2, 0)
+    session = session_factory()
+    status = dict(session.query(ImageRecord.original_path, ImageRecord.copy_status))
+    session.close()
+    assert status == {path: STATUS_COPIED for path in sources}
+    assert retry_failed_copies(session_factory, base, workers=2) == (0, 0)
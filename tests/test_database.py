@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, make_url, select, text
+import labels
+from database import IMAGE_RECORD_CODES, ImageRecord, SCHEMA_VERSION, init_db, upsert_rows
+from conftest import record
+
+# Servidor PostgreSQL para las pruebas del perfil compartido (se crea y borra un esquema propio)
+PG_URL_ENV = 'SIGMA_TEST_PG_URL'
+
+def test_upsert_updates_existing_row(session_factory):
+    session = session_factory()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=1), record("/b.jpg", quality=1)], ['path_key'])
+    session.commit()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=2)], ['path_key'])
+    session.commit()
+    rows = dict(session.execute(select(ImageRecord.path_key, ImageRecord.quality)).all())
+    assert rows == {"/a.jpg": labels.QUALITY[1], "/b.jpg": labels.QUALITY[0]}
+    session.close()
+
+def test_upsert_only_sets_given_columns(session_factory):
+    session = session_factory()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=1, doctor_notes="nota")], ['path_key'])
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=2)], ['path_key'])
+    session.commit()
+    assert session.execute(select(ImageRecord.doctor_notes)).scalar() == "nota"
+    session.close()
+
+def test_resave_keeps_created_at_and_moves_updated_at(session_factory):
+    session = session_factory()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=1)], ['path_key'])
+    session.commit()
+    created, updated = session.execute(select(ImageRecord.created_at, ImageRecord.updated_at)).one()
+    time.sleep(1.1)  # CURRENT_TIMESTAMP de SQLite tiene resolución de segundos
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=2)], ['path_key'])
+    session.commit()
+    created2, updated2 = session.execute(select(ImageRecord.created_at, ImageRecord.updated_at)).one()
+    assert created2 == created
+    assert updated2 > updated
+    session.close()
+
+def test_timestamps_share_the_utc_clock(session_factory):
+    session = session_factory()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=1)], ['path_key'])
+    session.commit()
+    created, updated = session.execute(select(ImageRecord.created_at, ImageRecord.updated_at)).one()
+    session.close()
+    assert created == updated
+    assert abs(created - datetime.utcnow()) < timedelta(minutes=1)
+
+def test_migrates_v2_database_adding_updated_at(tmp_path):
+    url = f"sqlite:///{tmp_path / 'v2.db'}"
+    factory = init_db(url)
+    session = factory()
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/a.jpg", quality=1)], ['path_key'])
+    session.execute(text('DROP INDEX ix_image_records_updated_at'))
+    session.execute(text('ALTER TABLE image_records DROP COLUMN updated_at'))
+    session.execute(text('UPDATE schema_info SET version=2'))
+    session.commit()
+    session.close()
+    factory.kw['bind'].dispose()
+
+    factory = init_db(url)
+    session = factory()
+    created, updated = session.execute(select(ImageRecord.created_at, ImageRecord.updated_at)).one()
+    assert updated == created
+    assert session.execute(text('SELECT version FROM schema_info')).scalar() == SCHEMA_VERSION
+    indexes = session.execute(text("SELECT name FROM sqlite_master WHERE type='index'")).scalars().all()
+    assert 'ix_image_records_updated_at' in indexes
+    session.close()
+    factory.kw['bind'].dispose()
+
+def create_v1_table(url, id_column):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE image_records ({id_column}, filename TEXT, original_path TEXT, "
+            "study_type TEXT, laterality TEXT, sharpness TEXT, illumination TEXT, centering TEXT, "
+            "field_of_view TEXT, artifacts TEXT, obstructions TEXT, quality TEXT, diagnostic_utility TEXT, "
+            "validation_status TEXT, created_at TIMESTAMP, doctor_notes TEXT, copy_status TEXT)"))
+        for quality in ("Buena", labels.QUALITY[0]):  # la última fila de la ruta prevalece
+            conn.execute(text(
+                "INSERT INTO image_records (filename, original_path, artifacts, quality, validation_status, "
+                "created_at, doctor_notes) VALUES ('a.jpg', '/a.jpg', :artifacts, :quality, 'Validated', "
+                "'2024-01-01 10:00:00', '')"), {'artifacts': labels.ARTIFACTS[0] + ",Polvo", 'quality': quality})
+    engine.dispose()
+
+def check_v1_migration(url):
+    factory = init_db(url)
+    session = factory()
+    row = session.execute(select(ImageRecord)).scalar_one()
+    assert row.quality == labels.QUALITY[0]
+    assert row.artifacts == labels.ARTIFACTS[0]
+    assert "artifacts=Polvo" in row.doctor_notes
+    assert row.updated_at == row.created_at
+    # La tabla nueva inserta con su propia secuencia de ids
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/b.jpg", quality=1)], ['path_key'])
+    session.commit()
+    created, updated = session.execute(select(ImageRecord.created_at, ImageRecord.updated_at)
+                                       .where(ImageRecord.path_key == "/b.jpg")).one()
+    assert created == updated
+    assert abs(created - datetime.utcnow()) < timedelta(minutes=1)
+    session.close()
+    factory.kw['bind'].dispose()
+
+def test_migrates_v1_text_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'v1.db'}"
+    create_v1_table(url, "id INTEGER PRIMARY KEY")
+    check_v1_migration(url)
+
+@pytest.mark.skipif(not os.environ.get(PG_URL_ENV), reason=f"{PG_URL_ENV} no está definida")
+def test_migrates_v1_text_schema_on_postgresql():
+    url = make_url(os.environ[PG_URL_ENV])
+    schema = f"sigma_test_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    try:
+        url = url.update_query_dict({'options': f'-csearch_path={schema}'})
+        create_v1_table(url, "id SERIAL PRIMARY KEY")
+        check_v1_migration(url)
+    finally:
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from PIL import Image
+import labels
+from database import ImageRecord, normalize_path, upsert_rows
+from dataset_export import bucket_count, export_dataset, plan_shards, read_manifest, split_of
+from conftest import record
+
+def rows(n, start=0):
+    return [(i, f"/img/{i}.jpg", f"/img/{i}.jpg") for i in range(start, start + n)]
+
+def test_split_is_stable_and_near_fraction():
+    keys = [f"/img/{i}.jpg" for i in range(5000)]
+    splits = [split_of(key, 0.1) for key in keys]
+    assert splits == [split_of(key, 0.1) for key in keys]
+    assert 0.08 < splits.count('val') / len(keys) < 0.12
+
+def test_new_row_changes_only_its_shard():
+    plan, buckets = plan_shards(rows(1000), 100, 0.1)
+    new_row = rows(1, start=5000)
+    grown, grown_buckets = plan_shards(rows(1000) + new_row, 100, 0.1, previous_buckets=buckets)
+    assert grown_buckets == buckets
+    changed = [(split, k) for split in plan for k in set(plan[split]) | set(grown[split])
+               if plan[split].get(k) != grown[split].get(k)]
+    assert len(changed) == 1
+    split, k = changed[0]
+    assert new_row[0] in grown[split][k]
+
+def test_bucket_count_grows_only_after_doubling():
+    assert bucket_count(950, 100) == 10
+    assert bucket_count(1900, 100, previous=10) == 10
+    assert bucket_count(2100, 100, previous=10) == 21
+
+def add_validated(session_factory, folder, numbers):
+    rows = []
+    for i in numbers:
+        path = os.path.join(folder, f"{i}.png")
+        Image.fromarray(np.full((12, 16, 3), i % 256, dtype=np.uint8)).save(path)
+        rows.append(record(normalize_path(path), original_path=path, validation_status="Validated",
+                           quality=labels.QUALITY[i % 3]))
+    session = session_factory()
+    upsert_rows(session, ImageRecord.__table__, rows, ['path_key'])
+    session.commit()
+    session.close()
+
+def shard_names_on_disk(output):
+    return {name.split('.')[0] for name in os.listdir(output) if name.endswith('.npy')}
+
+def test_export_rewrites_only_changed_shards(session_factory, tmp_path):
+    engine = session_factory.kw['bind']
+    folder, output = str(tmp_path / "img"), str(tmp_path / "dataset")
+    os.makedirs(folder)
+    options = dict(image_size=8, shard_size=4, val_fraction=0.2, workers=1)
+    add_validated(session_factory, folder, range(40))
+    written, skipped, failed = export_dataset(engine, output, **options)
+    assert (skipped, failed) == (0, 0)
+    assert export_dataset(engine, output, **options) == (0, written, 0)
+
+    # Validar una imagen más reescribe sólo su fragmento
+    add_validated(session_factory, folder, [40])
+    written_again, skipped, _failed = export_dataset(engine, output, **options)
+    assert written_again == 1
+
+    # Al duplicarse una parte cambian los fragmentos; los que sobran se borran
+    buckets = read_manifest(output)['buckets']
+    add_validated(session_factory, folder, range(41, 120))
+    export_dataset(engine, output, **options)
+    manifest = read_manifest(output)
+    assert manifest['complete'] and manifest['buckets']['train'] > buckets['train']
+    assert sum(split['rows'] for split in manifest['splits'].values()) == 120
+    names = {entry['name'] for split in manifest['splits'].values() for entry in split['shards']}
+    assert shard_names_on_disk(output) == names
+
+    # Con menos fragmentos (otro shard_size) no quedan archivos de los anteriores
+    export_dataset(engine, output, **dict(options, shard_size=40))
+    manifest = read_manifest(output)
+    fewer = {entry['name'] for split in manifest['splits'].values() for entry in split['shards']}
+    assert len(fewer) < len(names)
+    assert shard_names_on_disk(output) == fewer
@@ -0,0 +1,40 @@
+import csv
+import time
+from datetime import timedelta
+import export_data
+from database import IMAGE_RECORD_CODES, upsert_rows
+from conftest import record
+
+def exported(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['filename'], row['quality']) for row in csv.DictReader(f)]
+
+def test_incremental_export_picks_up_regrades_and_late_commits(session_factory, tmp_path):
+    session = session_factory()
+    engine = session.get_bind()
+    output = str(tmp_path / "labels.csv")
+    upsert_rows(session, IMAGE_RECORD_CODES, [record(f"/img/{i}.jpg", quality=1) for i in range(3)], ['path_key'])
+    session.commit()
+    assert export_data.export(engine, output, incremental=True) == 3
+    assert export_data.export(engine, output, incremental=True) == 0
+
+    time.sleep(1.1)
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/img/0.jpg", quality=2)], ['path_key'])
+    # Otra estación confirma tarde una fila con hora anterior a la marca
+    mark, _seen = export_data.read_watermark(output + ".watermark")
+    upsert_rows(session, IMAGE_RECORD_CODES, [record("/img/late.jpg", quality=3,
+                                                     updated_at=mark - timedelta(minutes=1))], ['path_key'])
+    session.commit()
+    assert export_data.export(engine, output, incremental=True) == 2
+    assert export_data.export(engine, output, incremental=True) == 0
+
+    rows = exported(output)
+    assert len(rows) == 5
+    assert rows[-2:] == [("0.jpg", "Grado B (Limitada)"), ("late.jpg", "No gradable")]
+    session.close()
+
+def test_reads_old_single_line_watermark(tmp_path):
+    path = tmp_path / "labels.csv.watermark"
+    path.write_text("2024-01-01T10:00:00", encoding='utf-8')
+    mark, seen = export_data.read_watermark(str(path))
+    assert mark.year == 2024 and seen == {}
@@ -0,0 +1,41 @@
+import labels
+from annotations import AnnotationStore
+from journal import ChangeJournal
+from conftest import form_data
+
+def test_replay_keeps_last_entry_and_folder(tmp_path):
+    journal = ChangeJournal(str(tmp_path / "j.journal"), fsync_interval=None)
+    journal.set_folder("/carpeta")
+    journal.append("/a.jpg", form_data(quality=labels.QUALITY[0]))
+    journal.append("/a.jpg", form_data(quality=labels.QUALITY[1]))
+    journal.close()
+    folder, changes = journal.replay()
+    assert folder == "/carpeta"
+    assert changes["/a.jpg"]["quality"] == labels.QUALITY[1]
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "j.journal"
+    journal = ChangeJournal(str(path), fsync_interval=None)
+    journal.append("/a.jpg", form_data(quality=labels.QUALITY[0]))
+    journal.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"path": "/b.jpg", "da')
+    _folder, changes = journal.replay()
+    assert list(changes) == ["/a.jpg"]
+    # La siguiente entrada no se pega a la línea truncada
+    journal.append("/c.jpg", form_data())
+    journal.close()
+    assert set(journal.replay()[1]) == {"/a.jpg", "/c.jpg"}
+
+def test_compact_keeps_only_pending(tmp_path):
+    journal = ChangeJournal(str(tmp_path / "j.journal"), fsync_interval=None)
+    store = AnnotationStore()
+    for name in ("/a.jpg", "/b.jpg"):
+        store.set_path(name, form_data(quality=labels.QUALITY[0]))
+        journal.append(name, store.get_path(name))
+    store.discard(store.intern("/a.jpg"))
+    journal.compact(store, "/carpeta")
+    assert journal.replay() == ("/carpeta", {"/b.jpg": store.get_path("/b.jpg")})
+    store.discard(store.intern("/b.jpg"))
+    journal.compact(store)
+    assert not (tmp_path / "j.journal").exists()
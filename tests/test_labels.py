@@ -0,0 +1,16 @@
+import pytest
+import labels
+
+def test_artifacts_mask_round_trip():
+    names = [labels.ARTIFACTS[0], labels.ARTIFACTS[-1]]
+    mask = labels.artifacts_to_mask(",".join(names))
+    assert mask == 1 | (1 << (len(labels.ARTIFACTS) - 1))
+    assert labels.mask_to_artifacts(mask) == ",".join(names)
+
+def test_empty_artifacts():
+    assert labels.artifacts_to_mask("") == 0
+    assert labels.mask_to_artifacts(0) == ""
+
+def test_unknown_artifact_is_rejected():
+    with pytest.raises(ValueError):
+        labels.artifacts_to_mask("No existe")
@@ -0,0 +1,61 @@
+import os
+import random
+import numpy as np
+from PIL import Image
+import labels
+import phash
+from database import ImageRecord, normalize_path, upsert_rows
+from conftest import record
+
+def retina(seed, size=128):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(8, 8, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(small).resize((size, size), Image.BILINEAR))
+
+def test_dhash_tolerates_resize_and_noise():
+    image = retina(0)
+    resized = np.asarray(Image.fromarray(image).resize((96, 96)))
+    noisy = np.clip(image.astype(np.int16) + np.random.default_rng(1).integers(-3, 4, image.shape), 0, 255)
+    value = phash.dhash(image)
+    assert phash.hamming(value, phash.dhash(resized)) <= phash.DEFAULT_MAX_DISTANCE
+    assert phash.hamming(value, phash.dhash(noisy.astype(np.uint8))) <= phash.DEFAULT_MAX_DISTANCE
+    assert phash.hamming(value, phash.dhash(retina(2))) > 10
+
+def test_index_search_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    # Variantes cercanas de algunos hashes
+    values += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for value in values[:50]]
+    index = phash.HashIndex()
+    for i, value in enumerate(values):
+        index.add(value, i)
+    for query in values[:60]:
+        expected = sorted((phash.hamming(query, value), i) for i, value in enumerate(values)
+                          if phash.hamming(query, value) <= 4)
+        assert index.search(query, 4) == expected
+
+def test_near_duplicates_are_grouped():
+    base = 0x0F0F_0F0F_0F0F_0F0F
+    hashes = [("/a.jpg", base), ("/b.jpg", 0x1234_5678_9ABC_DEF0), ("/c.jpg", base ^ 0b101)]
+    groups = phash.group_near_duplicates(hashes, validated={"/v.jpg": base ^ 0b1})
+    assert groups.group("/a.jpg") == ["/a.jpg", "/c.jpg"]
+    assert groups.group("/b.jpg") is None
+    assert groups.validated_match("/c.jpg") == "/v.jpg"
+    assert groups.is_first("/a.jpg") and not groups.is_first("/c.jpg")
+
+def test_hashes_round_trip_through_the_database(session_factory, tmp_path):
+    path = str(tmp_path / "a.png")
+    Image.fromarray(retina(0)).save(path)
+    value = (1 << 63) | 0x1234  # no cabe en BIGINT sin pasar a signo
+    session = session_factory()
+    phash.save_hashes(session, [(path, value)])
+    assert phash.load_hashes(session, [path]) == {path: value}
+    upsert_rows(session, ImageRecord.__table__, [record(normalize_path(path), original_path=path,
+                                                        validation_status="Validated",
+                                                        quality=labels.QUALITY[0])], ['path_key'])
+    session.commit()
+    assert phash.load_validated_hashes(session) == {path: value}
+    # Si el archivo cambia, el hash guardado deja de valer
+    os.utime(path, ns=(0, 0))
+    assert phash.load_hashes(session, [path]) == {}
+    session.close()
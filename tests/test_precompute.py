@@ -0,0 +1,68 @@
+import os
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine, func, inspect, select, text
+import precompute
+from database import ImagePrediction, init_db
+from predictor import RulePredictor
+from precompute import (find_up_to_date, load_precomputed, load_precomputed_many, precompute_folder,
+                        prediction_row, save_results)
+
+def thumbnail(seed):
+    return np.random.default_rng(seed).integers(0, 255, size=(32, 32, 3), dtype=np.uint8)
+
+def save_image(path, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.fromarray(thumbnail(seed)).save(path)
+    return path
+
+def test_lookups_use_the_normalized_path(session_factory, tmp_path):
+    path = save_image(str(tmp_path / "img/a.png"), 0)
+    save_results(session_factory, [prediction_row(path, os.stat(path), thumbnail(0), RulePredictor())], [])
+    # La misma imagen con otra escritura de la ruta
+    alias = str(tmp_path / "img/../img/./a.png")
+    save_results(session_factory, [prediction_row(alias, os.stat(alias), thumbnail(0), RulePredictor())], [])
+
+    session = session_factory()
+    assert session.execute(select(func.count()).select_from(ImagePrediction)).scalar() == 1
+    assert load_precomputed(session, path) is not None
+    assert list(load_precomputed_many(session, [alias])) == [alias]
+    assert find_up_to_date(session, [alias, str(tmp_path / "img/b.png")]) == {alias}
+
+    # Si el archivo cambia, la sugerencia deja de valer
+    os.utime(path, ns=(0, 0))
+    assert load_precomputed(session, alias) is None
+    assert find_up_to_date(session, [path]) == set()
+    session.close()
+
+def test_precompute_skips_unchanged_images(session_factory, tmp_path):
+    for i in range(3):
+        save_image(str(tmp_path / f"img/{i}.png"), i)
+    folder = str(tmp_path / "img")
+    assert precompute_folder(session_factory, folder, workers=1) == (3, 0)
+    assert precompute_folder(session_factory, folder, workers=1) == (0, 0)
+    session = session_factory()
+    assert len(load_precomputed_many(session, [str(tmp_path / f"img/{i}.png") for i in range(3)])) == 3
+    session.close()
+
+def test_v3_predictions_get_path_keys(tmp_path):
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE image_predictions (id INTEGER PRIMARY KEY, original_path VARCHAR NOT NULL, "
+                          "file_size BIGINT, file_mtime_ns BIGINT, quality VARCHAR)"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_image_predictions_original_path ON image_predictions (original_path)"))
+        conn.execute(text("INSERT INTO image_predictions (id, original_path, quality) VALUES "
+                          "(1, '/img/a.png', 'vieja'), (2, '/img/./a.png', 'nueva'), (3, '/img/b.png', 'b')"))
+    engine.dispose()
+
+    factory = init_db(url)
+    session = factory()
+    rows = session.execute(select(ImagePrediction.path_key, ImagePrediction.quality)
+                           .order_by(ImagePrediction.path_key)).all()
+    indexes = {tuple(ix['column_names']): ix['unique'] for ix in inspect(session.bind).get_indexes('image_predictions')}
+    session.close()
+    factory.kw['bind'].dispose()
+    key = precompute.normalize_path
+    assert rows == [(key('/img/a.png'), 'nueva'), (key('/img/b.png'), 'b')]
+    assert indexes == {('path_key',): True}
@@ -0,0 +1,69 @@
+import pickle
+import numpy as np
+import pytest
+import labels
+from database import ImageRecord, upsert_rows
+from predictor import (FEATURE_NAMES, RulePredictor, SklearnPredictor, compute_features, forest_predict,
+                       load_predictor, train_from_records)
+from conftest import record
+
+def fundus(seed, size=64):
+    """Disco claro sobre fondo negro, con ruido para variar nitidez y brillo."""
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[:size, :size]
+    disc = (ys - size / 2) ** 2 + (xs - size / 2) ** 2 < (size * 0.4) ** 2
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    image[disc] = rng.integers(60, 200, size=(int(disc.sum()), 3), dtype=np.uint8)
+    return image
+
+def test_rules_use_the_label_vocabularies():
+    features = compute_features(fundus(0))
+    assert set(features) == set(FEATURE_NAMES)
+    prediction = RulePredictor().predict(features)
+    for field, vocabulary in labels.FIELD_VOCABULARIES.items():
+        assert prediction[field] in vocabulary
+
+def test_forest_predict_matches_sklearn():
+    ensemble = pytest.importorskip("sklearn.ensemble")
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(80, len(FEATURE_NAMES))).astype(np.float32)
+    Y = np.array([["a" if row[0] > 0 else "b", "x" if row[1] > 0.5 else "y"] for row in X], dtype=object)
+    forest = ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(X, Y)
+    single = ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(X, Y[:, 0])
+    for row in X[:20]:
+        x = row[None, :]
+        assert forest_predict(forest, x) == list(forest.predict(x)[0])
+        assert forest_predict(single, x) == [single.predict(x)[0]]
+
+def test_old_per_field_models_still_load(tmp_path):
+    ensemble = pytest.importorskip("sklearn.ensemble")
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(40, len(FEATURE_NAMES))).astype(np.float32)
+    y = np.where(X[:, 0] > 0, labels.QUALITY[0], labels.QUALITY[2])
+    path = tmp_path / "modelo.pkl"
+    with open(path, 'wb') as f:
+        pickle.dump({'quality': ensemble.RandomForestClassifier(n_estimators=5, n_jobs=-1).fit(X, y)}, f)
+    predictor = load_predictor(str(path))
+    assert isinstance(predictor, SklearnPredictor)
+    assert predictor.models['quality'].n_jobs == 1
+    features = dict(zip(FEATURE_NAMES, X[0].tolist()))
+    assert predictor.predict(features)['quality'] == y[0]
+
+def test_train_from_validated_records(session_factory, tmp_path):
+    pytest.importorskip("sklearn")
+    rows = [record(f"/img/{i}.jpg", validation_status="Validated",
+                   quality=labels.QUALITY[i % 2], sharpness=labels.SHARPNESS[0])
+            for i in range(24)]
+    session = session_factory()
+    upsert_rows(session, ImageRecord.__table__, rows, ['path_key'])
+    session.commit()
+    session.close()
+
+    path = str(tmp_path / "modelo.pkl")
+    loader = lambda file_path: fundus(int(file_path.rsplit('/', 1)[-1].split('.')[0]))
+    assert train_from_records(session_factory, path, loader=loader) == 24
+    predictor = load_predictor(path)
+    # Sólo se entrenan los campos con al menos dos valores distintos
+    assert predictor.fields == ['quality']
+    assert predictor.models[None].n_jobs == 1
+    assert predictor.predict(compute_features(fundus(3)))['quality'] in labels.QUALITY
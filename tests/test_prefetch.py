@@ -0,0 +1,46 @@
+import threading
+from PIL import Image
+from prefetch import ImageCache, ImagePrefetcher
+
+def image(side):
+    return Image.new('RGB', (side, side))
+
+def test_cache_evicts_least_recently_used():
+    cache = ImageCache(max_bytes=3 * 10 * 10 * 3)
+    for key in "abc":
+        cache.put(key, image(10))
+    assert cache.get("a") is not None  # "a" pasa a ser la más reciente
+    cache.put("d", image(10))
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert cache.current_bytes == 3 * 300
+
+def test_cache_skips_images_larger_than_limit():
+    cache = ImageCache(max_bytes=100)
+    cache.put("grande", image(10))
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+def test_cache_hit_rate():
+    cache = ImageCache()
+    cache.put("a", image(2))
+    cache.get("a")
+    cache.get("b")
+    assert cache.hit_rate() == 0.5
+
+def test_prefetcher_decodes_window_ahead():
+    decoded = []
+    lock = threading.Lock()
+
+    def loader(path):
+        with lock:
+            decoded.append(path)
+        return image(4)
+
+    paths = [f"/img/{i}.jpg" for i in range(10)]
+    prefetcher = ImagePrefetcher(loader, ahead=2, behind=1, max_workers=1)
+    prefetcher.update(paths, 5)
+    # get() espera las decodificaciones en curso en vez de repetirlas
+    for i in (6, 7, 4):
+        assert prefetcher.get(paths[i]) is not None
+    prefetcher.shutdown()
+    assert sorted(decoded) == sorted(paths[i] for i in (4, 6, 7))
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+from PIL import Image
+import pyramid
+from pyramid import open_pyramid
+
+def save_image(path, width, height, seed=0):
+    array = np.random.default_rng(seed).integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    Image.fromarray(array).save(path)
+    return array
+
+def test_levels_halve_until_one_tile(tmp_path):
+    source = str(tmp_path / "foto.png")
+    array = save_image(source, 1000, 600)
+    image = open_pyramid(source, str(tmp_path / "cache"))
+    assert [level.shape[:2] for level in image.levels] == [(600, 1000), (300, 500), (150, 250)]
+    assert np.array_equal(image.levels[0], array)
+    assert image.tile_counts(0) == (4, 3)
+    assert image.tile(0, 3, 2).shape == (600 - 512, 1000 - 768, 3)
+    assert np.array_equal(image.tile(1, 1, 0), image.levels[1][:256, 256:])
+    assert image.level_for_scale(1.0) == (0, 1.0)
+    assert image.level_for_scale(0.3) == (1, 0.6)
+    assert image.level_for_scale(0.1) == (2, 0.4)
+    image.close()
+
+def test_pyramid_is_built_once_per_file_version(tmp_path, monkeypatch):
+    source = str(tmp_path / "foto.png")
+    save_image(source, 300, 300)
+    cache = str(tmp_path / "cache")
+    builds = []
+    real_build = pyramid.build_pyramid
+    monkeypatch.setattr(pyramid, 'build_pyramid', lambda *args: builds.append(1) or real_build(*args))
+
+    open_pyramid(source, cache).close()
+    open_pyramid(source, cache).close()
+    assert len(builds) == 1
+    # Otro contenido (otro tamaño o mtime) es otra pirámide
+    save_image(source, 200, 100, seed=1)
+    os.utime(source, ns=(1, 1))
+    assert open_pyramid(source, cache).width == 200
+    assert len(builds) == 2
+
+def test_prune_keeps_recent_pyramids_under_limit(tmp_path):
+    cache = str(tmp_path / "cache")
+    sources = []
+    for i in range(3):
+        sources.append(str(tmp_path / f"{i}.png"))
+        save_image(sources[-1], 200, 200, seed=i)
+    directories = []
+    for i, source in enumerate(sources):
+        image = open_pyramid(source, cache, max_bytes=10 ** 9)
+        os.utime(image.directory, (i, i))  # uso más antiguo primero
+        directories.append(image.directory)
+    one = sum(entry.stat().st_size for entry in os.scandir(directories[0]))
+    pyramid.prune_cache(cache, max_bytes=one, keep=directories[0])
+    assert [os.path.exists(path) for path in directories] == [True, False, False]
@@ -0,0 +1,47 @@
+import os
+from scanner import FolderScanner, iter_batches, iter_images, natural_key
+
+def touch(path, content=b""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def dicom_bytes():
+    return b"\0" * 128 + b"DICM" + b"\0" * 16
+
+def test_natural_order():
+    names = ["img10.jpg", "IMG2.jpg", "img1.jpg"]
+    assert sorted(names, key=natural_key) == ["img1.jpg", "IMG2.jpg", "img10.jpg"]
+
+def test_recognizes_images_by_extension_and_dicom_signature(tmp_path):
+    root = str(tmp_path)
+    touch(os.path.join(root, "b.JPG"))
+    touch(os.path.join(root, "notas.txt"))
+    touch(os.path.join(root, "1.2.840.113619"), dicom_bytes())  # DICOM con nombre de UID
+    touch(os.path.join(root, "SINEXT"), dicom_bytes())
+    touch(os.path.join(root, "otro"), b"no es dicom")
+    found = [os.path.basename(p) for p in iter_images(root)]
+    assert found == ["1.2.840.113619", "b.JPG", "SINEXT"]
+    assert [os.path.basename(p) for p in iter_images(root, sniff_dicom=False)] == ["b.JPG"]
+
+def test_recursive_lists_files_before_subfolders(tmp_path):
+    root = str(tmp_path)
+    for name in ("sub10/x.jpg", "sub2/y.jpg", "z.jpg"):
+        touch(os.path.join(root, name))
+    assert [os.path.relpath(p, root) for p in iter_images(root)] == ["z.jpg"]
+    found = [os.path.relpath(p, root) for p in iter_images(root, recursive=True)]
+    assert found == ["z.jpg", os.path.join("sub2", "y.jpg"), os.path.join("sub10", "x.jpg")]
+
+def test_first_batch_is_delivered_immediately():
+    batches = list(iter_batches(iter(range(7)), batch_size=3, max_delay=60))
+    assert batches == [[0], [1, 2, 3], [4, 5, 6]]
+
+def test_scanner_reports_validated_paths(tmp_path):
+    paths = [touch(str(tmp_path / f"{i}.jpg")) for i in range(5)]
+    scanner = FolderScanner(str(tmp_path), batch_size=2, resolver=lambda batch: {p for p in batch if p == paths[3]})
+    scanner.start()
+    assert scanner.finished.wait(5)
+    found, validated = scanner.drain()
+    assert found == paths and validated == {paths[3]}
+    assert scanner.is_done()
@@ -0,0 +1,86 @@
+from sqlalchemy import Select, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+import batch_writer
+import labels
+import stats
+from annotations import AnnotationStore
+from batch_writer import BatchWriter
+from conftest import form_data
+
+def save(session_factory, items, **options):
+    return BatchWriter(session_factory, items, None, copy_files=False, **options).run()
+
+def stats_rows(session):
+    return {(row.field, row.code): row.count for row in session.execute(select(stats.LabelStat.__table__)) if row.count}
+
+def test_incremental_stats_match_rebuild(session_factory):
+    items = [(f"/img/{i}.jpg", form_data(quality=labels.QUALITY[i % 3],
+                                        artifacts=labels.ARTIFACTS[i % 2] if i % 4 else ""))
+             for i in range(20)]
+    save(session_factory, items, chunk_size=6)
+    # Reclasificar algunas: el resumen resta los valores reemplazados
+    save(session_factory, [(path, form_data(quality=labels.QUALITY[0])) for path, _data in items[:8]])
+
+    session = session_factory()
+    incremental = stats_rows(session)
+    stats.rebuild(session)
+    assert stats_rows(session) == incremental
+    total, summary = stats.read_stats(session)
+    assert total == 20
+    assert dict(summary['quality'])[labels.QUALITY[0]] == 8 + 4
+    session.close()
+
+def test_chunk_is_retried_after_deadlock(session_factory, monkeypatch):
+    class Deadlock(Exception):
+        pgcode = '40P01'
+
+    calls = []
+    real_upsert = batch_writer.upsert_rows
+
+    def flaky_upsert(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Deadlock("deadlock detected"))
+        return real_upsert(*args, **kwargs)
+
+    monkeypatch.setattr(batch_writer, 'upsert_rows', flaky_upsert)
+    monkeypatch.setattr(batch_writer, 'CONFLICT_BACKOFF', 0)
+    result = save(session_factory, [("/a.jpg", form_data(quality=labels.QUALITY[0]))])
+    assert (result.inserted, result.failed, len(calls)) == (1, 0, 2)
+    session = session_factory()
+    assert stats.read_stats(session)[0] == 1  # el intento fallido no sumó al resumen
+    session.close()
+
+def test_apply_deltas_sorts_rows(session_factory, monkeypatch):
+    session = session_factory()
+    sent = []
+    real_execute = session.execute
+
+    def spy(stmt, params=None, *args, **kwargs):
+        if isinstance(params, list):
+            sent.append([(row['field'], row['code']) for row in params])
+        return real_execute(stmt, params, *args, **kwargs)
+
+    monkeypatch.setattr(session, 'execute', spy)
+    stats.apply_deltas(session, {('quality', 3): 1, ('artifacts', 0): 2, ('quality', 1): -1, ('total', 0): 0})
+    assert sent == [[('artifacts', 0), ('quality', 1), ('quality', 3)]]
+    session.close()
+
+def test_total_row_is_locked_before_reading_replaced_rows(session_factory, monkeypatch):
+    session = session_factory()
+    sent = []
+    real_execute = session.execute
+
+    def spy(stmt, *args, **kwargs):
+        if isinstance(stmt, Select):
+            sent.append(str(stmt.compile(dialect=postgresql.dialect())))
+        return real_execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(session, 'execute', spy)
+    store = AnnotationStore.from_items([("/a.jpg", form_data(quality=labels.QUALITY[0]))])
+    stats.record_batch(session, store.record_rows(store.pending_indices()))
+    assert "FROM label_stats" in sent[0] and sent[0].endswith("FOR UPDATE")
+    assert "FROM image_records" in sent[1]
+    session.rollback()
+    session.close()
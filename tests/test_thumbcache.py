@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from thumbcache import ThumbnailStore
+
+def source(tmp_path, name, content=b"x"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+def thumb(value, side=8):
+    return np.full((side, side, 3), value, dtype=np.uint8)
+
+def test_put_get_round_trip_from_mapped_pack(tmp_path):
+    store = ThumbnailStore(str(tmp_path / "cache"))
+    path = source(tmp_path, "a.jpg")
+    store.put(path, thumb(7))
+    array = store.get(path)
+    assert array.shape == (8, 8, 3) and (array == 7).all()
+    assert not array.flags.owndata  # vista sobre el mmap del pack, sin copia
+    store.close()
+
+    reopened = ThumbnailStore(str(tmp_path / "cache"))
+    assert (reopened.get(path) == 7).all()
+    reopened.close()
+
+def test_changed_file_is_a_miss(tmp_path):
+    store = ThumbnailStore(str(tmp_path / "cache"))
+    path = source(tmp_path, "a.jpg")
+    store.put(path, thumb(1))
+    os.utime(path, ns=(0, 0))
+    assert store.get(path) is None
+    store.close()
+
+def test_renamed_copy_adopts_thumbnail_by_content(tmp_path):
+    store = ThumbnailStore(str(tmp_path / "cache"), use_content_hash=True)
+    store.put(source(tmp_path, "a.jpg", b"mismo"), thumb(3))
+    copy = source(tmp_path, "copia.jpg", b"mismo")
+    assert (store.get(copy) == 3).all()
+    store.close()
+
+def test_limit_evicts_least_recently_used_and_compacts(tmp_path):
+    one = 8 * 8 * 3
+    store = ThumbnailStore(str(tmp_path / "cache"), max_bytes=5 * one)
+    paths = [source(tmp_path, f"{i}.jpg") for i in range(5)]
+    for i, path in enumerate(paths):
+        store.put(path, thumb(i))
+    store.get(paths[0])
+    store.put(source(tmp_path, "nueva.jpg"), thumb(9))
+
+    assert os.path.getsize(store._pack_path()) <= 5 * one
+    assert store.live_bytes() <= 4 * one
+    assert (store.get(paths[0]) == 0).all()  # usada hace poco: se conserva
+    assert store.get(paths[1]) is None
+    assert len([n for n in os.listdir(tmp_path / "cache") if n.endswith(".pack")]) == 1
+    store.close()
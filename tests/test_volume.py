@@ -0,0 +1,69 @@
+import numpy as np
+from volume import DicomVolume, open_volume
+
+def write_volume(path, volume):
+    """DICOM multi-frame de 16 bits sin comprimir con los cortes de `volume`."""
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = "OPT"
+    if volume.shape[0] > 1:
+        ds.NumberOfFrames = volume.shape[0]
+    ds.Rows, ds.Columns = volume.shape[1:]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PixelRepresentation = 0
+    ds.PixelData = volume.astype(np.uint16).tobytes()
+    ds.save_as(path, enforce_file_format=True)
+    return path
+
+def sample_volume(frames=6, rows=40, cols=60):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4096, size=(frames, rows, cols), dtype=np.uint16)
+
+def test_frames_are_memory_mapped_views(tmp_path):
+    data = sample_volume()
+    volume = open_volume(write_volume(str(tmp_path / "oct.dcm"), data))
+    assert isinstance(volume, DicomVolume)
+    assert (volume.frames, volume.rows, volume.columns) == data.shape
+    assert isinstance(volume._data, np.memmap)
+    for i in (0, 3, 5):
+        assert np.array_equal(volume.frame(i), data[i])
+    volume.close()
+    assert volume._data is None
+
+def test_window_is_shared_by_all_frames(tmp_path):
+    data = sample_volume()
+    data[1] = data[0] // 2  # un corte más oscuro no se reescala al rango completo
+    data[4, 5, 5] = data[2, 0, 0]
+    volume = open_volume(write_volume(str(tmp_path / "oct.dcm"), data))
+    first, darker = volume.display_frame(0), volume.display_frame(1)
+    assert first.dtype == np.uint8 and first.shape == data.shape[1:]
+    assert darker.max() < first.max()
+    # El mismo valor almacenado se ve igual en cualquier corte
+    assert volume.display_frame(4)[5, 5] == volume.display_frame(2)[0, 0]
+    volume.close()
+
+def test_views_fit_max_size(tmp_path):
+    volume = open_volume(write_volume(str(tmp_path / "oct.dcm"), sample_volume(rows=200, cols=300)))
+    assert max(volume.mip_image((100, 100)).size) <= 100
+    assert max(volume.display_image(2, (100, 100)).size) <= 100
+    assert volume.thumbnail_array((100, 100), mode='mip').dtype == np.uint8
+    volume.close()
+
+def test_single_frame_and_other_files_are_not_volumes(tmp_path):
+    assert open_volume(write_volume(str(tmp_path / "plano.dcm"), sample_volume(frames=1))) is None
+    other = tmp_path / "foto.jpg"
+    other.write_bytes(b"no es dicom")
+    assert open_volume(str(other)) is None
@@ -0,0 +1,99 @@
+import os
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from precompute import load_precomputed
+from predictor import RulePredictor
+from watcher import FolderWatcher, Inotify, IngestQueue
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.02)
+    return condition()
+
+def save_image(path, seed=0):
+    array = np.random.default_rng(seed).integers(0, 255, size=(32, 32, 3), dtype=np.uint8)
+    Image.fromarray(array).save(path)
+    return path
+
+def delivered(watcher, timeout=5.0):
+    paths, validated = [], set()
+    def collect():
+        batch, batch_validated = watcher.drain()
+        paths.extend(batch)
+        validated.update(batch_validated)
+        return paths
+    wait_for(collect, timeout)
+    return paths, validated
+
+def watch_new_files(tmp_path, use_inotify):
+    old = save_image(str(tmp_path / "vieja.png"))
+    os.utime(old, (time.time() - 60, time.time() - 60))
+    watcher = FolderWatcher(str(tmp_path), resolver=lambda paths: {p for p in paths if "validada" in p},
+                            settle_seconds=0.2, poll_seconds=0.05, use_inotify=use_inotify).start()
+    try:
+        assert wait_for(lambda: watcher.backend)
+        (tmp_path / "notas.txt").write_text("no es imagen")
+        new = save_image(str(tmp_path / "nueva.png"))
+        validated_path = save_image(str(tmp_path / "validada.png"), seed=1)
+        paths, validated = delivered(watcher)
+        assert sorted(paths) == sorted([new, validated_path])
+        assert validated == {validated_path}
+        time.sleep(0.4)
+        assert watcher.drain() == ([], set())  # cada archivo se entrega una vez
+    finally:
+        watcher.stop()
+    return watcher.backend
+
+def test_scandir_backend_reports_settled_new_images(tmp_path):
+    assert watch_new_files(tmp_path, use_inotify=False) == 'scandir'
+
+def test_inotify_backend_reports_settled_new_images(tmp_path):
+    try:
+        Inotify().close()
+    except OSError:
+        pytest.skip("inotify no disponible")
+    assert watch_new_files(tmp_path, use_inotify=True) == 'inotify'
+
+def test_file_still_being_written_is_held_back(tmp_path):
+    path = tmp_path / "captura.png"
+    path.write_bytes(b"parte")
+    watcher = FolderWatcher(str(tmp_path), settle_seconds=1.0)
+    watcher._track(str(path), now=0.0)
+    assert watcher._settle(0.5) == []
+    with open(path, 'ab') as f:
+        f.write(b" y el resto")
+    assert watcher._settle(1.5) == []  # cambió: vuelve a esperar
+    assert watcher._settle(2.0) == []
+    assert watcher._settle(2.6) == [str(path)]
+
+def test_ingest_saves_suggestions_and_fills_the_cache(session_factory, tmp_path):
+    class Cache:
+        def __init__(self):
+            self.items = {}
+
+        def put(self, path, image):
+            self.items[path] = image
+
+    path = save_image(str(tmp_path / "nueva.png"))
+    cache = Cache()
+    ingest = IngestQueue(session_factory, RulePredictor(), cache, loader=Image.open).start()
+    try:
+        ingest.put([path])
+
+        def suggestion():
+            session = session_factory()
+            try:
+                return load_precomputed(session, path)
+            finally:
+                session.close()
+
+        assert wait_for(suggestion)
+        assert path in cache.items
+    finally:
+        ingest.stop()
@@ -0,0 +1,291 @@
+"""
+Caché persistente de miniaturas en disco.
+
+Las miniaturas (uint8 RGB ya reducidas) se guardan concatenadas en un archivo
+"pack" que se lee mediante mmap, y un índice SQLite asocia cada imagen
+(ruta + tamaño + mtime, opcionalmente hash del contenido) con su posición
+en el pack. Al reabrir una carpeta ya vista las imágenes no se vuelven a
+decodificar.
+
+Uso por línea de comandos para precalentar una carpeta:
+    python thumbcache.py warm <carpeta>
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+import threading
+import time
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thumbnail_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Cada cuántas lecturas se vuelcan al índice las marcas de último acceso
+TOUCH_FLUSH_INTERVAL = 256
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Hash BLAKE2b del contenido del archivo (para detectar copias renombradas)."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ThumbnailStore:
+    """
+    Almacén de miniaturas con índice SQLite y pack de píxeles mapeado en memoria.
+    Limita el tamaño total y expulsa las miniaturas menos usadas (LRU).
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, use_content_hash=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.use_content_hash = use_content_hash
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._touched = {}
+        self._mmap = None
+        self._conn = sqlite3.connect(os.path.join(directory, "thumbnails.idx"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS thumbs (
+                path TEXT NOT NULL,
+                max_w INTEGER NOT NULL,
+                max_h INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT,
+                offset INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (path, max_w, max_h)
+            );
+            CREATE INDEX IF NOT EXISTS ix_thumbs_hash ON thumbs (content_hash, max_w, max_h);
+            CREATE INDEX IF NOT EXISTS ix_thumbs_access ON thumbs (last_access);
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+        self._generation = int(row[0]) if row else 0
+        self._remove_stale_packs()
+
+    # --- Archivo pack ---
+
+    def _pack_path(self, generation=None):
+        gen = self._generation if generation is None else generation
+        return os.path.join(self.directory, f"thumbnails-{gen}.pack")
+
+    def _remove_stale_packs(self):
+        current = os.path.basename(self._pack_path())
+        for name in os.listdir(self.directory):
+            if name.startswith("thumbnails-") and name.endswith(".pack") and name != current:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # En Windows puede seguir mapeado; se limpiará en la próxima apertura
+
+    def _view(self, offset, nbytes):
+        """Devuelve el mmap del pack garantizando que cubre [offset, offset + nbytes)."""
+        if self._mmap is None or offset + nbytes > len(self._mmap):
+            pack = self._pack_path()
+            if not os.path.exists(pack) or os.path.getsize(pack) < offset + nbytes:
+                return None
+            with open(pack, 'rb') as f:
+                # El mmap anterior se libera cuando ya no queden arrays que lo referencien
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    # --- Lectura / escritura ---
+
+    def get(self, file_path, max_size=(500, 500)):
+        """
+        Devuelve la miniatura como array uint8 (alto, ancho, 3) que apunta
+        directamente al pack mapeado (sin copia), o None si no está o quedó obsoleta.
+        """
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        key = (file_path, max_size[0], max_size[1])
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, offset, width, height, nbytes FROM thumbs "
+                "WHERE path=? AND max_w=? AND max_h=?", key).fetchone()
+            if row is not None and (row[0], row[1]) != (st.st_size, st.st_mtime_ns):
+                row = None
+            if row is None and self.use_content_hash:
+                row = self._adopt_by_hash(file_path, st, max_size)
+            if row is None:
+                return None
+
+            _size, _mtime, offset, width, height, nbytes = row
+            view = self._view(offset, nbytes)
+            if view is None:
+                return None
+            self._touch(key)
+            return np.frombuffer(view, dtype=np.uint8, count=nbytes, offset=offset).reshape(height, width, 3)
+
+    def _adopt_by_hash(self, file_path, st, max_size):
+        """Reutiliza la miniatura de un archivo con idéntico contenido (copia renombrada)."""
+        content_hash = file_content_hash(file_path)
+        row = self._conn.execute(
+            "SELECT offset, width, height, nbytes FROM thumbs "
+            "WHERE content_hash=? AND max_w=? AND max_h=? LIMIT 1",
+            (content_hash, max_size[0], max_size[1])).fetchone()
+        if row is None:
+            return None
+        offset, width, height, nbytes = row
+        self._conn.execute(
+            "INSERT OR REPLACE INTO thumbs VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            (file_path, max_size[0], max_size[1], st.st_size, st.st_mtime_ns, content_hash,
+             offset, width, height, nbytes, time.time()))
+        self._conn.commit()
+        return (st.st_size, st.st_mtime_ns, offset, width, height, nbytes)
+
+    def put(self, file_path, array, max_size=(500, 500)):
+        """Agrega (o reemplaza) la miniatura de un archivo. `array` debe ser uint8 RGB."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        if array.ndim != 3 or array.shape[2] != 3:
+            raise ValueError("La miniatura debe ser un array uint8 de forma (alto, ancho, 3)")
+        content_hash = file_content_hash(file_path) if self.use_content_hash else None
+
+        with self._lock:
+            pack = self._pack_path()
+            with open(pack, 'ab') as f:
+                offset = f.tell()
+                f.write(array.data)
+                pack_size = f.tell()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbs VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                (file_path, max_size[0], max_size[1], st.st_size, st.st_mtime_ns, content_hash,
+                 offset, array.shape[1], array.shape[0], array.nbytes, time.time()))
+            self._flush_touches()
+            self._conn.commit()
+            self._enforce_limit(pack_size)
+
+    def _touch(self, key):
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_FLUSH_INTERVAL:
+            self._flush_touches()
+            self._conn.commit()
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE thumbs SET last_access=? WHERE path=? AND max_w=? AND max_h=?",
+                [(t,) + key for key, t in self._touched.items()])
+            self._touched.clear()
+
+    # --- Límite de tamaño ---
+
+    def live_bytes(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(nbytes), 0) FROM (SELECT DISTINCT offset, nbytes FROM thumbs)").fetchone()[0]
+
+    def _enforce_limit(self, pack_size=None):
+        # El tamaño del pack sale de la escritura; las miniaturas vivas (una
+        # pasada por el índice) sólo se suman cuando hay que expulsar
+        if pack_size is None:
+            pack = self._pack_path()
+            pack_size = os.path.getsize(pack) if os.path.exists(pack) else 0
+        if pack_size <= self.max_bytes:
+            return
+        live = self.live_bytes()
+
+        # Expulsar las menos usadas hasta quedar en el 80% del límite
+        target = int(self.max_bytes * 0.8)
+        if live > target:
+            rows = self._conn.execute(
+                "SELECT path, max_w, max_h, nbytes FROM thumbs ORDER BY last_access").fetchall()
+            victims = []
+            for path, max_w, max_h, nbytes in rows:
+                if live <= target:
+                    break
+                victims.append((path, max_w, max_h))
+                live -= nbytes
+            self._conn.executemany("DELETE FROM thumbs WHERE path=? AND max_w=? AND max_h=?", victims)
+            self._conn.commit()
+        self._compact()
+
+    def _compact(self):
+        """Reescribe el pack sólo con las miniaturas vivas en un archivo de nueva generación."""
+        old_pack = self._pack_path()
+        new_generation = self._generation + 1
+        new_pack = self._pack_path(new_generation)
+        rows = self._conn.execute(
+            "SELECT DISTINCT offset, nbytes FROM thumbs ORDER BY offset").fetchall()
+        relocation = {}
+        with open(old_pack, 'rb') as src, open(new_pack, 'wb') as dst:
+            for offset, nbytes in rows:
+                src.seek(offset)
+                relocation[offset] = dst.tell()
+                dst.write(src.read(nbytes))
+        self._conn.executemany("UPDATE thumbs SET offset=? WHERE offset=?",
+                               [(new, old) for old, new in relocation.items()])
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('generation', ?)", (str(new_generation),))
+        self._conn.commit()
+        self._generation = new_generation
+        self._mmap = None
+        try:
+            os.remove(old_pack)
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+            self._mmap = None
+
+def warm_folder(store, image_paths, loader, max_size=(500, 500), stop_event=None, on_progress=None):
+    """
+    Genera las miniaturas que falten para `image_paths`. Pensada para correr en un
+    hilo de fondo; se detiene en cuanto `stop_event` se activa.
+    """
+    done = 0
+    for file_path in image_paths:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if store.get(file_path, max_size) is None:
+            loader(file_path, max_size)
+        done += 1
+        if on_progress is not None:
+            on_progress(done)
+    return done
+
+def start_warming(store, image_paths, loader, max_size=(500, 500), on_progress=None):
+    """Lanza `warm_folder` en un hilo daemon. Devuelve el evento para detenerlo."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=warm_folder, name="thumbcache-warm", daemon=True,
+                              args=(store, list(image_paths), loader, max_size, stop_event, on_progress))
+    thread.start()
+    return stop_event
+
+def main(argv):
+    if len(argv) != 3 or argv[1] != "warm":
+        print("Uso: python thumbcache.py warm <carpeta>")
+        return 1
+    import utils
+    from scanner import iter_images
+
+    paths = list(iter_images(argv[2], recursive=True))
+    store = ThumbnailStore()
+    utils.set_thumbnail_store(store)
+    start = time.perf_counter()
+    total = warm_folder(store, paths, utils.decode_image_for_display)
+    store.close()
+    print(f"✅ {total} miniaturas listas en {time.perf_counter() - start:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -2,48 +2,191 @@
 Funciones de utilidad para el procesamiento y manejo de imágenes médicas.
 """
 import os
-import shutil
 import pydicom
 from PIL import Image, ImageTk
 import numpy as np
+import perf
 
-def load_image_for_display(file_path, max_size=(500, 500)):
+# Rango máximo de valores almacenados para usar tabla de búsqueda (LUT) directa
+MAX_LUT_SIZE = 1 << 20
+
+# Caché persistente de miniaturas (thumbcache.ThumbnailStore), opcional
+_thumbnail_store = None
+
+def set_thumbnail_store(store):
+    """Configura el almacén de miniaturas en disco que usa `decode_image_for_display`."""
+    global _thumbnail_store
+    _thumbnail_store = store
+
+def _first_value(value):
+    """Devuelve el primer valor numérico de un atributo DICOM que puede ser multivalor."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except TypeError:
+        return float(value[0]) if len(value) else None
+
+def downsample_for_display(pixel_array, max_size):
     """
-    Carga una imagen (JPG o DICOM) y la convierte a un objeto compatible con Tkinter.
+    Reduce la matriz con un paso entero (vista sin copia) de modo que siga siendo
+    igual o mayor que el tamaño de visualización; el ajuste fino lo hace `thumbnail`.
+    """
+    height, width = pixel_array.shape[:2]
+    step = int(max(width / max_size[0], height / max_size[1]))
+    if step <= 1:
+        return pixel_array
+    return pixel_array[::step, ::step]
+
+def build_window_lut(ds, vmin, vmax):
+    """
+    Construye una LUT uint8 indexada por (valor almacenado - vmin) que aplica
+    RescaleSlope/RescaleIntercept y la ventana WindowCenter/WindowWidth del estudio.
+    Si el estudio no define ventana se usa el rango completo de la imagen.
+    """
+    slope = _first_value(getattr(ds, 'RescaleSlope', None)) or 1.0
+    intercept = _first_value(getattr(ds, 'RescaleIntercept', None)) or 0.0
+    values = np.arange(vmin, vmax + 1, dtype=np.float32)
+    values *= slope
+    values += intercept
+
+    center = _first_value(getattr(ds, 'WindowCenter', None))
+    width = _first_value(getattr(ds, 'WindowWidth', None))
+    if center is not None and width is not None and width >= 1:
+        # Ventana lineal según DICOM PS3.3 C.11.2.1.2
+        low = center - 0.5 - (width - 1) / 2
+        high = center - 0.5 + (width - 1) / 2
+    else:
+        low = float(values[0]) if len(values) else 0.0
+        high = float(values[-1]) if len(values) else 0.0
+        if slope < 0:
+            low, high = high, low
+
+    if high <= low:
+        # Imagen constante: evitar la división por cero
+        lut = np.zeros(len(values), dtype=np.uint8)
+    else:
+        values -= low
+        values *= 255.0 / (high - low)
+        np.clip(values, 0, 255, out=values)
+        lut = values.astype(np.uint8)
+
+    if getattr(ds, 'PhotometricInterpretation', '') == 'MONOCHROME1':
+        np.subtract(255, lut, out=lut)
+    return lut
+
+def dicom_to_display_array(ds, max_size=(500, 500), pixel_array=None):
+    """
+    Convierte los píxeles de un DICOM a uint8 para visualización.
+    Primero reduce (vista con paso entero) y luego aplica ventana/nivel con una
+    LUT precalculada, trabajando en enteros sobre la matriz ya reducida.
+    """
+    if pixel_array is None:
+        pixel_array = ds.pixel_array
+    small = downsample_for_display(pixel_array, max_size)
+    is_color = small.ndim == 3 and small.shape[-1] in (3, 4)
+
+    if is_color and small.dtype == np.uint8:
+        return np.ascontiguousarray(small)
+
+    if small.dtype.kind in 'iu':
+        vmin = int(small.min())
+        vmax = int(small.max())
+        if vmax - vmin < MAX_LUT_SIZE:
+            lut = build_window_lut(ds, vmin, vmax)
+            # Copia compacta en entero para indexar la LUT en sitio
+            index = small.astype(np.int32 if small.dtype.kind == 'i' else small.dtype)
+            index -= vmin
+            return lut.take(index)
+
+    # Tipos flotantes o rangos enormes: normalizar sólo la matriz reducida
+    small = small.astype(np.float32)
+    low = float(small.min())
+    high = float(small.max())
+    if high <= low:
+        return np.zeros(small.shape, dtype=np.uint8)
+    small -= low
+    small *= 255.0 / (high - low)
+    return small.astype(np.uint8)
+
+def decode_image_for_display(file_path, max_size=(500, 500)):
     """
+    Decodifica una imagen (JPG o DICOM) y la reduce a un objeto PIL listo para mostrar.
+    No toca Tkinter, por lo que puede ejecutarse en un hilo de fondo.
+    Si hay un almacén de miniaturas configurado se lee de él sin decodificar.
+    """
+    store = _thumbnail_store
+    if store is not None:
+        cached = store.get(file_path, max_size)
+        if cached is not None:
+            perf.count('thumbcache.hit')
+            return Image.fromarray(cached)
+        perf.count('thumbcache.miss')
+
     try:
-        ext = os.path.splitext(file_path)[1].lower()
-
-        if ext in ['.dcm', '.dicom']:
-            ds = pydicom.dcmread(file_path)
-            # Normalizar a 8-bit para visualización
-            pixel_array = ds.pixel_array
-            pixel_array = pixel_array - np.min(pixel_array)
-            pixel_array = pixel_array / np.max(pixel_array)
-            pixel_array = (pixel_array * 255).astype(np.uint8)
-            image = Image.fromarray(pixel_array)
-        else:
-            image = Image.open(file_path)
-
-        image.thumbnail(max_size)
-        return ImageTk.PhotoImage(image)
+        with perf.timer('decode'):
+            ext = os.path.splitext(file_path)[1].lower()
+
+            if ext in ['.dcm', '.dicom']:
+                from volume import DEFER_SIZE, DicomVolume, number_of_frames
+                with perf.timer('decode.dcmread'):
+                    # PixelData se lee recién al usarse (o se mapea en memoria si es un volumen)
+                    ds = pydicom.dcmread(file_path, defer_size=DEFER_SIZE)
+                if number_of_frames(ds) > 1:
+                    # Volumen OCT: corte central (o MIP) con lecturas con paso, sin decodificar todo
+                    volume = DicomVolume(file_path, ds)
+                    try:
+                        image = Image.fromarray(volume.thumbnail_array(max_size))
+                    finally:
+                        volume.close()
+                else:
+                    # Reducir y aplicar ventana/nivel a 8-bit para visualización
+                    image = Image.fromarray(dicom_to_display_array(ds, max_size))
+            else:
+                image = Image.open(file_path)
+
+            # En JPEG la decodificación real ocurre aquí (modo draft)
+            with perf.timer('thumbnail'):
+                image.thumbnail(max_size)
+        if store is not None:
+            with perf.timer('thumbcache.put'):
+                image = image.convert('RGB')
+                store.put(file_path, np.asarray(image), max_size)
+        return image
     except Exception as e:
         print(f"Error cargando imagen: {e}")
         return None
 
-def copy_file_based_on_quality(file_path, quality, base_dir):
+def to_photo_image(image):
     """
-    Copia el archivo a una carpeta basada en su calidad.
+    Convierte una imagen PIL en un objeto compatible con Tkinter.
+    Debe llamarse desde el hilo principal de Tk.
     """
-    target_dir = os.path.join(base_dir, "Clasificadas", quality)
-    os.makedirs(target_dir, exist_ok=True)
+    if image is None:
+        return None
+    with perf.timer('photoimage'):
+        return ImageTk.PhotoImage(image)
 
-    filename = os.path.basename(file_path)
-    destination = os.path.join(target_dir, filename)
+@perf.timed('load_image_for_display')
+def load_image_for_display(file_path, max_size=(500, 500)):
+    """
+    Carga una imagen (JPG o DICOM) y la convierte a un objeto compatible con Tkinter.
+    """
+    return to_photo_image(decode_image_for_display(file_path, max_size))
+
+@perf.timed('copy_file')
+def copy_file_based_on_quality(file_path, quality, base_dir):
+    """
+    Guarda el archivo en el almacén de Clasificadas/ y lo enlaza en la carpeta
+    de su calidad. Para lotes grandes usar `copy_engine.CopyEngine`, que copia
+    en paralelo.
+    """
+    from blobstore import BlobStore
+    from copy_engine import classified_root
 
     try:
-        shutil.copy2(file_path, destination)
-        return destination
+        destination, _key = BlobStore(classified_root(base_dir)).classify(file_path, quality)
     except Exception as e:
         print(f"Error copiando archivo: {e}")
         return None
+    return destination
@@ -0,0 +1,166 @@
+"""
+Volúmenes DICOM multi-frame (OCT / OCTA) con decodificación perezosa por corte.
+
+Si los píxeles están sin comprimir se mapean en memoria (`np.memmap` sobre el
+desplazamiento de PixelData en el archivo) y cada corte es una vista: sólo se
+leen del disco las filas que se muestran. Si están comprimidos se decodifica
+un único frame cada vez con `pydicom.pixels.pixel_array(..., index=i)`.
+
+La ventana/nivel se calcula una sola vez para todo el volumen (con
+`utils.build_window_lut` sobre una muestra con paso), de modo que el brillo no
+cambia al desplazarse entre cortes.
+"""
+import os
+import numpy as np
+import pydicom
+from PIL import Image
+from utils import MAX_LUT_SIZE, build_window_lut, dicom_to_display_array, downsample_for_display
+
+# Elementos más grandes que esto no se leen al abrir (PixelData queda en el archivo)
+DEFER_SIZE = '64 KB'
+# Vista por defecto de un volumen en miniaturas y al abrirlo: 'middle' o 'mip'
+DEFAULT_THUMBNAIL = 'middle'
+# Cortes muestreados como máximo para la proyección de máxima intensidad
+MIP_MAX_FRAMES = 32
+# Muestra (por eje) para estimar el rango de valores del volumen
+RANGE_SAMPLE = 64
+
+def number_of_frames(ds):
+    try:
+        return int(getattr(ds, 'NumberOfFrames', 1) or 1)
+    except (TypeError, ValueError):
+        return 1
+
+class DicomVolume:
+    """
+    Acceso por corte a un DICOM multi-frame. `frame(i)` devuelve los valores
+    almacenados del corte i; `display_frame(i, max_size)` el corte reducido en uint8.
+    """
+    def __init__(self, file_path, ds=None):
+        self.file_path = file_path
+        self.ds = ds if ds is not None else pydicom.dcmread(file_path, defer_size=DEFER_SIZE)
+        self.frames = number_of_frames(self.ds)
+        self.rows = int(self.ds.Rows)
+        self.columns = int(self.ds.Columns)
+        self.samples = int(getattr(self.ds, 'SamplesPerPixel', 1) or 1)
+        self._data = self._map_pixels()
+        self._lut = None
+        self._vmin = self._vmax = 0
+        self._init_window()
+
+    def _map_pixels(self):
+        """Devuelve un np.memmap (frames, filas, columnas[, muestras]) o None si no es posible."""
+        ds = self.ds
+        transfer_syntax = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+        if transfer_syntax is None or transfer_syntax.is_compressed or transfer_syntax.is_deflated:
+            return None
+        bits = int(getattr(ds, 'BitsAllocated', 0) or 0)
+        if bits not in (8, 16, 32) or (self.samples > 1 and int(getattr(ds, 'PlanarConfiguration', 0) or 0)):
+            return None
+        element = ds.get_item(0x7FE00010, keep_deferred=True)
+        if element is None or getattr(element, 'value_tell', None) is None:
+            return None
+        kind = 'i' if int(getattr(ds, 'PixelRepresentation', 0) or 0) else 'u'
+        dtype = np.dtype(f"{kind}{bits // 8}").newbyteorder('<' if transfer_syntax.is_little_endian else '>')
+        shape = (self.frames, self.rows, self.columns) + ((self.samples,) if self.samples > 1 else ())
+        if element.length < int(np.prod(shape)) * dtype.itemsize:
+            return None
+        try:
+            return np.memmap(self.file_path, dtype=dtype, mode='r', offset=element.value_tell, shape=shape)
+        except (OSError, ValueError) as e:
+            print(f"Error mapeando volumen {self.file_path}: {e}")
+            return None
+
+    def frame(self, index):
+        """Valores almacenados del corte `index` (vista del archivo si está mapeado)."""
+        if self._data is not None:
+            return self._data[index]
+        from pydicom.pixels import pixel_array
+        return pixel_array(self.file_path, index=index)
+
+    def _sampled(self, frame_step, row_step, col_step):
+        """Submuestra del volumen con pasos enteros, leyendo sólo los cortes necesarios."""
+        if self._data is not None:
+            return self._data[::frame_step, ::row_step, ::col_step]
+        return np.stack([self.frame(i)[::row_step, ::col_step] for i in range(0, self.frames, frame_step)])
+
+    def _init_window(self):
+        """Precalcula la LUT de ventana/nivel común a todos los cortes (monocromo entero)."""
+        if self.samples != 1:
+            return
+        frame_step = max(1, self.frames // 8)
+        row_step = max(1, self.rows // RANGE_SAMPLE)
+        col_step = max(1, self.columns // RANGE_SAMPLE)
+        sample = self._sampled(frame_step, row_step, col_step)
+        if sample.dtype.kind not in 'iu':
+            return
+        vmin, vmax = int(sample.min()), int(sample.max())
+        if vmax - vmin >= MAX_LUT_SIZE:
+            return
+        self._vmin, self._vmax = vmin, vmax
+        self._lut = build_window_lut(self.ds, vmin, vmax)
+
+    def _to_display(self, small):
+        if self._lut is None:
+            # `small` ya está reducida: tamaño máximo = el suyo
+            return dicom_to_display_array(self.ds, (small.shape[1], small.shape[0]), pixel_array=small)
+        index = small.astype(np.int32)
+        np.clip(index, self._vmin, self._vmax, out=index)
+        index -= self._vmin
+        return self._lut.take(index)
+
+    def display_frame(self, index, max_size=(500, 500)):
+        """Corte `index` reducido (lectura con paso) y con ventana/nivel, en uint8."""
+        return self._to_display(downsample_for_display(self.frame(index), max_size))
+
+    def display_image(self, index, max_size=(500, 500)):
+        """Corte `index` como imagen PIL ajustada a `max_size`."""
+        image = Image.fromarray(self.display_frame(index, max_size))
+        image.thumbnail(max_size)
+        return image
+
+    def mip_image(self, max_size=(500, 500)):
+        """Proyección de máxima intensidad como imagen PIL ajustada a `max_size`."""
+        image = Image.fromarray(self.mip(max_size))
+        image.thumbnail(max_size)
+        return image
+
+    def mip(self, max_size=(500, 500)):
+        """Proyección de máxima intensidad a lo largo de los cortes, con lecturas con paso."""
+        step = int(max(self.columns / max_size[0], self.rows / max_size[1], 1))
+        frame_step = max(1, self.frames // MIP_MAX_FRAMES)
+        projection = self._sampled(frame_step, step, step).max(axis=0)
+        return self._to_display(projection)
+
+    def thumbnail_array(self, max_size=(500, 500), mode=DEFAULT_THUMBNAIL):
+        """Vista por defecto del volumen: corte central o MIP."""
+        if mode == 'mip':
+            return self.mip(max_size)
+        return self.display_frame(self.frames // 2, max_size)
+
+    def close(self):
+        """Libera el mapeo del archivo."""
+        if self._data is not None:
+            mmap = getattr(self._data, '_mmap', None)
+            self._data = None
+            if mmap is not None:
+                try:
+                    mmap.close()
+                except (BufferError, ValueError):
+                    pass  # aún hay vistas en uso; se libera con ellas
+
+def open_volume(file_path):
+    """Devuelve un DicomVolume si `file_path` es un DICOM multi-frame, si no None."""
+    if os.path.splitext(file_path)[1].lower() not in ('.dcm', '.dicom', ''):
+        return None
+    try:
+        ds = pydicom.dcmread(file_path, defer_size=DEFER_SIZE)
+    except Exception:
+        return None
+    if number_of_frames(ds) <= 1:
+        return None
+    try:
+        return DicomVolume(file_path, ds)
+    except Exception as e:
+        print(f"Error abriendo volumen: {e}")
+        return None
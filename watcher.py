@@ -0,0 +1,372 @@
+"""
+Modo de vigilancia de carpeta: incorpora las imágenes que va dejando la
+estación de captura sin volver a escanear la carpeta.
+
+En Linux los cambios llegan por inotify (vía ctypes, sin dependencias); en
+otros sistemas, o si inotify no está disponible, se compara periódicamente
+el contenido con `os.scandir`: sólo se vuelven a listar las carpetas cuyo
+mtime cambió (crear o renombrar un archivo cambia el de su carpeta). Cada
+`FULL_SWEEP_SECONDS` se hace además un barrido completo, que detecta archivos
+reescritos en el lugar y lo que inotify no ve (p. ej. escrituras de otra
+máquina en una carpeta compartida por red).
+
+Un archivo se entrega recién cuando terminó de escribirse: su tamaño y mtime
+no cambian durante `SETTLE_SECONDS` (o inotify avisó que se cerró tras
+escribirlo) y se puede abrir para lectura.
+
+`IngestQueue` decodifica en segundo plano las imágenes entregadas, las deja
+en la caché de la GUI y en la de miniaturas, y guarda sus sugerencias y su
+hash perceptual, así ya están listas cuando el médico llega a ellas.
+"""
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from scanner import is_image_file
+
+# Segundos sin cambios de tamaño ni mtime para dar un archivo por completo
+SETTLE_SECONDS = 2.0
+# Intervalo de comprobación (espera máxima por eventos de inotify)
+POLL_SECONDS = 1.0
+FULL_SWEEP_SECONDS = 30.0
+INGEST_CHUNK_SIZE = 50
+
+# Constantes de inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (luego el nombre)
+
+class Inotify:
+    """Acceso mínimo a inotify de Linux con ctypes. Lanza OSError si no está disponible."""
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError("inotify no disponible en este sistema") from None
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._folders = {}  # descriptor de vigilancia -> carpeta
+
+    def watch(self, folder):
+        wd = self._add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), folder)
+        self._folders[wd] = folder
+
+    def read(self, timeout):
+        """Espera hasta `timeout` segundos y devuelve los eventos como pares (máscara, ruta)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        events = []
+        if not ready:
+            return events
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+                offset += _EVENT.size + length
+                if mask & IN_IGNORED:
+                    self._folders.pop(wd, None)
+                    continue
+                folder = self._folders.get(wd)
+                if mask & IN_Q_OVERFLOW or folder is None:
+                    events.append((IN_Q_OVERFLOW, None))
+                elif name:
+                    events.append((mask, os.path.join(folder, os.fsdecode(name))))
+
+    def close(self):
+        os.close(self.fd)
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def _readable(path):
+    # En Windows un archivo que otro proceso sigue escribiendo no se puede abrir
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+class FolderWatcher:
+    """
+    Vigila `folder` en un hilo de fondo y deja en una cola las imágenes nuevas o
+    modificadas, ya completas, con la misma interfaz que `FolderScanner`
+    (`drain()` devuelve (rutas, validadas)). Lo que ya existía al empezar no se
+    informa, salvo lo modificado poco antes (puede no haberlo visto el escaneo).
+    """
+    def __init__(self, folder, recursive=False, sniff_dicom=True, resolver=None,
+                 settle_seconds=SETTLE_SECONDS, poll_seconds=POLL_SECONDS, use_inotify=True):
+        self.folder = folder
+        self.recursive = recursive
+        self.sniff_dicom = sniff_dicom
+        self.resolver = resolver
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.use_inotify = use_inotify
+        self.backend = None  # 'inotify' o 'scandir' una vez iniciado
+        self.batches = queue.Queue()
+        self.stop_event = threading.Event()
+        self._files = {}    # ruta -> (tamaño, mtime_ns) ya conocida
+        self._dirs = {}     # carpeta -> mtime_ns del último listado
+        self._subdirs = {}  # carpeta -> subcarpetas del último listado
+        self._pending = {}  # ruta -> [(tamaño, mtime_ns), desde cuándo no cambia]
+        self._thread = threading.Thread(target=self._run, name="folder-watch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def drain(self):
+        """Devuelve (rutas, validadas) con todo lo entregado desde la última llamada (sin bloquear)."""
+        paths = []
+        validated = set()
+        while True:
+            try:
+                batch, batch_validated = self.batches.get_nowait()
+            except queue.Empty:
+                return paths, validated
+            paths.extend(batch)
+            validated |= batch_validated
+
+    def _run(self):
+        inotify = None
+        try:
+            started_ns = time.time_ns()
+            if self.use_inotify:
+                try:
+                    inotify = Inotify()
+                    # Las vigilancias se registran antes del listado base para no perder nada
+                    for folder in self._iter_folders():
+                        inotify.watch(folder)
+                except OSError as e:
+                    print(f"Vigilancia sin inotify ({e}); se compara la carpeta periódicamente")
+                    if inotify is not None:
+                        inotify.close()
+                    inotify = None
+            self.backend = 'inotify' if inotify is not None else 'scandir'
+
+            # Listado base: lo que ya estaba no es nuevo, salvo si se escribió hace poco
+            recent_ns = started_ns - int(self.settle_seconds * 1e9)
+            for path, stamp in self._sweep(full=True).items():
+                if stamp[1] < recent_ns:
+                    self._files[path] = stamp
+                else:
+                    self._track(path, time.monotonic())
+            last_sweep = time.monotonic()
+
+            while not self.stop_event.is_set():
+                full = time.monotonic() - last_sweep >= FULL_SWEEP_SECONDS
+                if inotify is not None:
+                    for mask, path in inotify.read(self.poll_seconds):
+                        if mask & IN_Q_OVERFLOW:
+                            full = True
+                        elif mask & IN_ISDIR:
+                            if self.recursive:
+                                self._watch_tree(inotify, path)
+                                full = True  # pudo llenarse antes de vigilarla
+                        else:
+                            self._track(path, time.monotonic(), closed=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+                    if full:
+                        self._track_all(self._sweep(full=True))
+                else:
+                    if self.stop_event.wait(self.poll_seconds):
+                        break
+                    self._track_all(self._sweep(full=full))
+                if full:
+                    last_sweep = time.monotonic()
+                self._deliver(self._settle(time.monotonic()))
+        except Exception as e:
+            print(f"Error vigilando carpeta {self.folder}: {e}")
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _iter_folders(self):
+        yield self.folder
+        if self.recursive:
+            for current, subdirs, _files in os.walk(self.folder):
+                for name in subdirs:
+                    yield os.path.join(current, name)
+
+    def _watch_tree(self, inotify, folder):
+        try:
+            inotify.watch(folder)
+            for current, subdirs, _files in os.walk(folder):
+                for name in subdirs:
+                    inotify.watch(os.path.join(current, name))
+        except OSError as e:
+            print(f"Error vigilando carpeta {folder}: {e}")
+
+    def _sweep(self, full):
+        """
+        {ruta: (tamaño, mtime_ns)} de los archivos distintos de lo ya conocido.
+        Salvo en un barrido completo, no se listan las carpetas cuyo mtime no cambió.
+        """
+        changed = {}
+        stack = [self.folder]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+            except OSError:
+                continue
+            if not full and self._dirs.get(current) == mtime_ns:
+                stack.extend(self._subdirs.get(current, ()))
+                continue
+            subdirs = []
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_file():
+                                st = entry.stat()
+                                stamp = (st.st_size, st.st_mtime_ns)
+                                if self._files.get(entry.path) != stamp:
+                                    changed[entry.path] = stamp
+                            elif self.recursive and entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"Error leyendo carpeta {current}: {e}")
+                continue
+            self._dirs[current] = mtime_ns
+            self._subdirs[current] = subdirs
+            stack.extend(subdirs)
+        return changed
+
+    def _track(self, path, now, closed=False):
+        """Empieza a seguir un archivo hasta que termine de escribirse."""
+        entry = self._pending.get(path)
+        if entry is None:
+            entry = self._pending[path] = [_stamp(path), now]
+        if closed:
+            # El escritor lo cerró (o se movió ya completo): alcanza con que no cambie
+            # en la próxima comprobación
+            entry[0] = _stamp(path)
+            entry[1] = now - self.settle_seconds
+
+    def _track_all(self, changed):
+        now = time.monotonic()
+        for path in changed:
+            self._track(path, now)
+
+    def _settle(self, now):
+        """Rutas que dejaron de cambiar; las demás siguen pendientes."""
+        ready = []
+        for path, entry in list(self._pending.items()):
+            stamp = _stamp(path)
+            if stamp is None:
+                del self._pending[path]  # borrado o renombrado
+            elif stamp != entry[0]:
+                entry[0] = stamp
+                entry[1] = now
+            elif stamp[0] > 0 and now - entry[1] >= self.settle_seconds and _readable(path):
+                del self._pending[path]
+                if self._files.get(path) != stamp:
+                    self._files[path] = stamp
+                    ready.append(path)
+        return ready
+
+    def _deliver(self, paths):
+        images = [path for path in paths if is_image_file(path, self.sniff_dicom)]
+        if not images:
+            return
+        validated = set()
+        if self.resolver is not None:
+            try:
+                validated = self.resolver(images)
+            except Exception as e:
+                print(f"Error consultando imágenes validadas: {e}")
+        self.batches.put((images, validated))
+
+class IngestQueue:
+    """
+    Prepara en un hilo de fondo las imágenes que llegan: las decodifica (quedan
+    en `cache` y en la caché de miniaturas) y guarda sus sugerencias y su hash
+    en la BD por bloques, para que la GUI no tenga que calcular nada al mostrarlas.
+    """
+    def __init__(self, session_factory, predictor, cache=None, loader=None):
+        self.session_factory = session_factory
+        self.predictor = predictor
+        self.cache = cache
+        self.loader = loader
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ingest", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, paths):
+        for path in paths:
+            self._queue.put(path)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        import numpy as np
+        from precompute import prediction_row, save_results, thumbnail_hash_row
+
+        loader = self.loader
+        if loader is None:
+            from utils import decode_image_for_display as loader
+        rows = []
+        hash_rows = []
+        while not self._stop.is_set():
+            try:
+                path = self._queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                path = None
+            if path is not None:
+                try:
+                    st = os.stat(path)
+                    image = loader(path)
+                    if image is not None:
+                        if self.cache is not None:
+                            self.cache.put(path, image)
+                        thumbnail = np.asarray(image.convert('RGB'))
+                        rows.append(prediction_row(path, st, thumbnail, self.predictor))
+                        hashed = thumbnail_hash_row(path, thumbnail)
+                        if hashed is not None:
+                            hash_rows.append(hashed)
+                except Exception as e:
+                    print(f"Error preparando imagen {path}: {e}")
+            # Guardar al juntar un bloque o cuando no queda nada en espera
+            if rows and (len(rows) >= INGEST_CHUNK_SIZE or self._queue.empty()):
+                try:
+                    save_results(self.session_factory, rows, hash_rows)
+                except Exception as e:
+                    print(f"Error guardando sugerencias: {e}")
+                rows = []
+                hash_rows = []
@@ -0,0 +1,166 @@
+"""
+Visor con zoom y desplazamiento sobre una pirámide de imagen (ver pyramid.py).
+
+Sólo se dibujan las teselas visibles del nivel adecuado al zoom actual; las
+ya convertidas a PhotoImage se guardan en una caché LRU. Al arrastrar se
+mueven los elementos existentes del Canvas y sólo se crean las teselas que
+entran en pantalla.
+    - Rueda del mouse: zoom centrado en el cursor
+    - Arrastrar con el botón izquierdo: desplazar
+    - Doble clic: ajustar a la ventana
+"""
+import math
+import tkinter as tk
+from collections import OrderedDict
+from PIL import Image, ImageTk
+
+MAX_SCALE = 8.0
+ZOOM_STEP = 1.25
+TILE_CACHE_SIZE = 256
+# Con más aumento que esto los píxeles se muestran sin suavizar, para juzgar la nitidez
+NEAREST_FROM_SCALE = 2.0
+
+class ZoomViewer(tk.Canvas):
+    def __init__(self, master, **kwargs):
+        kwargs.setdefault('bg', 'black')
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(master, **kwargs)
+        self.pyramid = None
+        self.scale = 1.0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self._items = {}  # (nivel, tx, ty) -> id del elemento en el Canvas
+        self._photos = OrderedDict()  # (nivel, tx, ty, escala) -> PhotoImage
+        self._drag = None
+        self._render_pending = False
+
+        self.bind("<Configure>", lambda e: self._schedule_render())
+        self.bind("<ButtonPress-1>", self._on_press)
+        self.bind("<B1-Motion>", self._on_drag)
+        self.bind("<Double-Button-1>", lambda e: self.fit())
+        self.bind("<MouseWheel>", self._on_wheel)
+        self.bind("<Button-4>", self._on_wheel)
+        self.bind("<Button-5>", self._on_wheel)
+
+    def set_pyramid(self, pyramid):
+        """Muestra una pirámide nueva ajustada a la ventana."""
+        self.clear()
+        self.pyramid = pyramid
+        self.fit()
+
+    def show_message(self, text):
+        self.clear()
+        self.create_text(self.winfo_width() // 2, self.winfo_height() // 2, text=text, fill="white", tags="message")
+
+    def clear(self):
+        self.delete("all")
+        self._items.clear()
+        self._photos.clear()
+        if self.pyramid is not None:
+            self.pyramid.close()
+            self.pyramid = None
+
+    def fit(self):
+        if self.pyramid is None:
+            return
+        width, height = max(self.winfo_width(), 1), max(self.winfo_height(), 1)
+        self.scale = min(width / self.pyramid.width, height / self.pyramid.height)
+        self.offset_x = (width - self.pyramid.width * self.scale) / 2
+        self.offset_y = (height - self.pyramid.height * self.scale) / 2
+        self._reset_tiles()
+
+    def zoom(self, factor, x, y):
+        """Cambia el zoom manteniendo fijo el punto (x, y) de la pantalla."""
+        if self.pyramid is None:
+            return
+        fit_scale = min(max(self.winfo_width(), 1) / self.pyramid.width,
+                        max(self.winfo_height(), 1) / self.pyramid.height)
+        new_scale = min(max(self.scale * factor, min(fit_scale, 1.0)), MAX_SCALE)
+        if new_scale == self.scale:
+            return
+        ratio = new_scale / self.scale
+        self.offset_x = x - (x - self.offset_x) * ratio
+        self.offset_y = y - (y - self.offset_y) * ratio
+        self.scale = new_scale
+        self._reset_tiles()
+
+    def _reset_tiles(self):
+        self.delete("tile")
+        self._items.clear()
+        self._schedule_render()
+
+    def _schedule_render(self):
+        # Agrupar varios eventos (arrastre, rueda) en un solo redibujado
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        if self.pyramid is None:
+            return
+        level, level_scale = self.pyramid.level_for_scale(self.scale)
+        size = self.pyramid.tile_size
+        span = size * level_scale
+        cols, rows = self.pyramid.tile_counts(level)
+        width, height = self.winfo_width(), self.winfo_height()
+
+        first_x = max(0, int(math.floor(-self.offset_x / span)))
+        last_x = min(cols - 1, int(math.floor((width - self.offset_x) / span)))
+        first_y = max(0, int(math.floor(-self.offset_y / span)))
+        last_y = min(rows - 1, int(math.floor((height - self.offset_y) / span)))
+
+        wanted = set()
+        for ty in range(first_y, last_y + 1):
+            for tx in range(first_x, last_x + 1):
+                key = (level, tx, ty)
+                wanted.add(key)
+                if key in self._items:
+                    continue
+                # Bordes redondeados de forma consistente para que no queden huecos entre teselas
+                x0 = round(self.offset_x + tx * span)
+                y0 = round(self.offset_y + ty * span)
+                photo = self._tile_photo(level, tx, ty, level_scale, x0, y0)
+                self._items[key] = self.create_image(x0, y0, image=photo, anchor="nw", tags="tile")
+
+        for key in [k for k in self._items if k not in wanted]:
+            self.delete(self._items.pop(key))
+
+    def _tile_photo(self, level, tx, ty, level_scale, x0, y0):
+        cache_key = (level, tx, ty, round(level_scale, 6))
+        photo = self._photos.get(cache_key)
+        if photo is not None:
+            self._photos.move_to_end(cache_key)
+            return photo
+
+        tile = self.pyramid.tile(level, tx, ty)
+        size = self.pyramid.tile_size
+        x1 = round(self.offset_x + (tx * size + tile.shape[1]) * level_scale)
+        y1 = round(self.offset_y + (ty * size + tile.shape[0]) * level_scale)
+        image = Image.fromarray(tile)
+        target = (max(x1 - x0, 1), max(y1 - y0, 1))
+        if target != image.size:
+            resample = Image.NEAREST if self.scale >= NEAREST_FROM_SCALE else Image.BILINEAR
+            image = image.resize(target, resample)
+        photo = ImageTk.PhotoImage(image)
+        self._photos[cache_key] = photo
+        while len(self._photos) > TILE_CACHE_SIZE:
+            self._photos.popitem(last=False)
+        return photo
+
+    def _on_press(self, event):
+        self._drag = (event.x, event.y)
+
+    def _on_drag(self, event):
+        if self._drag is None or self.pyramid is None:
+            return
+        dx, dy = event.x - self._drag[0], event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        self.offset_x += dx
+        self.offset_y += dy
+        self.move("tile", dx, dy)
+        self._schedule_render()
+
+    def _on_wheel(self, event):
+        zoom_in = getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0
+        self.zoom(ZOOM_STEP if zoom_in else 1 / ZOOM_STEP, event.x, event.y)